@@ -1,20 +1,50 @@
 # app.py
+from utils.executor_pools import (  # BLAS/OpenMP 스레드 수 설정을 위해 가장 먼저 import
+    start_pool_reporter, describe_partition
+)
 import gradio as gr
 import asyncio
 import os
 import json
+import time
 from datetime import datetime
 import uuid
 from utils.session_config import SessionConfigManager, ChatMessage
-from utils.logging_config import setup_logging
+from utils.logging_config import setup_logging, session_id_var, timed_node
 from utils.graph_state import (
     GraphState, classify_intent, decide_path, generate_from_history,
     retrieve, grade_documents, generate, transform_query,
-    decide_to_generate, grade_generation_v_documents_and_question
+    decide_to_generate, grade_generation_v_documents_and_question,
+    rerank_documents, speculative_grade_and_generate, decide_after_speculation,
+    decide_after_retrieve, SPECULATIVE_GENERATION
+)
+from utils.llm_model_inference import llm_parallelism
+from utils.document_rerankers import reranker
+from utils.vector_db_retrievers import (
+    start_snapshot_watcher, acurrent_corpus_version, aretrieve, aembed_documents, achunk_vectors
 )
+from utils.faq_warmup import PrecomputedAnswers, load_faq_entries, EXAMPLE_QUESTIONS, FAQ_WARM_UP
+from utils.inference_client import INFERENCE_SERVER_URL
 from langgraph.graph import StateGraph, END, START
 from langgraph.errors import GraphRecursionError
 
+# 답변 평가(grade_generation_v_documents_and_question)를 통과해야만 그래프가 끝나는 노드
+# (generate_from_history는 평가 없이 끝나므로 제외, grade_documents는 추측 생성 모드에서만 답변으로 끝남)
+GRADED_ANSWER_NODES = ("generate", "grade_documents")
+
+RECURSION_FALLBACK_MESSAGE = "정확한 정보가 부족해, 답변을 생성하지 못했습니다. 카드 상품명을 포함해 재질의 해주시기 바랍니다."
+
+def generation_from_chunk(chunk):
+    """Return the answer carried by a workflow stream chunk, or None"""
+    if 'generate_from_history' in chunk:
+        return chunk['generate_from_history'].get('generation', '')
+    if 'generate' in chunk:
+        return chunk['generate'].get('generation', '')
+    if (chunk.get('grade_documents') or {}).get('generation'):
+        # 추측 생성 모드에서는 문서 평가 노드가 답변까지 생성
+        return chunk['grade_documents']['generation']
+    return None
+
 class ChatbotApp:
     _workflow_semaphore = asyncio.Semaphore(20)
 
@@ -23,18 +53,29 @@ class ChatbotApp:
         self.session_manager = SessionConfigManager()
         self.logger = setup_logging()
         self.workflow = self._initialize_workflow()
+        self.faq_answers = PrecomputedAnswers()
+        self.warmup_status = {"state": "pending", "done": 0, "total": 0}
 
     def _initialize_workflow(self):
         """Initialize workflow graph"""
         workflow = StateGraph(GraphState)
 
         # Define nodes
-        workflow.add_node("classify_intent", classify_intent)
-        workflow.add_node("retrieve", retrieve)
-        workflow.add_node("grade_documents", grade_documents)
-        workflow.add_node("generate", generate)
-        workflow.add_node("generate_from_history", generate_from_history)
-        workflow.add_node("transform_query", transform_query)
+        workflow.add_node("classify_intent", timed_node("classify_intent", classify_intent))
+        workflow.add_node("retrieve", timed_node("retrieve", retrieve))
+        # 재순위화 모델이 로드된 경우 LLM 문서별 평가 대신 배치 재순위화 사용,
+        # 추측 생성은 LLM 평가와 답변 생성을 동시에 실행할 수 있는 백엔드에서만 사용
+        speculative = SPECULATIVE_GENERATION and reranker is None and llm_parallelism() > 1
+        if reranker is not None:
+            grade_node = rerank_documents
+        elif speculative:
+            grade_node = speculative_grade_and_generate
+        else:
+            grade_node = grade_documents
+        workflow.add_node("grade_documents", timed_node("grade_documents", grade_node))
+        workflow.add_node("generate", timed_node("generate", generate))
+        workflow.add_node("generate_from_history", timed_node("generate_from_history", generate_from_history))
+        workflow.add_node("transform_query", timed_node("transform_query", transform_query))
 
         # Build graph
         workflow.add_edge(START, "classify_intent")
@@ -50,15 +91,35 @@ class ChatbotApp:
             },
         )
 
-        workflow.add_edge("retrieve", "grade_documents")
+        # 세션 캐시에서 재사용한 문서는 이전 턴에서 이미 평가를 통과했으므로 바로 답변 생성
         workflow.add_conditional_edges(
-            "grade_documents",
-            decide_to_generate,
+            "retrieve",
+            decide_after_retrieve,
             {
-                "transform_query": "transform_query",
+                "grade_documents": "grade_documents",
                 "generate": "generate",
             },
         )
+        if speculative:
+            workflow.add_conditional_edges(
+                "grade_documents",
+                decide_after_speculation,
+                {
+                    "transform_query": "transform_query",
+                    "not supported": "generate",
+                    "useful": END,
+                    "not useful": "transform_query",
+                },
+            )
+        else:
+            workflow.add_conditional_edges(
+                "grade_documents",
+                decide_to_generate,
+                {
+                    "transform_query": "transform_query",
+                    "generate": "generate",
+                },
+            )
         workflow.add_edge("transform_query", "retrieve")
         workflow.add_edge("generate_from_history", END)
 
@@ -97,33 +158,77 @@ class ChatbotApp:
         except Exception as e:
             self.logger.error(f"Error saving chat history: {str(e)}")
 
+    async def _run_graph(self, message, session_id):
+        """Run the workflow for one message and return the final generation"""
+        final_response = None
+        answer_documents = None
+        path = []
+        intent = None
+        graph_config = self.session_manager.get_graph_config(session_id)
+        try:
+            async for chunk in self.workflow.astream(
+                    {"question": message},
+                    graph_config
+            ):
+                path.extend(chunk.keys())
+                classified = chunk.get('classify_intent')
+                if isinstance(classified, dict) and classified.get('intent'):
+                    intent = classified['intent']
+                generation = generation_from_chunk(chunk)
+                if generation is not None:
+                    final_response = generation
+                    # 최종 답변 생성에 사용된 (평가를 통과한) 문서, 이력만으로 답한 경우 None
+                    answer_documents = next(
+                        (update.get('documents') for update in chunk.values()
+                         if isinstance(update, dict) and update.get('documents')), None
+                    )
+
+                if chunk.get('end'):
+                    break
+
+        except GraphRecursionError:
+            final_response = RECURSION_FALLBACK_MESSAGE
+            answer_documents = None
+            path.append("recursion_limit")
+
+        cache = graph_config["configurable"].get("retrieval_cache")
+        if cache is not None and answer_documents:
+            # 후속 질문에서 재사용하도록 답변 문서를 응답 이후 백그라운드에서 저장
+            cache.pending = asyncio.create_task(self._remember_documents(cache, answer_documents))
+
+        session_config = self.session_manager.get_or_create_config(session_id)
+        session_config.last_path, session_config.last_intent = path, intent
+        return final_response
+
+    async def _remember_documents(self, cache, documents):
+        """Store the documents an answer used, with their index embeddings, in the session's retrieval cache"""
+        try:
+            await cache.remember(documents, await acurrent_corpus_version(), achunk_vectors, aembed_documents)
+        except Exception as e:
+            self.logger.warning(f"Failed to cache retrieved documents: {str(e)}")
+
     async def process_message(self, message, history, session_id):
         """Process user message and generate response"""
+        session_id_var.set(session_id)
+        started = time.perf_counter()
+        received_at = datetime.now().isoformat(timespec='milliseconds')
         try:
             self.session_manager.append_message(
                 session_id,
                 ChatMessage(role="user", content=message)
             )
 
-            final_response = None
-            async with self._workflow_semaphore:
-                self.logger.info(f"Session {session_id} acquired semaphore")
-                try:
-                    graph_config = self.session_manager.get_graph_config(session_id)
-                    async for chunk in self.workflow.astream(
-                            {"question": message},
-                            graph_config
-                    ):
-                        if 'generate_from_history' in chunk:
-                            final_response = chunk['generate_from_history'].get('generation', '')
-                        elif 'generate' in chunk:
-                            final_response = chunk['generate'].get('generation', '')
-
-                        if chunk.get('end'):
-                            break
-
-                except GraphRecursionError:
-                    final_response = "정확한 정보가 부족해, 답변을 생성하지 못했습니다. 카드 상품명을 포함해 재질의 해주시기 바랍니다."
+            # FAQ 사전 계산 답변이 있으면 워크플로우 없이 바로 응답
+            self.faq_answers.use_version(await acurrent_corpus_version())
+            final_response = self.faq_answers.get(message)
+            if final_response:
+                self.logger.info(f"Session {session_id} served from precomputed answers")
+                session_config = self.session_manager.get_or_create_config(session_id)
+                session_config.last_path, session_config.last_intent = ["faq"], None
+            else:
+                async with self._workflow_semaphore:
+                    self.logger.debug(f"Session {session_id} acquired semaphore")
+                    final_response = await self._run_graph(message, session_id)
 
             if final_response:
                 self.session_manager.append_message(
@@ -137,8 +242,17 @@ class ChatbotApp:
                     for msg in messages
                 ]
 
+                # 트래픽 재현(traffic_replay.py)을 위해 질문/응답 시각을 함께 저장
+                turn = messages_list[-2:]
+                turn[0]["timestamp"] = received_at
+                turn[1]["timestamp"] = datetime.now().isoformat(timespec='milliseconds')
+
                 is_append = len(messages_list) > 2
-                await self.save_chat_history(session_id, messages_list[-2:], is_append)
+                await self.save_chat_history(session_id, turn, is_append)
+
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+                self.logger.info(f"Session {session_id} answered in {elapsed_ms}ms",
+                                 extra={"event": "response", "elapsed_ms": elapsed_ms})
 
                 return final_response
 
@@ -146,10 +260,65 @@ class ChatbotApp:
             self.logger.error(f"Error in process_message: {str(e)}")
             return "처리 중 오류가 발생했습니다. 다시 시도해 주세요."
 
-def create_chatbot():
+    async def warm_up(self):
+        """
+        Prime the model, embedder and indices by running the FAQ set through the workflow,
+        and store the answers that pass the graders in the precomputed table.
+        Vetted answers are seeded by the table itself on every corpus version.
+        """
+        entries = load_faq_entries()
+        self.faq_answers.use_version(await acurrent_corpus_version())
+        self.warmup_status.update(state="running", done=0, total=len(entries))
+        self.logger.info(f"Warm-up started: {len(entries)} FAQ questions, corpus {self.faq_answers.version}")
+
+        # 첫 임베딩 forward pass와 인덱스 페이지 폴트를 미리 처리
+        await aretrieve(entries[0]["question"] if entries else "트래블로그")
+
+        for i, entry in enumerate(entries, start=1):
+            question = entry["question"]
+            try:
+                if not entry["answer"] and question not in self.faq_answers:
+                    session_id = f"warmup-{uuid.uuid4()}"
+                    session_id_var.set(session_id)
+                    answer = await self._run_graph(question, session_id)
+                    path = self.session_manager.sessions.pop(session_id).last_path
+                    # 답변 평가를 통과해 종료된 답변만 저장 (이력 기반 답변, 재귀 제한 안내는 제외)
+                    if answer and path and path[-1] in GRADED_ANSWER_NODES:
+                        self.faq_answers.put(question, answer, source="workflow")
+            except Exception as e:
+                self.logger.error(f"Warm-up failed for '{question}': {str(e)}")
+
+            self.warmup_status["done"] = i
+            self.logger.info(f"Warm-up {i}/{len(entries)}: {question}")
+
+        self.warmup_status["state"] = "done"
+        self.logger.info(f"Warm-up finished: {len(self.faq_answers.answers)} precomputed answers")
+
+    def run_warm_up(self):
+        """
+        Run warm-up to completion before the UI starts serving, so that warm-up workflows
+        never share the LLM with live traffic from a second event loop
+        """
+        asyncio.run(self.warm_up())
+
+def create_chatbot(warm_up=FAQ_WARM_UP):
     """Create and configure the Gradio interface"""
     app = ChatbotApp()
 
+    # FAQ 예열 및 사전 계산 답변 생성 (끝난 뒤 서비스 시작, 진행 상황은 로그와 app.warmup_status로 확인)
+    # 멀티 프로세스 서빙에서는 한 워커만 예열하고 나머지는 저장된 테이블을 읽기만 함
+    if warm_up:
+        app.run_warm_up()
+
+    # 풀별 사용률/대기 통계를 주기적으로 로그에 기록
+    for line in describe_partition():
+        app.logger.info(f"Pool partition - {line}")
+    start_pool_reporter(app.logger)
+
+    # 새 인덱스 스냅샷이 게시되면 재시작 없이 교체 (프론트엔드 모드에서는 추론 서버가 담당)
+    if not INFERENCE_SERVER_URL:
+        start_snapshot_watcher()
+
     # Store session IDs
     sessions = {}
 
@@ -189,11 +358,7 @@ def create_chatbot():
         📌 트래블로그 상품명을 입력해주셔야 답변의 성능이 올라갑니다. (예: 트래블로그 PRESTIGE 신용카드의 연회비에 대해 알려줘)
         """,
         theme="soft",
-        examples=[
-            "트래블로그 PRESTIGE 신용카드의 연회비가 얼마인가요?",
-            "미성년자도 트래블로그 발급 받을 수 있어?",
-            "해외에서 ATM 이용 시 인출한도는 얼마인가요?"
-        ],
+        examples=EXAMPLE_QUESTIONS,
         concurrency_limit=20
 
     )
@@ -204,8 +369,8 @@ if __name__ == "__main__":
     chat_interface = create_chatbot()
     chat_interface.launch(
         server_name="0.0.0.0",
-        server_port=7860,
-        share=True, #로컬에서는 False로 변경
-        debug=True,
+        server_port=int(os.getenv("GRADIO_SERVER_PORT", "7860")),
+        share=os.getenv("GRADIO_SHARE", "1") == "1", #로컬에서는 False로 변경
+        debug=os.getenv("GRADIO_DEBUG", "1") == "1",
 
     )
\ No newline at end of file
@@ -0,0 +1,259 @@
+# batch_qa.py
+"""
+오프라인 평가용 배치 질의응답
+
+질문 파일(JSONL 또는 CSV)을 Gradio UI 없이 컴파일된 워크플로우로 직접 실행합니다.
+질문은 독립된 세션에서 최대 --concurrency개까지 동시에 처리하며, 답변과 노드별 실행 경로/소요 시간을
+출력 JSONL에 한 줄씩 기록합니다. 출력 파일이 체크포인트 역할을 하므로 중단 후 다시 실행하면
+이미 답변한 질문은 건너뜁니다.
+
+입력 파일:
+    JSONL  {"id": "q-001", "question": "트래블로그 PRESTIGE 신용카드의 연회비가 얼마인가요?"}
+    CSV    id,question 열 (id는 생략 가능, 생략하면 줄 번호)
+
+출력 파일 (JSONL):
+    {"id": ..., "question": ..., "answer": ..., "path": [...], "trace": [{"node": ..., "elapsed_ms": ...}],
+     "elapsed_ms": ..., "corpus_version": ..., "error": null}
+
+실행 예시:
+    python batch_qa.py data/eval/questions.jsonl results/answers.jsonl --concurrency 8
+"""
+from utils.executor_pools import pool_report  # BLAS/OpenMP 스레드 수 설정을 위해 가장 먼저 import
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import time
+import uuid
+from typing import Dict, List, Set
+
+from app import ChatbotApp, RECURSION_FALLBACK_MESSAGE, generation_from_chunk
+from utils.faq_warmup import normalize_question
+from utils.llm_model_inference import LLM_MAX_CONCURRENCY
+from utils.logging_config import session_id_var
+from utils.vector_db_retrievers import acurrent_corpus_version
+from langgraph.errors import GraphRecursionError
+
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    """
+    JSONL 또는 CSV 질문 파일을 읽습니다.
+
+    Args:
+        path (str): 질문 파일 경로
+
+    Returns:
+        List[Dict[str, str]]: id, question 키를 가진 항목 목록
+    """
+    items = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            question = (row.get("question") or "").strip()
+            if question:
+                items.append({"id": str(row.get("id") or number), "question": question})
+    return items
+
+
+def load_completed(path: str) -> Set[str]:
+    """출력 파일에서 이미 답변한 질문 id를 읽습니다 (오류로 끝난 항목은 다시 실행)."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 중단 시점에 쓰다 만 마지막 줄
+                continue
+            if not record.get("error"):
+                completed.add(record["id"])
+    return completed
+
+
+def percentile(values: List[float], q: float) -> float:
+    """정렬된 값의 q 분위수 (0~1)를 반환합니다."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BatchRunner:
+    """
+    컴파일된 워크플로우로 질문을 동시 실행하고 결과를 출력 파일에 기록합니다.
+
+    Attributes:
+        app (ChatbotApp): 워크플로우와 세션 관리자를 가진 앱 (대화 기록은 저장하지 않음)
+        concurrency (int): 동시에 실행할 최대 질문 수
+        use_faq (bool): FAQ 사전 계산 답변을 사용할지 여부
+    """
+    def __init__(self, concurrency: int, use_faq: bool = False):
+        self.app = ChatbotApp()
+        self.concurrency = concurrency
+        self.use_faq = use_faq
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # 같은 배치 안에서 같은 질문은 한 번만 실행 (정규화 키 → 실행 중/완료된 태스크)
+        self.answer_cache: Dict[str, asyncio.Task] = {}
+        self.records: List[Dict] = []
+        self.write_lock = asyncio.Lock()
+
+    async def run_workflow(self, question: str) -> Dict:
+        """새 세션에서 워크플로우를 실행하고 답변, 경로, 노드별 소요 시간을 반환합니다."""
+        session_id = f"batch-{uuid.uuid4()}"
+        session_id_var.set(session_id)
+
+        answer, trace = None, []
+        started = time.perf_counter()
+        last = started
+        try:
+            async for chunk in self.app.workflow.astream(
+                    {"question": question},
+                    self.app.session_manager.get_graph_config(session_id)
+            ):
+                now = time.perf_counter()
+                for node in chunk:
+                    trace.append({"node": node, "elapsed_ms": round((now - last) * 1000, 1)})
+                last = now
+                generation = generation_from_chunk(chunk)
+                if generation is not None:
+                    answer = generation
+        except GraphRecursionError:
+            answer = RECURSION_FALLBACK_MESSAGE
+            trace.append({"node": "recursion_limit", "elapsed_ms": 0.0})
+        finally:
+            self.app.session_manager.sessions.pop(session_id, None)
+
+        return {
+            "answer": answer,
+            "path": [step["node"] for step in trace],
+            "trace": trace,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    async def answer(self, question: str) -> Dict:
+        if self.use_faq:
+            self.app.faq_answers.use_version(await acurrent_corpus_version())
+            cached = self.app.faq_answers.get(question)
+            if cached:
+                return {"answer": cached, "path": ["faq"], "trace": [], "elapsed_ms": 0.0}
+
+        key = normalize_question(question)
+        task = self.answer_cache.get(key)
+        if task is None:
+            async def run():
+                async with self.semaphore:
+                    return await self.run_workflow(question)
+            task = asyncio.ensure_future(run())
+            self.answer_cache[key] = task
+            return await task
+
+        result = dict(await task)
+        result["path"] = ["batch_cache"]
+        result["trace"], result["elapsed_ms"] = [], 0.0
+        return result
+
+    async def process(self, item: Dict[str, str], output):
+        record = {"id": item["id"], "question": item["question"],
+                  "corpus_version": await acurrent_corpus_version()}
+        try:
+            record.update(await self.answer(item["question"]))
+            record["error"] = None
+        except Exception as e:
+            record.update(answer=None, path=[], trace=[], elapsed_ms=None, error=str(e))
+
+        # 한 줄씩 기록하고 flush해 중단되어도 완료된 질문은 보존
+        async with self.write_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            self.records.append(record)
+            done = len(self.records)
+            if done % 10 == 0:
+                print(f"---{done} QUESTIONS ANSWERED---")
+
+    async def run(self, items: List[Dict[str, str]], output_path: str) -> float:
+        """모든 질문을 실행하고 소요 시간(초)을 반환합니다."""
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        started = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as output:
+            await asyncio.gather(*[self.process(item, output) for item in items])
+        return time.perf_counter() - started
+
+
+def print_summary(records: List[Dict], duration: float, skipped: int):
+    """처리량, 지연시간 분포, 경로 분포, 노드별 평균 소요 시간을 출력합니다."""
+    answered = [r for r in records if not r["error"]]
+    latencies = [r["elapsed_ms"] for r in answered if r["path"] and r["path"][0] not in ("faq", "batch_cache")]
+
+    print()
+    print(f"---{len(records)} QUESTIONS IN {duration:.1f}s "
+          f"({len(records) / duration if duration > 0 else 0.0:.2f} questions/s), "
+          f"{len(records) - len(answered)} ERRORS, {skipped} SKIPPED FROM CHECKPOINT---")
+    print(f"workflow latency p50 {percentile(latencies, 0.5):.1f}ms  "
+          f"p95 {percentile(latencies, 0.95):.1f}ms  max {max(latencies, default=0.0):.1f}ms")
+
+    outcomes = {}
+    for r in answered:
+        if not r["path"]:
+            outcome = "no answer"
+        elif r["path"][0] in ("faq", "batch_cache"):
+            outcome = r["path"][0]
+        elif r["answer"] == RECURSION_FALLBACK_MESSAGE:
+            outcome = "fallback"
+        else:
+            outcome = "workflow"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print("outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+
+    node_times: Dict[str, List[float]] = {}
+    for r in answered:
+        for step in r["trace"]:
+            node_times.setdefault(step["node"], []).append(step["elapsed_ms"])
+    for node, times in sorted(node_times.items(), key=lambda item: -sum(item[1])):
+        print(f"{node:<22} {len(times):>6} runs  avg {statistics.mean(times):>9.1f}ms  "
+              f"total {sum(times) / 1000:>8.1f}s")
+
+    for name, stats in pool_report().items():
+        print(f"pool {name:<10} utilization {stats['utilization']:.0%}, "
+              f"avg wait {stats['avg_wait_ms']}ms, max wait {stats['max_wait_ms']}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless batch question answering")
+    parser.add_argument("questions", help="JSONL or CSV file with a question column")
+    parser.add_argument("output", help="JSONL file for answers and traces (also the checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=max(4, 2 * LLM_MAX_CONCURRENCY),
+                        help="Questions in flight at once")
+    parser.add_argument("--restart", action="store_true", help="Ignore and overwrite an existing output file")
+    parser.add_argument("--use-faq", action="store_true", help="Serve questions found in the precomputed FAQ table")
+    parser.add_argument("--limit", type=int, default=None, help="Only run the first N pending questions")
+    return parser.parse_args()
+
+
+async def main(args):
+    items = load_questions(args.questions)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+
+    completed = load_completed(args.output)
+    pending = [item for item in items if item["id"] not in completed]
+    skipped = len(items) - len(pending)
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"---{len(items)} QUESTIONS, {skipped} ALREADY ANSWERED, RUNNING {len(pending)}---")
+
+    runner = BatchRunner(args.concurrency, use_faq=args.use_faq)
+    duration = await runner.run(pending, args.output)
+    print_summary(runner.records, duration, skipped)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
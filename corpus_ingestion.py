@@ -0,0 +1,407 @@
+# corpus_ingestion.py
+"""
+약관 코퍼스 증분 수집 및 인덱스 스냅샷 생성
+
+신규/변경된 약관 문서만 청크로 나누고, 기존 스냅샷에 없는 청크만 배치로 임베딩하여
+새 버전의 스냅샷(pickle 미사용)을 만든 뒤 CURRENT 포인터를 원자적으로 교체합니다.
+임베딩만 증분이며, FAISS 인덱스와 BM25 가중치는 새 스냅샷의 전체 임베딩/토큰에서 다시 만듭니다
+(양자화 인덱스의 재학습과 삭제된 청크 제거를 한 번에 처리).
+실행 중인 서버는 vector_db_retrievers의 스냅샷 감시 스레드가 새 버전으로 핫스왑합니다.
+
+입력 파일 (JSONL, 약관 문서 단위):
+    {"source_id": "travlog-prestige-credit", "text": "...", "metadata": {"카드구분": "신용카드", "상품명": "트래블로그 PRESTIGE"}}
+
+스냅샷 구조 (data/index_snapshots/<version>/):
+    manifest.json    버전, 부모 버전, 문서별 해시, 청크 수
+    docstore.jsonl   인덱스 순서의 청크 (id, page_content, metadata, BM25 tokens)
+    embeddings.npy   인덱스 순서의 float32 임베딩 (다음 증분 수집 시 재사용)
+    index.faiss      faiss.write_index로 저장한 FAISS 인덱스 (flat / ivf_sq8 / ivf_pq)
+    docstore.offsets.npy  docstore.jsonl 줄 위치 (워커 간 공유되는 mmap docstore용)
+    bm25/            미리 계산한 BM25 가중치 (CSC 희소 행렬, mmap)
+    product_groups.json, product_centroids.npy, parent_links.npy
+                     상품별 그룹과 중심 임베딩, 문서 내 이전/다음 청크 (계층 검색용)
+
+실행 예시:
+    python corpus_ingestion.py --bootstrap-legacy
+    python corpus_ingestion.py data/terms/2024_10.jsonl
+    python corpus_ingestion.py --reindex --index-type ivf_sq8
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from utils.mmap_index import (
+    INDEX_TYPES, build_faiss_index, check_recall, write_docstore_offsets, write_bm25_index
+)
+from utils.product_groups import write_product_groups
+
+from utils.vector_db_retrievers import (
+    hf_embeddings, snapshot_root, current_pointer_path, read_current_version,
+    load_legacy, LEGACY_VERSION
+)
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMBED_BATCH_SIZE = 32
+MIN_INDEX_RECALL = 0.95
+
+
+def content_hash(*parts) -> str:
+    """문자열/딕셔너리의 sha256 해시를 반환합니다."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, ensure_ascii=False, sort_keys=True)
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25Retriever의 기본 전처리와 동일한 공백 토큰화"""
+    return text.split()
+
+
+def load_source_documents(path: str) -> List[Dict]:
+    """
+    수집할 약관 문서를 읽습니다.
+
+    Args:
+        path (str): JSONL 파일 경로
+
+    Returns:
+        List[Dict]: source_id, text, metadata 키를 가진 문서 목록
+    """
+    documents = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                item.setdefault('metadata', {})
+                documents.append(item)
+    return documents
+
+
+def chunk_document(document: Dict, splitter) -> List[Dict]:
+    """
+    약관 문서를 청크로 나누고 내용 기반 id를 부여합니다.
+    같은 내용의 청크는 같은 id를 가지므로 변경된 문서에서도 바뀐 청크만 재임베딩됩니다.
+
+    Args:
+        document (Dict): 약관 문서
+        splitter: 텍스트 분할기
+
+    Returns:
+        List[Dict]: 청크 레코드 목록
+    """
+    records = []
+    seen = {}
+    for position, text in enumerate(splitter.split_text(document['text'])):
+        chunk_id = f"{document['source_id']}:{content_hash(text, document['metadata'])[:16]}"
+        # 같은 문서 안에서 동일한 청크가 반복되면 등장 순번으로 구분
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+        metadata = dict(document['metadata'], id=chunk_id, source_id=document['source_id'], chunk_position=position)
+        records.append({
+            'id': chunk_id,
+            'page_content': text,
+            'metadata': metadata,
+            'tokens': tokenize(text)
+        })
+    return records
+
+
+class Snapshot:
+    """
+    디스크의 인덱스 스냅샷 한 버전
+
+    Attributes:
+        version (str): 스냅샷 버전
+        manifest (dict): 매니페스트
+        records (List[dict]): 인덱스 순서의 청크 레코드
+        embeddings (np.ndarray): 인덱스 순서의 임베딩 (memory-mapped)
+    """
+    def __init__(self, version: str):
+        self.version = version
+        self.path = os.path.join(snapshot_root, version)
+
+        with open(os.path.join(self.path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(self.path, 'docstore.jsonl'), 'r', encoding='utf-8') as f:
+            self.records = [json.loads(line) for line in f]
+        self.embeddings = np.load(os.path.join(self.path, 'embeddings.npy'), mmap_mode='r')
+
+
+def new_version_name() -> str:
+    """시간 기반 스냅샷 버전 이름 (같은 초에 만든 스냅샷끼리 겹치지 않도록 임의 접미사 추가)"""
+    return f"{datetime.now().strftime('v%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def write_snapshot(records: List[Dict], embeddings: np.ndarray, sources: Dict[str, str],
+                   parent: Optional[str], version: Optional[str] = None, index_type: str = 'flat') -> str:
+    """
+    새 스냅샷을 임시 디렉토리에 모두 쓴 뒤 이름을 바꿔 확정합니다.
+
+    Args:
+        records (List[Dict]): 인덱스 순서의 청크 레코드
+        embeddings (np.ndarray): 인덱스 순서의 임베딩
+        sources (Dict[str, str]): source_id별 문서 해시
+        parent (Optional[str]): 부모 스냅샷 버전
+        version (Optional[str]): 스냅샷 버전. None이면 시간 기반 이름
+        index_type (str): FAISS 인덱스 종류 ('flat', 'ivf_sq8', 'ivf_pq')
+
+    Returns:
+        str: 생성된 스냅샷 버전
+    """
+    version = version or new_version_name()
+    final_dir = os.path.join(snapshot_root, version)
+    tmp_dir = final_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    np.save(os.path.join(tmp_dir, 'embeddings.npy'), embeddings)
+
+    # 양자화 인덱스는 정확 검색 대비 recall을 확인하고, 기준 미달이면 평면 인덱스 사용
+    index = build_faiss_index(embeddings, index_type)
+    recall = 1.0
+    if index_type != 'flat':
+        recall = check_recall(index, embeddings)
+        print(f"---{index_type.upper()} RECALL@10: {recall:.3f}---")
+        if recall < MIN_INDEX_RECALL:
+            print(f"---RECALL BELOW {MIN_INDEX_RECALL}, FALLING BACK TO FLAT INDEX---")
+            index_type, recall = 'flat', 1.0
+            index = build_faiss_index(embeddings, index_type)
+    faiss.write_index(index, os.path.join(tmp_dir, 'index.faiss'))
+
+    docstore_path = os.path.join(tmp_dir, 'docstore.jsonl')
+    with open(docstore_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    write_docstore_offsets(docstore_path, os.path.join(tmp_dir, 'docstore.offsets.npy'))
+    write_bm25_index([record['tokens'] for record in records], os.path.join(tmp_dir, 'bm25'))
+    write_product_groups(tmp_dir, [record['metadata'] for record in records], embeddings)
+
+    manifest = {
+        'version': version,
+        'parent': parent,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'num_chunks': len(records),
+        'dimension': int(embeddings.shape[1]),
+        'index_type': index_type,
+        'index_recall': recall,
+        'sources': sources
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    os.replace(tmp_dir, final_dir)
+    return version
+
+
+def publish(version: str):
+    """
+    CURRENT 포인터를 원자적으로 교체해 실행 중인 서버가 새 버전을 로드하게 합니다.
+
+    Args:
+        version (str): 활성화할 스냅샷 버전
+    """
+    tmp_path = current_pointer_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_pointer_path)
+    print(f"---PUBLISHED SNAPSHOT {version}---")
+
+
+def embed_in_batches(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    텍스트를 배치 단위로 임베딩합니다.
+
+    Args:
+        texts (List[str]): 임베딩할 텍스트
+        batch_size (int): 배치 크기
+
+    Returns:
+        np.ndarray: (len(texts), dim) float32 임베딩
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        vectors.extend(hf_embeddings.embed_documents(batch))
+        print(f"---EMBEDDED {min(start + batch_size, len(texts))}/{len(texts)} CHUNKS---")
+    return np.asarray(vectors, dtype='float32')
+
+
+def legacy_source_id(metadata: Dict) -> str:
+    """
+    기존 인덱스 청크의 source_id. 기존 청크에는 문서 id가 없으므로 상품명으로 묶으며,
+    이후 같은 상품명의 문서가 수집되면 ingest()가 이 source를 대체합니다.
+    """
+    return f"{LEGACY_VERSION}:{metadata.get('상품명', '')}"
+
+
+def bootstrap_legacy(index_type: str = 'flat') -> str:
+    """
+    기존 new_docs.pkl / faiss_index를 최초 스냅샷으로 변환합니다 (재임베딩 없음).
+
+    Args:
+        index_type (str): FAISS 인덱스 종류
+
+    Returns:
+        str: 생성된 스냅샷 버전
+    """
+    legacy = load_legacy()
+    store = legacy.vectorstore
+
+    records = []
+    for position in range(store.index.ntotal):
+        doc = store.docstore.search(store.index_to_docstore_id[position])
+        metadata = dict(doc.metadata)
+        metadata.setdefault('id', store.index_to_docstore_id[position])
+        metadata.setdefault('source_id', legacy_source_id(metadata))
+        records.append({
+            'id': metadata['id'],
+            'page_content': doc.page_content,
+            'metadata': metadata,
+            'tokens': tokenize(doc.page_content)
+        })
+
+    embeddings = store.index.reconstruct_n(0, store.index.ntotal)
+    sources = {}
+    for record in records:
+        source_id = record['metadata']['source_id']
+        sources[source_id] = content_hash(sources.get(source_id, ''), record['page_content'])
+
+    return write_snapshot(records, embeddings, sources, parent=LEGACY_VERSION, index_type=index_type)
+
+
+def reindex(index_type: str) -> str:
+    """
+    현재 스냅샷의 임베딩으로 인덱스 종류만 바꾼 새 스냅샷을 만듭니다 (재임베딩 없음).
+
+    Args:
+        index_type (str): FAISS 인덱스 종류
+
+    Returns:
+        str: 생성된 스냅샷 버전
+    """
+    parent_version = read_current_version()
+    if parent_version is None:
+        raise RuntimeError("No snapshot found. Run with --bootstrap-legacy first.")
+    parent = Snapshot(parent_version)
+    return write_snapshot(parent.records, parent.embeddings, parent.manifest['sources'],
+                          parent=parent_version, index_type=index_type)
+
+
+def ingest(documents: List[Dict], remove_missing: bool = False, index_type: Optional[str] = None) -> Optional[str]:
+    """
+    신규/변경 문서를 현재 스냅샷에 증분 반영한 새 스냅샷을 만듭니다.
+
+    Args:
+        documents (List[Dict]): 수집할 약관 문서
+        remove_missing (bool): 입력에 없는 기존 문서를 삭제할지 여부
+        index_type (Optional[str]): FAISS 인덱스 종류. None이면 부모 스냅샷과 동일
+
+    Returns:
+        Optional[str]: 새 스냅샷 버전. 변경 사항이 없으면 None
+    """
+    parent_version = read_current_version()
+    if parent_version is None:
+        raise RuntimeError("No snapshot found. Run with --bootstrap-legacy first.")
+    parent = Snapshot(parent_version)
+
+    sources = dict(parent.manifest['sources'])
+    incoming = {doc['source_id']: doc for doc in documents}
+    changed = {
+        source_id: doc for source_id, doc in incoming.items()
+        if sources.get(source_id) != content_hash(doc['text'], doc['metadata'])
+    }
+    removed = set(sources) - set(incoming) if remove_missing else set()
+    # 같은 상품명의 기존 인덱스 청크는 새 문서로 대체 (source_id 체계가 달라 id로는 매칭되지 않음)
+    removed |= {
+        legacy_source_id(doc['metadata']) for doc in incoming.values()
+        if legacy_source_id(doc['metadata']) in sources
+    }
+
+    if not changed and not removed:
+        print("---NO CHANGES---")
+        return None
+    print(f"---{len(changed)} CHANGED, {len(removed)} REMOVED SOURCES---")
+
+    # 변경/삭제되지 않은 문서의 청크는 임베딩 그대로 유지
+    replaced = set(changed) | removed
+    keep_positions = [
+        i for i, record in enumerate(parent.records)
+        if record['metadata'].get('source_id') not in replaced
+    ]
+    records = [parent.records[i] for i in keep_positions]
+    vectors = [np.asarray(parent.embeddings[keep_positions], dtype='float32')]
+
+    # 변경된 문서의 청크 중 기존 스냅샷에 같은 id로 없는 청크만 임베딩
+    existing_vectors = {record['id']: i for i, record in enumerate(parent.records)}
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    reused, to_embed = [], []
+    for source_id, doc in changed.items():
+        sources[source_id] = content_hash(doc['text'], doc['metadata'])
+        for record in chunk_document(doc, splitter):
+            (reused if record['id'] in existing_vectors else to_embed).append(record)
+
+    if reused:
+        records.extend(reused)
+        vectors.append(np.asarray(parent.embeddings[[existing_vectors[r['id']] for r in reused]], dtype='float32'))
+    if to_embed:
+        records.extend(to_embed)
+        vectors.append(embed_in_batches([r['page_content'] for r in to_embed]))
+    print(f"---{len(to_embed)} CHUNKS EMBEDDED, {len(reused) + len(keep_positions)} REUSED---")
+
+    for source_id in removed:
+        sources.pop(source_id, None)
+
+    return write_snapshot(records, np.concatenate(vectors), sources, parent=parent_version,
+                          index_type=index_type or parent.manifest.get('index_type', 'flat'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Incremental corpus ingestion and index snapshot builder")
+    parser.add_argument("documents", nargs="?", help="JSONL file of term documents (source_id, text, metadata)")
+    parser.add_argument("--bootstrap-legacy", action="store_true",
+                        help="Convert the legacy pickle/faiss_index into the first snapshot")
+    parser.add_argument("--remove-missing", action="store_true",
+                        help="Remove sources that are not present in the input file")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Rebuild the current snapshot's index with --index-type, without re-embedding")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="FAISS index type (default: flat, or the parent snapshot's type)")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="Write the snapshot without switching CURRENT to it")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(snapshot_root, exist_ok=True)
+
+    if args.bootstrap_legacy:
+        version = bootstrap_legacy(args.index_type or 'flat')
+    elif args.reindex:
+        version = reindex(args.index_type or 'flat')
+    elif args.documents:
+        version = ingest(load_source_documents(args.documents), remove_missing=args.remove_missing,
+                         index_type=args.index_type)
+    else:
+        raise SystemExit("Provide a documents file or --bootstrap-legacy")
+
+    if version and not args.no_publish:
+        publish(version)
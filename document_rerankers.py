@@ -0,0 +1,164 @@
+### document_rerankers.py
+"""
+검색 문서 재순위화 (reranking)
+
+grade_documents의 LLM 문서별 관련성 평가 대신, 로컬 cross-encoder 또는 bge-m3의
+sparse/colbert 점수로 후보 문서 전체를 한 번의 배치 연산으로 점수화합니다.
+
+환경 변수:
+    GRADING_MODE: "llm" (기본값, 문서별 LLM 평가) 또는 "rerank"
+    RERANKER_BACKEND: "cross_encoder" (기본값) 또는 "bge_m3"
+    RERANK_THRESHOLD: 통과 기준 점수 (retrieval_benchmark.py --calibrate-reranker로 보정)
+    RERANK_TOP_N: 통과한 문서 중 유지할 최대 개수
+"""
+import os
+from typing import List, Tuple
+from utils.inference_client import INFERENCE_SERVER_URL, RemoteReranker
+
+GRADING_MODE = os.getenv('GRADING_MODE', 'llm')
+RERANKER_BACKEND = os.getenv('RERANKER_BACKEND', 'cross_encoder')
+RERANK_THRESHOLD = float(os.getenv('RERANK_THRESHOLD', '0.5'))
+RERANK_TOP_N = int(os.getenv('RERANK_TOP_N', '3'))
+
+cross_encoder_path = os.path.join('models', 'reranker_model', 'bge-reranker-v2-m3')
+bge_m3_path = os.path.join('models', 'embedding_model', 'bge-m3')
+
+
+class CrossEncoderReranker:
+    """
+    sentence-transformers CrossEncoder 기반 재순위화기
+    (질문, 문서) 쌍을 한 번의 배치 forward pass로 점수화합니다.
+    """
+    def __init__(self, model_path: str = cross_encoder_path, batch_size: int = 16):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_path, device='cpu', max_length=512)
+        self.batch_size = batch_size
+
+    def score(self, question: str, texts: List[str]) -> List[float]:
+        """
+        질문과 각 문서의 관련성 점수(0~1)를 계산합니다.
+
+        Args:
+            question (str): 사용자 질문
+            texts (List[str]): 문서 본문 목록
+
+        Returns:
+            List[float]: 문서별 관련성 점수
+        """
+        if not texts:
+            return []
+        # 단일 라벨 모델은 sigmoid가 적용된 0~1 점수를 반환
+        scores = self.model.predict(
+            [(question, text) for text in texts],
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        )
+        return [float(s) for s in scores]
+
+
+class BgeM3Reranker:
+    """
+    bge-m3의 dense + sparse + colbert 점수를 결합한 재순위화기
+    임베딩에 사용하는 bge-m3 모델을 그대로 재사용합니다.
+    """
+    def __init__(self, model_path: str = bge_m3_path, weights: Tuple[float, float, float] = (0.4, 0.2, 0.4)):
+        from FlagEmbedding import BGEM3FlagModel
+
+        self.model = BGEM3FlagModel(model_path, use_fp16=False, device='cpu')
+        self.weights = list(weights)
+
+    def score(self, question: str, texts: List[str]) -> List[float]:
+        """
+        질문과 각 문서의 관련성 점수를 계산합니다.
+
+        Args:
+            question (str): 사용자 질문
+            texts (List[str]): 문서 본문 목록
+
+        Returns:
+            List[float]: 문서별 관련성 점수
+        """
+        if not texts:
+            return []
+        scores = self.model.compute_score(
+            [[question, text] for text in texts],
+            weights_for_different_modes=self.weights
+        )
+        return [float(s) for s in scores['colbert+sparse+dense']]
+
+
+def load_reranker(backend: str = RERANKER_BACKEND):
+    """
+    설정된 백엔드의 재순위화기를 로드합니다.
+
+    Args:
+        backend (str): "cross_encoder" 또는 "bge_m3"
+
+    Returns:
+        재순위화기 인스턴스. 모델이나 의존성이 없으면 None (LLM 평가로 대체)
+    """
+    try:
+        if backend == 'bge_m3':
+            return BgeM3Reranker()
+        return CrossEncoderReranker()
+    except (ImportError, OSError) as e:
+        print(f"---RERANKER UNAVAILABLE ({e}), FALLING BACK TO LLM GRADING---")
+        return None
+
+
+def select_documents(documents, scores: List[float], threshold: float = RERANK_THRESHOLD,
+                     top_n: int = RERANK_TOP_N):
+    """
+    기준 점수를 넘는 문서를 점수 순으로 최대 top_n개 선택합니다.
+
+    Args:
+        documents (list): 후보 문서 목록
+        scores (List[float]): 문서별 점수
+        threshold (float): 통과 기준 점수
+        top_n (int): 유지할 최대 문서 수
+
+    Returns:
+        list: 선택된 문서 목록 (없으면 빈 리스트)
+    """
+    ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+    return [doc for doc, score in ranked if score >= threshold][:top_n]
+
+
+def calibrate_threshold(scores: List[float], labels: List[bool]) -> Tuple[float, float]:
+    """
+    라벨링된 (점수, 관련 여부) 쌍에서 F1이 최대가 되는 기준 점수를 찾습니다.
+
+    Args:
+        scores (List[float]): 후보 문서 점수
+        labels (List[bool]): 후보 문서가 실제로 관련 문서인지 여부
+
+    Returns:
+        Tuple[float, float]: (기준 점수, 해당 기준의 F1)
+    """
+    total_relevant = sum(labels)
+    best_threshold, best_f1 = RERANK_THRESHOLD, 0.0
+    if not total_relevant:
+        return best_threshold, best_f1
+
+    for threshold in sorted(set(scores)):
+        predicted = [s >= threshold for s in scores]
+        true_positive = sum(p and l for p, l in zip(predicted, labels))
+        if not true_positive:
+            continue
+        precision = true_positive / sum(predicted)
+        recall = true_positive / total_relevant
+        f1 = 2 * precision * recall / (precision + recall)
+        if f1 > best_f1:
+            best_threshold, best_f1 = threshold, f1
+
+    return best_threshold, best_f1
+
+
+# 재순위화 모드에서만 모델 로드 (프론트엔드 워커는 추론 서버의 재순위화기 사용)
+if GRADING_MODE != 'rerank':
+    reranker = None
+elif INFERENCE_SERVER_URL:
+    reranker = RemoteReranker()
+else:
+    reranker = load_reranker()
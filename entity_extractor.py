@@ -0,0 +1,307 @@
+### entity_extractor.py
+"""
+카드 상품/카드구분 엔티티 추출기
+
+전체 코퍼스 메타데이터(카드구분, 상품명)와 별칭 테이블로 Aho-Corasick 오토마톤을 한 번 만들어
+질문에서 상품명, 카드구분, 질의 주제(연회비, 한도 등)를 한 번의 순회로 찾습니다.
+transform_query는 엔티티가 찾아지면 템플릿으로 질문을 재작성하고, 그렇지 않을 때만 LLM 재작성기를 사용합니다.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CARD_TYPE_KEY = '카드구분'
+PRODUCT_KEY = '상품명'
+
+# 별칭 → 상품명에 포함된 표기
+PRODUCT_ALIASES = {
+    "프레스티지": "PRESTIGE",
+    "prestige": "PRESTIGE",
+    "스카이패스": "SKYPASS",
+    "skypass": "SKYPASS",
+}
+
+# 별칭 → 카드구분에 포함된 표기
+CARD_TYPE_ALIASES = {
+    "체크": "체크",
+    "check": "체크",
+    "신용": "신용",
+    "credit": "신용",
+}
+
+# 질의 주제 키워드 (템플릿 재작성 여부 판단, 상품만 바꾼 후속 질문에 직전 검색 주제를 이어붙일 때 사용)
+TOPIC_KEYWORDS = [
+    "연회비", "한도", "인출한도", "수수료", "환율", "환전", "충전", "발급", "재발급", "해지",
+    "혜택", "적립", "할인", "캐시백", "라운지", "결제", "해외결제", "ATM", "출금", "인출",
+    "이용금액", "실적", "분실", "도난", "환불", "미성년자", "가족카드"
+]
+
+
+def normalize(text: str) -> str:
+    """대소문자와 공백 차이를 무시하는 매칭용 정규화"""
+    return "".join(text.lower().split())
+
+
+def normalize_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """
+    normalize()와 같은 정규화 결과와, 정규화된 문자별 원문 위치를 반환합니다.
+
+    Args:
+        text (str): 원문
+
+    Returns:
+        Tuple[str, List[int]]: 정규화된 텍스트, 문자별 원문 인덱스
+    """
+    chars, offsets = [], []
+    for index, char in enumerate(text):
+        if char.isspace():
+            continue
+        for lowered in char.lower():
+            chars.append(lowered)
+            offsets.append(index)
+    return "".join(chars), offsets
+
+
+class AhoCorasick:
+    """
+    여러 패턴을 한 번의 텍스트 순회로 찾는 Aho-Corasick 오토마톤
+
+    Attributes:
+        goto (List[Dict[str, int]]): 상태별 전이
+        fail (List[int]): 실패 링크
+        output (List[List[Tuple[int, object]]]): 상태별 (패턴 길이, 값) 목록
+    """
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, object]]] = [[]]
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append((len(pattern), value))
+
+        # BFS로 실패 링크 계산
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                candidate = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = candidate if candidate != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, object]]:
+        """
+        텍스트에서 모든 패턴 매치를 찾습니다.
+
+        Args:
+            text (str): 정규화된 텍스트
+
+        Returns:
+            List[Tuple[int, int, object]]: (시작 위치, 끝 위치, 값) 목록
+        """
+        matches = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                matches.append((position - length + 1, position + 1, value))
+        return matches
+
+
+@dataclass
+class Entities:
+    """
+    질문에서 추출한 엔티티
+
+    Attributes:
+        product_name (Optional[str]): 코퍼스 메타데이터의 상품명
+        card_type (Optional[str]): 코퍼스 메타데이터의 카드구분
+        topics (List[str]): 질의 주제 키워드
+        product_span (Optional[Tuple[int, int]]): 질문 원문에서 상품명(또는 별칭)이 나온 위치
+        card_type_span (Optional[Tuple[int, int]]): 질문 원문에서 카드구분이 나온 위치 (추론된 경우 None)
+    """
+    product_name: Optional[str] = None
+    card_type: Optional[str] = None
+    topics: List[str] = field(default_factory=list)
+    product_span: Optional[Tuple[int, int]] = None
+    card_type_span: Optional[Tuple[int, int]] = None
+
+
+class EntityExtractor:
+    """
+    코퍼스의 (카드구분, 상품명) 목록과 별칭 테이블로 만든 엔티티 추출기
+    """
+    def __init__(self, catalog: Iterable[Tuple[str, str]],
+                 product_aliases: Dict[str, str] = PRODUCT_ALIASES,
+                 card_type_aliases: Dict[str, str] = CARD_TYPE_ALIASES):
+        self.product_card_types: Dict[str, set] = {}
+        card_types = set()
+        for card_type, product_name in catalog:
+            if product_name:
+                self.product_card_types.setdefault(product_name, set())
+                if card_type:
+                    self.product_card_types[product_name].add(card_type)
+            if card_type:
+                card_types.add(card_type)
+
+        patterns = []
+        for product_name in self.product_card_types:
+            patterns.append((normalize(product_name), ("product", (product_name,))))
+        for card_type in card_types:
+            patterns.append((normalize(card_type), ("card_type", (card_type,))))
+
+        # 별칭은 해당 표기를 포함하는 상품/카드구분 후보 전체로 연결
+        for alias, canonical in product_aliases.items():
+            candidates = tuple(p for p in self.product_card_types if normalize(canonical) in normalize(p))
+            if candidates:
+                patterns.append((normalize(alias), ("product", candidates)))
+        for alias, canonical in card_type_aliases.items():
+            candidates = tuple(c for c in card_types if normalize(canonical) in normalize(c))
+            if candidates:
+                patterns.append((normalize(alias), ("card_type", candidates)))
+
+        for keyword in TOPIC_KEYWORDS:
+            patterns.append((normalize(keyword), ("topic", (keyword,))))
+
+        self.automaton = AhoCorasick(patterns)
+
+    def extract(self, question: str) -> Entities:
+        """
+        질문에서 상품명, 카드구분, 주제를 추출합니다.
+        긴 매치를 우선하며, 상품 후보가 여러 개면 함께 찾은 카드구분으로 좁힙니다.
+
+        Args:
+            question (str): 사용자 질문
+
+        Returns:
+            Entities: 추출된 엔티티
+        """
+        entities = Entities()
+        product_candidates, card_type_candidates = None, None
+        product_length, card_type_length = 0, 0
+
+        text, offsets = normalize_with_offsets(question)
+        for start, end, (kind, values) in self.automaton.find(text):
+            length = end - start
+            span = (offsets[start], offsets[end - 1] + 1)
+            if kind == "product" and (
+                    length > product_length or
+                    (length == product_length and len(values) < len(product_candidates))):
+                product_candidates, product_length = values, length
+                entities.product_span = span
+            elif kind == "card_type" and length > card_type_length:
+                card_type_candidates, card_type_length = values, length
+                entities.card_type_span = span
+            elif kind == "topic" and values[0] not in entities.topics:
+                entities.topics.append(values[0])
+
+        # 짧은 주제가 긴 주제에 포함되면 제거 (예: 한도 ⊂ 인출한도)
+        entities.topics = [
+            t for t in entities.topics
+            if not any(t != other and t in other for other in entities.topics)
+        ]
+
+        if card_type_candidates:
+            entities.card_type = min(card_type_candidates, key=len)
+
+        if product_candidates:
+            candidates = list(product_candidates)
+            if entities.card_type:
+                narrowed = [p for p in candidates if entities.card_type in self.product_card_types[p]]
+                candidates = narrowed or candidates
+            # 가장 짧은 상품명이 가장 일반적인 표기
+            entities.product_name = min(candidates, key=len)
+            if not entities.card_type and len(self.product_card_types[entities.product_name]) == 1:
+                entities.card_type = next(iter(self.product_card_types[entities.product_name]))
+
+        return entities
+
+
+def template_rewrite(question: str, entities: Entities, previous_topics: Iterable[str] = ()) -> Optional[str]:
+    """
+    추출된 엔티티로 질문을 결정적으로 재작성합니다. 질문의 상품명(또는 별칭)을 정식 상품명으로 바꾸고,
+    카드구분이 추론된 경우에만 덧붙입니다. 질문에 주제 없이 상품만 있으면("그럼 skypass는?")
+    세션에서 직전에 검색한 주제를 이어붙인 질문을 만듭니다.
+
+    Args:
+        question (str): 현재 질문
+        entities (Entities): 질문에서 추출한 엔티티
+        previous_topics (Iterable[str]): 세션에서 직전에 검색한 질문의 주제
+
+    Returns:
+        Optional[str]: 재작성된 질문 (이미 정식 표기면 원문 그대로). LLM 재작성기를 써야 하면 None
+    """
+    previous_topics = list(previous_topics)
+    if not entities.product_name or not (entities.topics or previous_topics):
+        return None
+
+    subject = entities.product_name
+    if (entities.card_type and entities.card_type_span is None
+            and normalize(entities.card_type) not in normalize(subject)):
+        subject = f"{subject} {entities.card_type}"
+
+    if not entities.topics:
+        return f"{subject} {' '.join(previous_topics)}"
+    start, end = entities.product_span
+    return f"{question[:start]}{subject}{question[end:]}"
+
+
+_extractor_cache = {"version": None, "extractor": None}
+_extractor_lock = threading.Lock()
+
+
+def get_entity_extractor(version: str, catalog_loader) -> EntityExtractor:
+    """
+    코퍼스 버전별로 한 번만 추출기를 만들어 재사용합니다.
+
+    Args:
+        version (str): 현재 코퍼스 버전
+        catalog_loader (Callable): (카드구분, 상품명) 목록을 반환하는 함수
+
+    Returns:
+        EntityExtractor: 해당 버전의 추출기
+    """
+    if _extractor_cache["version"] != version:
+        with _extractor_lock:
+            if _extractor_cache["version"] != version:
+                _extractor_cache["extractor"] = EntityExtractor(catalog_loader())
+                _extractor_cache["version"] = version
+    return _extractor_cache["extractor"]
+
+
+async def aget_entity_extractor(version: str, catalog_loader) -> EntityExtractor:
+    """
+    get_entity_extractor()의 비동기 버전 (프론트엔드 모드의 /catalog 요청이 이벤트 루프를 막지 않음)
+
+    Args:
+        version (str): 현재 코퍼스 버전
+        catalog_loader (Callable): (카드구분, 상품명) 목록을 반환하는 코루틴 함수
+
+    Returns:
+        EntityExtractor: 해당 버전의 추출기
+    """
+    if _extractor_cache["version"] != version:
+        catalog = await catalog_loader()
+        with _extractor_lock:
+            if _extractor_cache["version"] != version:
+                _extractor_cache["extractor"] = EntityExtractor(catalog)
+                _extractor_cache["version"] = version
+    return _extractor_cache["extractor"]
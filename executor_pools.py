@@ -0,0 +1,290 @@
+### executor_pools.py
+"""
+LLM 추론, 임베딩, 검색용 전용 스레드 풀
+
+llama.cpp, bge-m3 인코딩(torch), FAISS/BM25 검색이 같은 기본 executor와 코어를 공유하면
+부하가 걸릴 때 서로 코어를 빼앗아 함께 느려집니다. 작업 종류별로 풀과 네이티브 스레드 수를 나누고,
+선택적으로 풀별 CPU 코어를 고정(affinity)합니다.
+
+BLAS/OpenMP 스레드 수는 numpy/torch/faiss가 로드되기 전에 정해져야 하므로
+app.py와 inference_server.py는 이 모듈을 가장 먼저 import합니다.
+
+환경 변수:
+    LLM_THREADS          llama.cpp 연산 스레드 수 (기본값: 코어 수 // 2)
+    EMBEDDING_THREADS    torch intra-op 스레드 수 (기본값: 코어 수 // 4)
+    SEARCH_THREADS       검색 풀 워커 수, 워커당 FAISS OpenMP 스레드 1개 (기본값: 남은 코어)
+    LLM_POOL_WORKERS     동기 LLM 모델 호출(ChatLlamaCpp._generate)을 실행할 워커 수 (기본값: 1)
+    CPU_AFFINITY         'auto'면 llm → embedding → search 순서로 연속된 코어를 배정
+    LLM_CPUS / EMBEDDING_CPUS / SEARCH_CPUS
+                         풀별 코어 목록 (예: '0-7', '8,9,10'), CPU_AFFINITY보다 우선
+    POOL_REPORT_SECONDS  풀 사용률 로그 주기(초), 0이면 비활성 (기본값: 60)
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+CPU_COUNT = os.cpu_count() or 1
+
+LLM_THREADS = int(os.getenv('LLM_THREADS', str(max(1, CPU_COUNT // 2))))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', str(max(1, CPU_COUNT // 4))))
+SEARCH_THREADS = int(os.getenv('SEARCH_THREADS', str(max(1, CPU_COUNT - LLM_THREADS - EMBEDDING_THREADS))))
+LLM_POOL_WORKERS = int(os.getenv('LLM_POOL_WORKERS', '1'))
+POOL_REPORT_SECONDS = float(os.getenv('POOL_REPORT_SECONDS', '60'))
+
+# 명시적으로 설정하지 않은 BLAS/OpenMP 라이브러리가 코어 수만큼 스레드를 만들지 않도록 1로 제한
+# (torch와 FAISS는 아래에서 풀별로 따로 설정)
+for _name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+              'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'):
+    os.environ.setdefault(_name, '1')
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+
+def parse_cpu_list(value: str) -> Set[int]:
+    """'0-3,8' 형식의 코어 목록을 집합으로 변환합니다."""
+    cpus = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def _resolve_affinity() -> Dict[str, Optional[Set[int]]]:
+    affinity = {'llm': None, 'embedding': None, 'search': None}
+    if os.getenv('CPU_AFFINITY') == 'auto' and hasattr(os, 'sched_getaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+        start = 0
+        for name, count in (('llm', LLM_THREADS), ('embedding', EMBEDDING_THREADS), ('search', SEARCH_THREADS)):
+            cpus = available[start:start + count]
+            affinity[name] = set(cpus) if cpus else None
+            start += count
+    for name in affinity:
+        value = os.getenv(f'{name.upper()}_CPUS')
+        if value:
+            affinity[name] = parse_cpu_list(value)
+    return affinity
+
+
+POOL_AFFINITY = _resolve_affinity()
+
+
+def pin_current_thread(pool_name: str):
+    """
+    현재 스레드를 풀에 배정된 코어에 고정합니다 (Linux 전용, 설정이 없으면 무시).
+    이 스레드에서 생성되는 llama.cpp/OpenMP 워커 스레드도 같은 코어 집합을 상속합니다.
+
+    Args:
+        pool_name (str): 'llm', 'embedding', 'search'
+    """
+    cpus = POOL_AFFINITY.get(pool_name)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            print(f"---CPU AFFINITY FOR {pool_name} NOT APPLIED: {e}---")
+
+
+def _init_llm_worker():
+    pin_current_thread('llm')
+
+
+def _init_embedding_worker():
+    pin_current_thread('embedding')
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(EMBEDDING_THREADS)
+
+
+def _init_search_worker():
+    pin_current_thread('search')
+    # 검색 한 건은 작으므로 질의 내부 병렬화 대신 워커 수로 질의 간 병렬화
+    faiss = sys.modules.get('faiss')
+    if faiss is not None:
+        faiss.omp_set_num_threads(1)
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """
+    대기 시간과 실행 시간을 기록하는 ThreadPoolExecutor
+
+    Attributes:
+        name (str): 풀 이름
+        workers (int): 워커 수
+    """
+    def __init__(self, name: str, workers: int, initializer: Callable = None):
+        super().__init__(max_workers=workers, thread_name_prefix=f"{name}-pool", initializer=initializer)
+        self.name = name
+        self.workers = workers
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.started_at = time.monotonic()
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.running = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted_at = time.monotonic()
+        with self._stats_lock:
+            self.submitted += 1
+
+        def run():
+            began = time.monotonic()
+            with self._stats_lock:
+                wait = began - submitted_at
+                self.wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+                self.started += 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.monotonic() - began
+
+        return super().submit(run)
+
+    def report(self, reset: bool = False) -> Dict[str, float]:
+        """
+        마지막 초기화 이후 풀 사용률과 대기 통계를 반환합니다.
+
+        Args:
+            reset (bool): 반환 후 통계를 초기화할지 여부
+
+        Returns:
+            Dict[str, float]: workers, utilization, running, queued, completed, avg/max wait(ms)
+        """
+        with self._stats_lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            queued = self.submitted - self.started
+            report = {
+                "workers": self.workers,
+                "utilization": round(self.busy_seconds / (elapsed * self.workers), 3),
+                "running": self.running,
+                "queued": queued,
+                "completed": self.completed,
+                "avg_wait_ms": round(1000 * self.wait_seconds / max(self.started, 1), 2),
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 2),
+            }
+            if reset:
+                # 진행 중/대기 중인 작업은 다음 구간으로 넘김
+                running = self.running
+                self._reset_stats()
+                self.running = running
+                self.submitted = queued
+        return report
+
+
+pools: Dict[str, InstrumentedExecutor] = {}
+_pools_lock = threading.Lock()
+
+_POOL_SPECS = {
+    'llm': (LLM_POOL_WORKERS, _init_llm_worker),
+    'embedding': (1, _init_embedding_worker),
+    'search': (SEARCH_THREADS, _init_search_worker),
+}
+
+
+def get_pool(name: str) -> InstrumentedExecutor:
+    """
+    이름에 해당하는 풀을 반환합니다 (처음 사용할 때 생성).
+    임베딩 풀은 워커 1개가 EMBEDDING_THREADS개의 torch 스레드로 배치를 처리합니다.
+
+    Args:
+        name (str): 'llm', 'embedding', 'search'
+
+    Returns:
+        InstrumentedExecutor: 해당 풀
+    """
+    pool = pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = pools.get(name)
+            if pool is None:
+                workers, initializer = _POOL_SPECS[name]
+                pool = InstrumentedExecutor(name, workers, initializer)
+                pools[name] = pool
+    return pool
+
+
+async def run_in_pool(name: str, func: Callable, *args, **kwargs):
+    """
+    동기 함수를 지정한 풀에서 실행하고 결과를 기다립니다.
+    호출한 코루틴의 contextvars(로그의 session_id, node 등)를 그대로 가지고 실행됩니다.
+
+    Args:
+        name (str): 풀 이름
+        func (Callable): 실행할 함수
+
+    Returns:
+        func의 반환값
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_pool(name), context.run, functools.partial(func, *args, **kwargs))
+
+
+def pool_report(reset: bool = False) -> Dict[str, Dict[str, float]]:
+    """생성된 모든 풀의 사용률/대기 통계를 반환합니다."""
+    return {name: pool.report(reset) for name, pool in list(pools.items())}
+
+
+def start_pool_reporter(logger, interval: float = POOL_REPORT_SECONDS) -> Optional[threading.Thread]:
+    """
+    주기적으로 풀별 사용률과 대기 통계를 로그로 남기는 스레드를 시작합니다.
+    각 로그는 직전 보고 이후 구간의 통계입니다.
+
+    Args:
+        logger: 로그를 남길 logger
+        interval (float): 보고 주기(초), 0 이하이면 시작하지 않음
+
+    Returns:
+        Optional[threading.Thread]: 시작된 스레드
+    """
+    if interval <= 0:
+        return None
+
+    def report():
+        while True:
+            time.sleep(interval)
+            for name, stats in pool_report(reset=True).items():
+                logger.info(
+                    f"Pool {name}: utilization {stats['utilization']:.0%} of {stats['workers']} workers, "
+                    f"running {stats['running']}, queued {stats['queued']}, completed {stats['completed']}, "
+                    f"wait avg {stats['avg_wait_ms']}ms max {stats['max_wait_ms']}ms"
+                )
+
+    thread = threading.Thread(target=report, name='pool-reporter', daemon=True)
+    thread.start()
+    return thread
+
+
+def describe_partition() -> List[str]:
+    """시작 로그용 풀 구성 요약"""
+    lines = {
+        'llm': f"llm: {LLM_THREADS} llama.cpp threads, {LLM_POOL_WORKERS} pool workers",
+        'embedding': f"embedding: {EMBEDDING_THREADS} torch threads, 1 pool worker",
+        'search': f"search: {SEARCH_THREADS} pool workers",
+    }
+    for name, cpus in POOL_AFFINITY.items():
+        if cpus:
+            lines[name] += f", cpus {sorted(cpus)}"
+    return list(lines.values())
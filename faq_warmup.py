@@ -0,0 +1,189 @@
+### faq_warmup.py
+"""
+자주 묻는 질문(FAQ) 사전 계산 답변
+
+시작 시 FAQ 질문을 워크플로우로 미리 실행해 모델, 임베딩 모델, 인덱스를 예열하고,
+검증된 답변을 코퍼스 버전별 테이블에 저장합니다. 같은 질문은 테이블에서 바로 응답합니다.
+
+FAQ 파일 (data/faq/faq_questions.json):
+    ["트래블로그 PRESTIGE 신용카드의 연회비가 얼마인가요?", {"question": "...", "answer": "검수된 답변"}]
+
+멀티 프로세스 서빙(serve.py)에서는 한 워커만 예열하고(FAQ_WARM_UP=1), 나머지 워커는
+같은 테이블 파일을 읽기만 하며 파일이 갱신되면 다시 로드합니다.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: 파일 잠금 없이 원자적 교체만 사용
+    fcntl = None
+
+logger = logging.getLogger('ChatbotLogger')
+
+faq_dir = os.path.join('data', 'faq')
+faq_questions_path = os.path.join(faq_dir, 'faq_questions.json')
+
+# 이 프로세스에서 시작 시 FAQ 예열을 실행할지 여부 (serve.py는 첫 워커만 1로 설정)
+FAQ_WARM_UP = os.getenv('FAQ_WARM_UP', '1') == '1'
+
+# Gradio 예시 질문 (항상 FAQ에 포함)
+EXAMPLE_QUESTIONS = [
+    "트래블로그 PRESTIGE 신용카드의 연회비가 얼마인가요?",
+    "미성년자도 트래블로그 발급 받을 수 있어?",
+    "해외에서 ATM 이용 시 인출한도는 얼마인가요?"
+]
+
+_ignored_chars = re.compile(r"[\s?!.,~·'\"]+")
+
+
+def normalize_question(question: str) -> str:
+    """공백, 문장부호, 대소문자 차이를 무시하는 질문 키"""
+    return _ignored_chars.sub("", question).lower()
+
+
+def load_faq_entries(path: str = faq_questions_path) -> List[Dict[str, Optional[str]]]:
+    """
+    예시 질문과 FAQ 파일의 질문을 합쳐 반환합니다.
+
+    Args:
+        path (str): FAQ 파일 경로
+
+    Returns:
+        List[Dict]: question, answer(검수된 답변이 없으면 None) 키를 가진 항목 목록
+    """
+    entries = [{"question": q, "answer": None} for q in EXAMPLE_QUESTIONS]
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                if isinstance(item, str):
+                    entries.append({"question": item, "answer": None})
+                else:
+                    entries.append({"question": item["question"], "answer": item.get("answer")})
+
+    # 정규화 키 기준 중복 제거 (검수된 답변이 있는 항목 우선)
+    unique = {}
+    for entry in entries:
+        key = normalize_question(entry["question"])
+        if key not in unique or entry["answer"]:
+            unique[key] = entry
+    return list(unique.values())
+
+
+@contextmanager
+def _file_lock(path: str):
+    """여러 워커 프로세스가 같은 테이블 파일을 동시에 갱신하지 않도록 잠급니다."""
+    with open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PrecomputedAnswers:
+    """
+    코퍼스 버전별 사전 계산 답변 테이블
+    코퍼스가 핫스왑되면 해당 버전의 테이블로 자동 전환되고, 검수된 답변은 새 버전에도 바로 채워집니다.
+    다른 워커가 테이블 파일을 갱신하면 다음 조회 때 다시 로드합니다.
+    """
+    def __init__(self, directory: str = faq_dir, vetted: Optional[List[Dict[str, Optional[str]]]] = None):
+        self.directory = directory
+        self.version = None
+        self.answers: Dict[str, Dict[str, str]] = {}
+        self.vetted = [e for e in (load_faq_entries() if vetted is None else vetted) if e["answer"]]
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def _path(self, version: str) -> str:
+        return os.path.join(self.directory, f"precomputed_answers_{version}.json")
+
+    def _read(self, path: str) -> Dict[str, Dict[str, str]]:
+        """테이블 파일을 읽습니다. 읽을 수 없으면 빈 테이블로 취급합니다."""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                answers = json.load(f)
+            if not isinstance(answers, dict):
+                raise ValueError("table is not a JSON object")
+            return answers
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable precomputed answers {path}: {str(e)}")
+            return {}
+
+    def _seeded(self, answers: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+        """검수된 답변을 테이블에 채웁니다 (검수된 답변이 워크플로우 답변보다 우선)."""
+        seeded = dict(answers)
+        for entry in self.vetted:
+            seeded[normalize_question(entry["question"])] = {
+                "question": entry["question"], "answer": entry["answer"], "source": "vetted"
+            }
+        return seeded
+
+    def use_version(self, version: str):
+        """
+        주어진 코퍼스 버전의 테이블을 로드합니다. 같은 버전이라도 파일이 갱신되었으면 다시 로드합니다.
+
+        Args:
+            version (str): 코퍼스 버전
+        """
+        path = self._path(version)
+        mtime = _mtime(path)
+        if version == self.version and mtime == self._loaded_mtime:
+            return
+        answers = self._seeded(self._read(path))
+        with self._lock:
+            self.version, self.answers, self._loaded_mtime = version, answers, mtime
+
+    def get(self, question: str) -> Optional[str]:
+        """질문과 일치하는 사전 계산 답변을 반환합니다."""
+        entry = self.answers.get(normalize_question(question))
+        return entry["answer"] if entry else None
+
+    def __contains__(self, question: str) -> bool:
+        return normalize_question(question) in self.answers
+
+    def put(self, question: str, answer: str, source: str):
+        """
+        답변을 테이블에 추가하고 파일에 저장합니다.
+
+        Args:
+            question (str): 질문
+            answer (str): 답변
+            source (str): 'workflow' (grader 검증 통과) 또는 'vetted' (수동 검수)
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(self.version)
+            with _file_lock(path):
+                # 다른 워커가 저장한 답변을 잃지 않도록 파일의 최신 내용과 합침
+                answers = self._seeded(self._read(path))
+                answers.update(self.answers)
+                answers[normalize_question(question)] = {
+                    "question": question, "answer": answer, "source": source
+                }
+                tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+                try:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(answers, f, ensure_ascii=False, indent=4)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                self.answers, self._loaded_mtime = answers, _mtime(path)
@@ -1,13 +1,41 @@
 ### graph_state.py
+import asyncio
 import json
+import logging
+import os
+import random
 from typing import List
 from langgraph.graph import MessagesState
-from utils.vector_db_retrievers import ensemble_retriever
+from utils.vector_db_retrievers import aretrieve, aembed_query, acurrent_corpus_version, aproduct_catalog
+from utils.entity_extractor import aget_entity_extractor, template_rewrite
 from utils.llm_model_inference import (
     chat_vs_docs_grader, chat_type_grader, retrieval_grader,
     rag_chain, chat_generator, hallucination_grader, answer_grader,
-    question_rewriter
+    question_rewriter, LLM_MAX_CONCURRENCY
 )
+from utils.document_rerankers import reranker, select_documents
+from utils.executor_pools import run_in_pool
+from utils.groundedness import check_groundedness
+
+# 추측 생성: 문서 평가와 동시에 상위 문서로 답변 생성 시작 (LLM 동시 호출이 가능한 백엔드에서만 사용)
+SPECULATIVE_GENERATION = os.getenv('SPECULATIVE_GENERATION', '0') == '1'
+SPECULATIVE_TOP_K = int(os.getenv('SPECULATIVE_TOP_K', '2'))
+
+# 추측 생성 결과 유지/폐기 횟수
+speculation_stats = {"kept": 0, "discarded": 0}
+
+# 어휘 기반 근거성 사전 검사로 확실한 경우 hallucination_grader 호출 생략
+GROUNDEDNESS_PRECHECK = os.getenv('GROUNDEDNESS_PRECHECK', '1') == '1'
+groundedness_stats = {"grounded": 0, "ungrounded": 0, "ambiguous": 0}
+# 사전 검사의 근거 없음 판정만으로 재생성하는 최대 횟수 (이후에는 LLM grader가 판정)
+UNGROUNDED_RETRIES = int(os.getenv('UNGROUNDED_RETRIES', '1'))
+# 기준값 보정(groundedness.calibrate_thresholds)을 위해 사전 검사로 판정한 답변도 grader로 확인할 비율
+GROUNDEDNESS_AUDIT_RATE = float(os.getenv('GROUNDEDNESS_AUDIT_RATE', '0'))
+
+# 후속 질문에서 세션 캐시 청크 재사용/검색 횟수
+retrieval_cache_stats = {"reused": 0, "retrieved": 0}
+
+logger = logging.getLogger('ChatbotLogger')
 
 class GraphState(MessagesState):
     """
@@ -17,10 +45,20 @@ class GraphState(MessagesState):
         question: the current question
         generation: LLM generation
         documents: list of documents
+        intent: intent classified for the current question
+        reuse_checked: whether the session retrieval cache was already tried for this question
+        documents_reused: whether documents came from the session retrieval cache
+        template_rewritten: whether the question was already rewritten by the entity template
+        generation_attempts: number of answers generated from the current documents
     """
     question: str
     generation: str
     documents: List[str]
+    intent: str
+    reuse_checked: bool
+    documents_reused: bool
+    template_rewritten: bool
+    generation_attempts: int
 
 
 def format_chat_history(messages):
@@ -94,7 +132,11 @@ async def classify_intent(state):
     return {
         "intent": intent,
         "question": question,
-        "messages": history
+        "messages": history,
+        "reuse_checked": False,
+        "documents_reused": False,
+        "template_rewritten": False,
+        "generation_attempts": 0
     }
 
 
@@ -117,12 +159,20 @@ def decide_path(state):
     else:  # docs_only
         return "retrieve"
 
-async def retrieve(state):
+async def extract_entities(question):
+    """Extract product, card type and topics with the extractor built for the current corpus version"""
+    extractor = await aget_entity_extractor(await acurrent_corpus_version(), aproduct_catalog)
+    return extractor.extract(question)
+
+
+async def retrieve(state, config=None):
     """
     Retrieve documents based on the current question.
+    For a chat_and_docs follow-up, first try the chunks graded in the session's recent turns.
 
     Args:
         state (dict): The current graph state
+        config (dict): Graph config whose configurable may carry the session's retrieval_cache and last_topics
 
     Returns:
         state (dict): New key added to state, documents, that contains retrieved documents
@@ -130,13 +180,39 @@ async def retrieve(state):
     print("---RETRIEVE---")
     question = state["question"]
 
-    # Retrieval
-    documents = await ensemble_retriever.ainvoke(question)
-
     # Update chat history with the user's question
     state["messages"].append({"role": "user", "content": question})
 
-    return {"documents": documents, "question": question}
+    configurable = (config or {}).get("configurable") or {}
+    entities = await extract_entities(question)
+    last_topics = configurable.get("last_topics")
+    if last_topics is not None and entities.topics:
+        # 상품만 바꾼 후속 질문("그럼 skypass는?")을 템플릿으로 재작성할 수 있도록 검색한 주제를 세션에 기록
+        last_topics[:] = entities.topics
+
+    cache = configurable.get("retrieval_cache")
+    if cache is None or state.get("intent") != "chat_and_docs" or state.get("reuse_checked"):
+        # Retrieval (스냅샷 핫스왑 이후에도 현재 버전의 리트리버 사용)
+        documents = await aretrieve(question)
+        return {"documents": documents, "question": question, "documents_reused": False,
+                "generation_attempts": 0}
+
+    # 재작성된 후속 질문을 한 번만 임베딩해 캐시 비교와 검색에 함께 사용하고,
+    # 그동안 직전 턴의 캐시 저장이 끝나기를 잠시 기다림 (빠른 후속 질문이 빈 캐시를 보지 않도록)
+    embedding, _ = await asyncio.gather(aembed_query(question), cache.wait_pending())
+    version = await acurrent_corpus_version()
+    documents = cache.match(embedding, version, entities.product_name)
+    if documents:
+        print(f"---REUSE {len(documents)} DOCUMENTS FROM PREVIOUS TURNS---")
+        retrieval_cache_stats["reused"] += 1
+        logger.debug(f"Reused {len(documents)} cached chunks", extra={"event": "retrieval_cache"})
+        return {"documents": documents, "question": question,
+                "reuse_checked": True, "documents_reused": True, "generation_attempts": 0}
+
+    retrieval_cache_stats["retrieved"] += 1
+    documents = await aretrieve(question, embedding)
+    return {"documents": documents, "question": question,
+            "reuse_checked": True, "documents_reused": False, "generation_attempts": 0}
 
 
 async def generate_from_history(state):
@@ -189,7 +265,8 @@ async def generate(state):
     # Update chat history with the generated answer
     state["messages"].append({"role": "assistant", "content": generation})
 
-    return {"documents": documents, "question": question, "generation": generation}
+    return {"documents": documents, "question": question, "generation": generation,
+            "generation_attempts": state.get("generation_attempts", 0) + 1}
 
 
 async def grade_documents(state):
@@ -207,13 +284,14 @@ async def grade_documents(state):
     question = state["question"]
     documents = state["documents"]
 
-    # Score each doc
-    filtered_docs = []
-    for d in documents:
-        score = await retrieval_grader.ainvoke(
-            {"question": question, "document": d.page_content}
-        )
+    # Score each doc (연속 배칭 백엔드에서는 문서별 호출이 forward pass를 공유)
+    scores = await retrieval_grader.abatch(
+        [{"question": question, "document": d.page_content} for d in documents],
+        config={"max_concurrency": LLM_MAX_CONCURRENCY}
+    )
 
+    filtered_docs = []
+    for d, score in zip(documents, scores):
         # 문자열로 반환된 경우 JSON으로 파싱
         if isinstance(score, str):
             score = json.loads(score)
@@ -229,12 +307,131 @@ async def grade_documents(state):
     return {"documents": filtered_docs, "question": question}
 
 
-async def transform_query(state):
+async def grade_document(question, document):
+    """
+    Grades a single document for relevance to the question.
+
+    Args:
+        question (str): The question
+        document (Document): The document to grade
+
+    Returns:
+        bool: Whether the document is relevant
+    """
+    score = await retrieval_grader.ainvoke(
+        {"question": question, "document": document.page_content}
+    )
+    if isinstance(score, str):
+        score = json.loads(score)
+    return score["score"] == "yes"
+
+
+async def cancel_and_wait(*tasks):
+    """
+    Cancels the tasks and waits for them to finish, so that no task is destroyed while pending
+    and exceptions of already finished tasks are retrieved.
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def speculative_grade_and_generate(state):
+    """
+    Grades documents while speculatively generating an answer from the top retrieved documents.
+    The draft is cancelled and regenerated as soon as grading drops a document it relied on.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Filtered documents and, if any are relevant, the generation
+    """
+
+    print("---SPECULATIVE GRADE AND GENERATE---")
+    question = state["question"]
+    documents = state["documents"]
+    draft_docs = documents[:SPECULATIVE_TOP_K]
+
+    draft_task = asyncio.create_task(rag_chain.ainvoke({"context": draft_docs, "question": question}))
+    grade_tasks = {asyncio.create_task(grade_document(question, d)): i for i, d in enumerate(documents)}
+
+    relevant = [False] * len(documents)
+    draft_valid = True
+    pending = set(grade_tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                position = grade_tasks[task]
+                relevant[position] = task.result()
+                if not relevant[position] and position < len(draft_docs) and draft_valid:
+                    print("---SPECULATION: DRAFT DOCUMENT NOT RELEVANT, CANCEL DRAFT---")
+                    draft_valid = False
+                    draft_task.cancel()
+    except BaseException:
+        await cancel_and_wait(draft_task, *grade_tasks)
+        raise
+
+    filtered_docs = [d for d, keep in zip(documents, relevant) if keep]
+    if not draft_valid or not filtered_docs:
+        await cancel_and_wait(draft_task)
+    if not filtered_docs:
+        speculation_stats["discarded"] += 1
+        print(f"---SPECULATION DISCARDED: NO RELEVANT DOCUMENTS {speculation_stats}---")
+        return {"documents": [], "question": question}
+
+    if draft_valid:
+        generation = await draft_task
+        speculation_stats["kept"] += 1
+        print(f"---SPECULATION KEPT {speculation_stats}---")
+    else:
+        speculation_stats["discarded"] += 1
+        print(f"---SPECULATION DISCARDED, REGENERATE {speculation_stats}---")
+        generation = await rag_chain.ainvoke({"context": filtered_docs, "question": question})
+
+    # Update chat history with the generated answer
+    state["messages"].append({"role": "assistant", "content": generation})
+
+    return {"documents": filtered_docs, "question": question, "generation": generation,
+            "generation_attempts": state.get("generation_attempts", 0) + 1}
+
+
+async def rerank_documents(state):
+    """
+    Scores all retrieved documents in one batched reranker pass and keeps the top ones.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Updates documents key with the top documents above the threshold
+    """
+
+    print("---RERANK DOCUMENTS---")
+    question = state["question"]
+    documents = state["documents"]
+
+    texts = [d.page_content for d in documents]
+    if hasattr(reranker, 'ascore'):
+        # 프론트엔드 모드: 추론 서버에 비동기로 요청
+        scores = await reranker.ascore(question, texts)
+    else:
+        # CPU 배치 연산이 이벤트 루프를 막지 않도록 임베딩 풀에서 실행
+        scores = await run_in_pool('embedding', reranker.score, question, texts)
+    filtered_docs = select_documents(documents, scores)
+    print(f"---RERANK: {len(filtered_docs)}/{len(documents)} DOCUMENTS KEPT---")
+
+    return {"documents": filtered_docs, "question": question}
+
+
+async def transform_query(state, config=None):
     """
     Re-write the query using the question rewriter and consider chat history.
 
     Args:
         state (GraphState): The current graph state
+        config (dict): Graph config whose configurable may carry the session's last_topics
 
     Returns:
         state (GraphState): Updates the question key with a re-phrased question
@@ -243,36 +440,31 @@ async def transform_query(state):
 
     # Access question and documents from state
     question = state["question"]
-    documents = state["documents"]
+    documents = state.get("documents") or []
     history = state["messages"]
 
-    # 각 문서에서 카드구분과 상품명 추출
-    card_type = '정보없음'
-    product_name = '정보없음'
-
-    # documents가 있는 경우 첫 번째 문서의 메타데이터 사용
-    if documents:
-        # 모든 문서의 메타데이터 수집
-        card_types = [doc.metadata.get('카드구분', '') for doc in documents if doc.metadata.get('카드구분')]
-        product_names = [doc.metadata.get('상품명', '') for doc in documents if doc.metadata.get('상품명')]
-
-        for type_name in card_types:
-            if type_name.lower() in question.lower():
-                card_type = type_name
-                break
-
-        for prod_name in product_names:
-            if prod_name.lower() in question.lower():
-                product_name = prod_name
-                break
-
-    # Re-write the query considering the chat history
-    better_question = await question_rewriter.ainvoke({
-        "question": question,
-        "card_type": card_type,
-        "product_name": product_name,
-        "history": format_chat_history(history)
-    })
+    # 전체 코퍼스 메타데이터와 별칭으로 카드구분/상품명 추출
+    entities = await extract_entities(question)
+    card_type = entities.card_type or '정보없음'
+    product_name = entities.product_name or '정보없음'
+
+    # 엔티티가 있으면 템플릿으로 재작성, 없거나 이미 템플릿으로 재작성한 질문이면 LLM 재작성기 사용
+    better_question = None
+    if not state.get("template_rewritten"):
+        previous_topics = ((config or {}).get("configurable") or {}).get("last_topics") or []
+        better_question = template_rewrite(question, entities, previous_topics)
+        # 이미 검색에 사용한 질문(docs_only)이 그대로라면 같은 검색이 반복되므로 LLM으로 재작성
+        if better_question == question and state.get("intent") != "chat_and_docs":
+            better_question = None
+    template_rewritten = better_question is not None
+    if better_question is None:
+        # Re-write the query considering the chat history
+        better_question = await question_rewriter.ainvoke({
+            "question": question,
+            "card_type": card_type,
+            "product_name": product_name,
+            "history": format_chat_history(history)
+        })
     print(f"---{better_question}---")
 
     # Update chat history with the re-written question
@@ -281,12 +473,31 @@ async def transform_query(state):
     return {
         "documents": documents,
         "question": better_question,
+        "template_rewritten": state.get("template_rewritten") or template_rewritten,
     }
 
 
 ### Edges
 
 
+def decide_after_retrieve(state):
+    """
+    Skip LLM document grading when the documents were reused from the session cache,
+    since they already passed grading in a previous turn. With a reranker loaded the batched
+    rerank pass is cheap, so reused chunks are still scored against the new question.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        str: Next node to process
+    """
+    if state.get("documents_reused") and reranker is None:
+        print("---DECISION: REUSED DOCUMENTS, GENERATE---")
+        return "generate"
+    return "grade_documents"
+
+
 async def decide_to_generate(state):
     """
     Determines whether to generate an answer, or re-generate a question.
@@ -332,13 +543,8 @@ async def grade_generation_v_documents_and_question(state):
     generation = state["generation"]
     history = state["messages"]
 
-    score = await hallucination_grader.ainvoke(
-        {"documents": documents,
-         "generation": generation, "history": format_chat_history(history) }
-    )
-
     # Check hallucination
-    grade = score["score"]
+    grade = await grade_hallucination(documents, generation, history, state.get("generation_attempts", 1))
     if grade == "yes":
         print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
         # Check question-answering
@@ -353,4 +559,77 @@ async def grade_generation_v_documents_and_question(state):
             return "not useful"
     else:
         print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
-        return "not supported"
\ No newline at end of file
+        return "not supported"
+
+
+async def grade_hallucination(documents, generation, history, attempts=1):
+    """
+    Checks groundedness with the lexical pre-check and calls hallucination_grader only when it is ambiguous.
+    An "ungrounded" pre-check verdict triggers at most UNGROUNDED_RETRIES regenerations from the same
+    documents; after that the LLM grader decides, so a near-identical regeneration cannot loop forever.
+
+    Args:
+        documents (list): Documents used for the generation
+        generation (str): The generation to check
+        history (list): Chat history
+        attempts (int): Number of answers generated from these documents, including this one
+
+    Returns:
+        str: "yes" if the generation is grounded in the documents, otherwise "no"
+    """
+    if not GROUNDEDNESS_PRECHECK:
+        score = await hallucination_grader.ainvoke(
+            {"documents": documents,
+             "generation": generation, "history": format_chat_history(history) }
+        )
+        return score["score"]
+
+    check = check_groundedness(generation, documents)
+    groundedness_stats[check.verdict] += 1
+    print(f"---GROUNDEDNESS PRE-CHECK: {check.verdict.upper()} (coverage={check.coverage})---")
+
+    decided = (check.verdict == "grounded"
+               or (check.verdict == "ungrounded" and attempts <= UNGROUNDED_RETRIES))
+    grader = None
+    if not decided or random.random() < GROUNDEDNESS_AUDIT_RATE:
+        score = await hallucination_grader.ainvoke(
+            {"documents": documents,
+             "generation": generation, "history": format_chat_history(history) }
+        )
+        grader = score["score"]
+
+    checked = sum(groundedness_stats.values())
+    skip_rate = (checked - groundedness_stats["ambiguous"]) / checked
+    # grader 판정을 함께 기록해 groundedness.calibrate_thresholds로 기준값을 보정
+    logger.info(
+        f"Groundedness pre-check {check.verdict}: coverage {check.coverage}, weakest sentence "
+        f"{check.weakest_sentence}, unsupported amounts {check.unsupported_amounts}, "
+        f"attempt {attempts}, grader {grader}, grader skip rate {skip_rate:.1%} {groundedness_stats}",
+        extra={"event": "groundedness_precheck", "precheck": {
+            "verdict": check.verdict, "coverage": check.coverage,
+            "weakest_sentence": check.weakest_sentence,
+            "unsupported_amounts": check.unsupported_amounts, "grader": grader
+        }}
+    )
+
+    if grader is not None:
+        return grader
+    return "yes" if check.verdict == "grounded" else "no"
+
+
+async def decide_after_speculation(state):
+    """
+    Routes after speculative grading: transform the query when nothing is relevant,
+    otherwise check the speculative generation like a regular one.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        str: Decision for next node to call
+    """
+
+    if not state["documents"]:
+        print("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT TO QUESTION, TRANSFORM QUERY---")
+        return "transform_query"
+    return await grade_generation_v_documents_and_question(state)
@@ -0,0 +1,212 @@
+### groundedness.py
+"""
+LLM hallucination_grader 이전의 어휘 기반 근거성 사전 검사
+
+답변 문장의 문자 3-gram이 선택된 문서에 얼마나 포함되는지(coverage)와
+답변의 금액/비율(연회비, 한도, 수수료 등)이 문서에 있는 값인지 확인합니다.
+확실히 근거가 있는 답변은 LLM grader를 건너뛰고, 확실히 근거가 없는 답변은 한 번 재생성하며,
+애매한 경우에만 LLM grader를 호출합니다.
+
+기준값은 로그의 groundedness_precheck 이벤트(사전 검사 지표와 LLM grader 판정)로 보정합니다:
+    python groundedness.py logs/chatbot_*.log --precision 0.95
+"""
+import argparse
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+# coverage가 이 값 이상이고 문서에 없는 금액이 없으면 근거 있음으로 판정
+GROUNDED_HIGH = float(os.getenv('GROUNDED_HIGH', '0.7'))
+# coverage가 이 값 미만이면 근거 없음으로 판정
+GROUNDED_LOW = float(os.getenv('GROUNDED_LOW', '0.15'))
+NGRAM_SIZE = 3
+
+_sentence_split = re.compile(r'(?<=[.!?。])\s+|\n+')
+_ignored_chars = re.compile(r'[\s\W_]+')
+_number = r'\d[\d,]*(?:\.\d+)?'
+# '1만5천원', '2억 3000만 원'처럼 숫자+자릿수 묶음이 이어지면 하나의 값으로 묶음
+_amount_pattern = re.compile(
+    rf'(?P<prefix>US\$|USD|\$)?\s*(?P<number>(?:{_number}\s*(?:억|만|천)\s*)*{_number}\s*(?:억|만|천)?)\s*'
+    r'(?P<unit>원|달러|USD|엔|유로|%|퍼센트)?'
+)
+_scaled_number = re.compile(rf'(?P<number>{_number})\s*(?P<scale>억|만|천)?')
+_scales = {'억': 100_000_000, '만': 10_000, '천': 1_000}
+_units = {'원': 'KRW', '달러': 'USD', 'USD': 'USD', 'US$': 'USD', '$': 'USD',
+          '엔': 'JPY', '유로': 'EUR', '%': '%', '퍼센트': '%'}
+
+
+@dataclass
+class GroundednessCheck:
+    """
+    사전 검사 결과
+
+    Attributes:
+        verdict (str): 'grounded', 'ungrounded', 'ambiguous'
+        coverage (float): 답변 문자 n-gram 중 문서에 있는 비율 (문장 길이 가중)
+        weakest_sentence (float): 가장 근거가 약한 문장의 coverage
+        unsupported_amounts (List[str]): 문서에 없는 답변의 금액/비율
+    """
+    verdict: str
+    coverage: float
+    weakest_sentence: float
+    unsupported_amounts: List[str] = field(default_factory=list)
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """공백과 문장부호를 제거한 문자 n-gram 집합"""
+    text = _ignored_chars.sub('', text.lower())
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def extract_amounts(text: str) -> Set[Tuple[str, float]]:
+    """
+    통화 또는 비율 단위가 붙은 값을 (단위, 값)으로 추출합니다.
+    '150,000원'과 '15만 원', '15,000원'과 '1만 5천원'은 같은 값으로 정규화됩니다.
+
+    Args:
+        text (str): 텍스트
+
+    Returns:
+        Set[Tuple[str, float]]: (단위, 값) 집합
+    """
+    amounts = set()
+    for match in _amount_pattern.finditer(text):
+        unit = match.group('unit') or match.group('prefix')
+        if not unit:
+            continue
+        value = sum(
+            float(part.group('number').replace(',', '')) * _scales.get(part.group('scale'), 1)
+            for part in _scaled_number.finditer(match.group('number'))
+        )
+        amounts.add((_units[unit], round(value, 4)))
+    return amounts
+
+
+def document_text(documents: Iterable) -> str:
+    return "\n".join(getattr(d, 'page_content', d if isinstance(d, str) else str(d)) for d in documents)
+
+
+def check_groundedness(generation: str, documents: Iterable,
+                       high: float = GROUNDED_HIGH, low: float = GROUNDED_LOW) -> GroundednessCheck:
+    """
+    답변이 문서에 근거하는지 어휘 수준에서 검사합니다.
+
+    Args:
+        generation (str): 생성된 답변
+        documents (Iterable): 답변 생성에 사용된 문서
+        high (float): 근거 있음 판정 coverage 기준
+        low (float): 근거 없음 판정 coverage 기준
+
+    Returns:
+        GroundednessCheck: 판정과 근거 지표
+    """
+    source = document_text(documents)
+    source_ngrams = char_ngrams(source)
+    source_amounts = extract_amounts(source)
+
+    covered, total, weakest = 0, 0, 1.0
+    for sentence in _sentence_split.split(generation):
+        ngrams = char_ngrams(sentence)
+        if not ngrams:
+            continue
+        hits = len(ngrams & source_ngrams)
+        covered += hits
+        total += len(ngrams)
+        weakest = min(weakest, hits / len(ngrams))
+    coverage = covered / total if total else 0.0
+
+    unsupported = sorted(
+        f"{value:g}{unit}" for unit, value in extract_amounts(generation) - source_amounts
+    )
+
+    if coverage < low or (unsupported and coverage < high):
+        verdict = 'ungrounded'
+    elif coverage >= high and not unsupported:
+        verdict = 'grounded'
+    else:
+        verdict = 'ambiguous'
+    return GroundednessCheck(verdict, round(coverage, 3), round(weakest, 3), unsupported)
+
+
+def load_precheck_records(paths: Iterable[str]) -> List[Dict]:
+    """
+    JSON 로그 파일에서 LLM grader 판정이 함께 기록된 groundedness_precheck 이벤트를 읽습니다.
+
+    Args:
+        paths (Iterable[str]): 로그 파일 경로 (한 줄에 하나의 JSON 객체)
+
+    Returns:
+        List[Dict]: coverage, unsupported_amounts, grader 키를 가진 기록
+    """
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(entry, dict) or entry.get("event") != "groundedness_precheck":
+                    continue
+                precheck = entry.get("precheck")
+                if isinstance(precheck, dict) and precheck.get("grader"):
+                    records.append(precheck)
+    return records
+
+
+def calibrate_thresholds(records: Iterable[Dict], precision: float = 0.95) -> Tuple[float, float, Dict[str, int]]:
+    """
+    LLM grader 판정을 정답으로 보고, 사전 검사만으로 판정한 결과가 grader와 precision 이상 일치하는
+    가장 넓은 기준값을 찾습니다. 조건을 만족하는 기준이 없으면 해당 쪽은 판정을 하지 않도록
+    high는 1.0 초과, low는 0.0으로 반환합니다.
+
+    Args:
+        records (Iterable[Dict]): coverage, unsupported_amounts, grader('yes'/'no') 키를 가진 기록
+        precision (float): 사전 검사 판정이 grader와 일치해야 하는 최소 비율
+
+    Returns:
+        Tuple[float, float, Dict[str, int]]: (GROUNDED_HIGH, GROUNDED_LOW, 각 기준에서 건너뛰는 grader 호출 수)
+    """
+    records = [r for r in records if r.get("grader") in ("yes", "no")]
+    coverages = sorted({r["coverage"] for r in records})
+
+    # high: coverage >= high이고 문서에 없는 금액이 없으면 grader도 'yes'여야 함
+    high = 1.01
+    for threshold in reversed(coverages):
+        decided = [r for r in records if r["coverage"] >= threshold and not r.get("unsupported_amounts")]
+        if sum(r["grader"] == "yes" for r in decided) < precision * len(decided):
+            break
+        high = threshold
+
+    # low: coverage < low이면 grader도 'no'여야 함 (기준은 인접한 coverage 값의 중간)
+    low = 0.0
+    for i, threshold in enumerate(coverages):
+        following = coverages[i + 1] if i + 1 < len(coverages) else threshold + 0.01
+        candidate = round((threshold + following) / 2, 4)
+        decided = [r for r in records if r["coverage"] < candidate]
+        if sum(r["grader"] == "no" for r in decided) < precision * len(decided):
+            break
+        low = candidate
+    high, low = round(high, 4), min(low, high)
+
+    skipped = {
+        "grounded": sum(r["coverage"] >= high and not r.get("unsupported_amounts") for r in records),
+        "ungrounded": sum(r["coverage"] < low for r in records),
+        "records": len(records),
+    }
+    return high, low, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate GROUNDED_HIGH/GROUNDED_LOW from logged grader verdicts")
+    parser.add_argument("logs", nargs="+", help="JSON log files containing groundedness_precheck events")
+    parser.add_argument("--precision", type=float, default=0.95,
+                        help="Minimum agreement with the LLM grader for pre-check decisions")
+    args = parser.parse_args()
+
+    high, low, skipped = calibrate_thresholds(load_precheck_records(args.logs), args.precision)
+    print(f"---GROUNDED_HIGH={high} GROUNDED_LOW={low} "
+          f"(skips {skipped['grounded']} grounded / {skipped['ungrounded']} ungrounded "
+          f"of {skipped['records']} graded answers)---")
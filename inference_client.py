@@ -0,0 +1,155 @@
+### inference_client.py
+"""
+추론 서버(inference_server.py) 클라이언트
+
+INFERENCE_SERVER_URL이 설정된 프론트엔드 워커는 LLM 체인, 리트리버, 재순위화기를
+직접 로드하지 않고 이 모듈의 프록시로 추론 서버에 요청합니다.
+"""
+import asyncio
+import os
+import weakref
+from typing import Any, List, Optional
+
+import httpx
+from langchain.schema import Document
+
+INFERENCE_SERVER_URL = os.getenv('INFERENCE_SERVER_URL')
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '300'))
+
+_async_clients = weakref.WeakKeyDictionary()
+_sync_client = None
+
+
+def encode(value: Any) -> Any:
+    """Document를 포함한 입력을 JSON으로 보낼 수 있게 변환합니다."""
+    if isinstance(value, Document):
+        return {"__document__": True, "page_content": value.page_content, "metadata": value.metadata}
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value: Any) -> Any:
+    """encode()로 변환된 값을 Document를 포함한 원래 형태로 되돌립니다."""
+    if isinstance(value, dict):
+        if value.get("__document__"):
+            return Document(page_content=value["page_content"], metadata=value["metadata"])
+        return {key: decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """이벤트 루프 단위로 재사용하는 비동기 HTTP 클라이언트 (연결 풀은 루프에 묶여 있음)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(base_url=INFERENCE_SERVER_URL, timeout=INFERENCE_TIMEOUT)
+        _async_clients[loop] = client
+    return client
+
+
+def get_sync_client() -> httpx.Client:
+    """프로세스 단위로 재사용하는 동기 HTTP 클라이언트"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = httpx.Client(base_url=INFERENCE_SERVER_URL, timeout=INFERENCE_TIMEOUT)
+    return _sync_client
+
+
+def server_llm_concurrency() -> int:
+    """
+    추론 서버의 LLM 백엔드가 실제로 동시에 디코딩할 수 있는 요청 수
+    (단일 컨텍스트 ChatLlamaCpp는 1, 연속 배칭 백엔드는 시퀀스 수). 서버에 연결할 수 없으면 1
+    """
+    try:
+        response = get_sync_client().get("/health")
+        response.raise_for_status()
+        return int(response.json().get("llm_max_concurrency", 1))
+    except (httpx.HTTPError, ValueError):
+        return 1
+
+
+class RemoteChain:
+    """
+    추론 서버의 LLM 체인을 호출하는 프록시
+    graph_state에서 사용하는 ainvoke/invoke/abatch 인터페이스만 제공합니다.
+    """
+    def __init__(self, name: str):
+        self.name = name
+
+    async def ainvoke(self, input: dict, config=None):
+        response = await get_async_client().post(f"/chains/{self.name}", json={"input": encode(input)})
+        response.raise_for_status()
+        return response.json()["output"]
+
+    def invoke(self, input: dict, config=None):
+        response = get_sync_client().post(f"/chains/{self.name}", json={"input": encode(input)})
+        response.raise_for_status()
+        return response.json()["output"]
+
+    async def abatch(self, inputs: List[dict], config=None, **kwargs):
+        # 서버가 공유 LLM 슬롯 안에서 처리하므로 모두 동시에 보냄
+        return await asyncio.gather(*[self.ainvoke(item) for item in inputs])
+
+
+class RemoteRetriever:
+    """추론 서버의 앙상블 리트리버를 호출하는 프록시"""
+    async def ainvoke(self, question: str, config=None, embedding: Optional[List[float]] = None) -> List[Document]:
+        payload = {"question": question}
+        if embedding is not None:
+            payload["embedding"] = list(embedding)
+        response = await get_async_client().post("/retrieve", json=payload)
+        response.raise_for_status()
+        return decode(response.json()["documents"])
+
+    def invoke(self, question: str, config=None) -> List[Document]:
+        response = get_sync_client().post("/retrieve", json={"question": question})
+        response.raise_for_status()
+        return decode(response.json()["documents"])
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        response = await get_async_client().post("/embed", json={"texts": texts})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def avectors(self, ids: List[str]) -> List[Optional[List[float]]]:
+        response = await get_async_client().post("/vectors", json={"ids": ids})
+        response.raise_for_status()
+        return response.json()["vectors"]
+
+    def catalog(self) -> List[List[str]]:
+        response = get_sync_client().get("/catalog")
+        response.raise_for_status()
+        return response.json()["catalog"]
+
+    async def acatalog(self) -> List[List[str]]:
+        response = await get_async_client().get("/catalog")
+        response.raise_for_status()
+        return response.json()["catalog"]
+
+    def corpus_version(self) -> str:
+        response = get_sync_client().get("/health")
+        response.raise_for_status()
+        return response.json()["corpus_version"]
+
+    async def acorpus_version(self) -> str:
+        response = await get_async_client().get("/health")
+        response.raise_for_status()
+        return response.json()["corpus_version"]
+
+
+class RemoteReranker:
+    """추론 서버의 재순위화기를 호출하는 프록시 (document_rerankers의 score 인터페이스)"""
+    def score(self, question: str, texts: List[str]) -> List[float]:
+        response = get_sync_client().post("/rerank", json={"question": question, "texts": texts})
+        response.raise_for_status()
+        return response.json()["scores"]
+
+    async def ascore(self, question: str, texts: List[str]) -> List[float]:
+        response = await get_async_client().post("/rerank", json={"question": question, "texts": texts})
+        response.raise_for_status()
+        return response.json()["scores"]
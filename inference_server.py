@@ -0,0 +1,238 @@
+# inference_server.py
+"""
+로컬 추론 서버
+
+ChatLlamaCpp 기반 LLM 체인, 임베딩 모델, 리트리버, 재순위화기를 한 프로세스에만 로드하고
+프론트엔드 워커(INFERENCE_SERVER_URL이 설정된 app.py)의 요청을 HTTP로 처리합니다.
+짧은 시간 창 안에 들어온 검색 요청은 묶어서 한 번에 임베딩합니다. LLM 체인 호출은 공유 슬롯
+안에서 요청별로 실행되며, 클라이언트가 연결을 끊으면(예: 폐기된 추측 생성) 즉시 취소됩니다.
+
+실행 예시:
+    uvicorn inference_server:app --host 127.0.0.1 --port 8000
+"""
+from utils.executor_pools import (  # BLAS/OpenMP 스레드 수 설정을 위해 가장 먼저 import
+    run_in_pool, pool_report, start_pool_reporter, describe_partition
+)
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from utils.inference_client import encode, decode
+from utils.logging_config import setup_logging
+from utils import llm_model_inference
+from utils.vector_db_retrievers import (
+    get_active, hf_embeddings, retrieve_with_embedding, start_snapshot_watcher, product_catalog
+)
+from utils.document_rerankers import reranker
+
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '10'))
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '8'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', str(llm_model_inference.LLM_MAX_CONCURRENCY)))
+# 체인 실행 중 클라이언트 연결 종료를 확인하는 주기(초)
+DISCONNECT_POLL_SECONDS = float(os.getenv('DISCONNECT_POLL_MS', '100')) / 1000
+
+logger = setup_logging()
+# 모든 체인 배처가 공유하는 LLM 호출 슬롯
+llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+class RequestBatcher:
+    """
+    짧은 시간 창 동안 들어온 요청을 모아 한 번에 처리하는 배처
+
+    Attributes:
+        name (str): 배처 이름 (로그용)
+        process (Callable): 입력 목록을 받아 같은 순서의 결과 목록을 반환하는 코루틴 함수
+        window (float): 첫 요청 이후 추가 요청을 기다리는 시간(초)
+        max_batch_size (int): 한 번에 처리할 최대 요청 수
+    """
+    def __init__(self, name: str, process: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.name = name
+        self.process = process
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """요청을 큐에 넣고 결과를 기다립니다."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # 기다리는 동안 취소된 요청은 실행하지 않음
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await self.process(items)
+            except Exception as e:
+                results = [e] * len(items)
+
+            logger.debug(f"{self.name} batch of {len(items)} processed")
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+async def invoke_in_slot(chain, item):
+    """
+    모든 체인이 하나의 LLM을 공유하므로, 체인과 관계없이 동시에 실행되는 LLM 호출 수를
+    공유 세마포어로 LLM_MAX_CONCURRENCY개로 제한합니다 (단일 컨텍스트 ChatLlamaCpp는 1개씩 순차 실행).
+    """
+    async with llm_slots:
+        return await chain.ainvoke(item)
+
+
+async def cancel_on_disconnect(request: Request, coro: Awaitable[Any]) -> Any:
+    """
+    클라이언트가 연결을 끊으면 실행 중인 작업을 취소합니다.
+    취소는 슬롯 대기 중이면 슬롯을 잡지 않게 하고, 생성 중이면 배칭 엔진의 시퀀스를 반환하게 합니다.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                logger.debug("Client disconnected, chain call cancelled")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def process_retrievals(items: List[Tuple[str, Optional[List[float]]]]) -> List[Any]:
+    """
+    임베딩이 없는 질문만 한 번의 배치로 임베딩한 뒤 질문별 검색을 수행합니다.
+    (프론트엔드가 세션 캐시 조회에 쓴 임베딩을 함께 보내면 다시 계산하지 않음)
+    """
+    active = get_active()
+    missing = [question for question, embedding in items if embedding is None]
+    computed = iter(await run_in_pool('embedding', hf_embeddings.embed_documents, missing) if missing else [])
+    embeddings = [embedding if embedding is not None else next(computed) for _, embedding in items]
+    return await asyncio.gather(*[
+        run_in_pool('search', retrieve_with_embedding, question, embedding, active)
+        for (question, _), embedding in zip(items, embeddings)
+    ], return_exceptions=True)
+
+
+class ChainRequest(BaseModel):
+    input: dict
+
+
+class RetrieveRequest(BaseModel):
+    question: str
+    embedding: Optional[List[float]] = None
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+
+class VectorsRequest(BaseModel):
+    ids: List[str]
+
+
+class RerankRequest(BaseModel):
+    question: str
+    texts: List[str]
+
+
+app = FastAPI(title="Hana Travlog inference server")
+batchers = {}
+
+
+@app.on_event("startup")
+async def start_batchers():
+    batchers["retrieve"] = RequestBatcher("retrieve", process_retrievals)
+    for batcher in batchers.values():
+        batcher.start()
+    start_snapshot_watcher()
+    start_pool_reporter(logger)
+    for line in describe_partition():
+        logger.info(f"Pool partition - {line}")
+    logger.info("Inference server ready")
+
+
+@app.get("/health")
+async def health():
+    status = {"status": "ok", "corpus_version": get_active().version, "pools": pool_report(),
+              "llm_max_concurrency": LLM_MAX_CONCURRENCY}
+    engine = getattr(llm_model_inference.llm, "engine", None)
+    if engine is not None:
+        status["llm_throughput"] = engine.throughput()
+    return status
+
+
+@app.get("/catalog")
+async def catalog():
+    # 전체 문서 메타데이터를 훑으므로 이벤트 루프 대신 검색 풀에서 실행 (버전과 목록은 같은 스냅샷 기준)
+    active = get_active()
+    return {"corpus_version": active.version, "catalog": await run_in_pool('search', product_catalog, active)}
+
+
+@app.post("/chains/{name}")
+async def invoke_chain(name: str, request: ChainRequest, http_request: Request):
+    if name not in llm_model_inference.CHAIN_NAMES:
+        raise HTTPException(status_code=404, detail=f"Unknown chain: {name}")
+    chain = getattr(llm_model_inference, name)
+    output = await cancel_on_disconnect(http_request, invoke_in_slot(chain, decode(request.input)))
+    return {"output": output}
+
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest):
+    documents = await batchers["retrieve"].submit((request.question, request.embedding))
+    return {"documents": encode(documents)}
+
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    embeddings = await run_in_pool('embedding', hf_embeddings.embed_documents, request.texts)
+    return {"embeddings": embeddings}
+
+
+@app.post("/vectors")
+async def vectors(request: VectorsRequest):
+    vectors = await run_in_pool('search', get_active().chunk_vectors, request.ids)
+    return {"vectors": vectors}
+
+
+@app.post("/rerank")
+async def rerank(request: RerankRequest):
+    if reranker is None:
+        raise HTTPException(status_code=503, detail="Reranker is not loaded (GRADING_MODE != rerank)")
+    scores = await run_in_pool('embedding', reranker.score, request.question, request.texts)
+    return {"scores": scores}
@@ -0,0 +1,488 @@
+### llama_batch_backend.py
+"""
+llama.cpp 연속 배칭(continuous batching) 백엔드
+
+여러 세션/노드에서 동시에 들어온 체인 호출을 하나의 llama.cpp 컨텍스트에 서로 다른
+sequence id로 올려, 프롬프트 평가와 토큰 디코딩을 한 번의 llama_decode로 함께 처리합니다.
+생성된 토큰은 호출자별 future/스트림으로 전달됩니다.
+
+LLM_BACKEND=batched로 설정하면 llm_model_inference가 ChatLlamaCpp 대신 BatchedChatLlama를 사용합니다.
+"""
+import asyncio
+import codecs
+import concurrent.futures
+import ctypes
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.executor_pools import pin_current_thread
+
+REPEAT_LAST_N = 64
+TOP_K = 40
+TOP_P = 0.95
+
+# Llama 3.1 채팅 템플릿
+ROLE_NAMES = {"human": "user", "ai": "assistant", "system": "system"}
+
+logger = logging.getLogger('ChatbotLogger')
+
+
+def _kv_seq_rm(ctx, seq_id: int, p0: int = -1):
+    """llama-cpp-python 버전에 맞는 KV 캐시 시퀀스 삭제 함수를 호출합니다 (p0 위치부터 끝까지, -1이면 전체)."""
+    if hasattr(llama_cpp, 'llama_memory_seq_rm'):
+        llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(ctx), seq_id, p0, -1)
+    elif hasattr(llama_cpp, 'llama_kv_self_seq_rm'):
+        llama_cpp.llama_kv_self_seq_rm(ctx, seq_id, p0, -1)
+    else:
+        llama_cpp.llama_kv_cache_seq_rm(ctx, seq_id, p0, -1)
+
+
+def _held_back(text: str, stops: List[str]) -> int:
+    """text 끝부분 중 stop 문자열의 앞부분과 일치해 아직 내보내면 안 되는 길이"""
+    held = 0
+    for stop in stops:
+        for size in range(min(len(stop) - 1, len(text)), held, -1):
+            if text.endswith(stop[:size]):
+                held = size
+                break
+    return held
+
+
+@dataclass
+class _Sequence:
+    """엔진 안에서 처리 중인 하나의 생성 요청"""
+    prompt_tokens: List[int]
+    max_tokens: int
+    temperature: float
+    stop: List[str]
+    future: concurrent.futures.Future
+    on_token: Optional[Callable[[str], None]] = None
+    seq_id: int = -1
+    admitted: int = -1
+    n_prompt_done: int = 0
+    n_past: int = 0
+    last_token: Optional[int] = None
+    logit_index: Optional[int] = None
+    generated: List[int] = field(default_factory=list)
+    text: str = ""
+    n_sent: int = 0
+    stopped: bool = False
+    decoder: Any = field(default_factory=lambda: codecs.getincrementaldecoder('utf-8')(errors='replace'))
+
+    @property
+    def prompt_done(self) -> bool:
+        return self.n_prompt_done >= len(self.prompt_tokens)
+
+
+class BatchedLlamaEngine:
+    """
+    하나의 llama.cpp 컨텍스트에서 최대 n_parallel개의 시퀀스를 함께 디코딩하는 엔진
+    전용 스레드 하나가 컨텍스트를 소유하므로 여러 스레드/이벤트 루프에서 안전하게 호출할 수 있습니다.
+
+    Attributes:
+        n_parallel (int): 동시에 디코딩할 최대 시퀀스 수
+        n_ctx_per_seq (int): 시퀀스당 컨텍스트 길이
+        n_batch (int): llama_decode 한 번에 넣을 최대 토큰 수
+    """
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_batch: int = 512, n_threads: int = 4,
+                 n_gpu_layers: int = 0, n_parallel: int = 4, repeat_penalty: float = 1.1):
+        self.n_parallel = n_parallel
+        self.n_ctx_per_seq = n_ctx
+        self.n_batch = n_batch
+        self.repeat_penalty = repeat_penalty
+
+        # 모델 가중치와 토크나이저만 사용 (기본 컨텍스트는 최소 크기)
+        self.llama = Llama(
+            model_path=model_path, n_ctx=64, n_batch=8, n_threads=n_threads,
+            n_gpu_layers=n_gpu_layers, verbose=False
+        )
+        self.n_vocab = self.llama.n_vocab()
+        self.stop_tokens = {self.llama.token_eos()}
+        self.stop_tokens.update(self.llama.tokenize(b"<|eot_id|>", add_bos=False, special=True))
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx * n_parallel  # KV 캐시를 시퀀스들이 나눠 사용
+        params.n_batch = n_batch
+        params.n_seq_max = n_parallel
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+        self.ctx = llama_cpp.llama_new_context_with_model(self.llama.model, params)
+        if not self.ctx:
+            raise RuntimeError("Failed to create batched llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_parallel)
+
+        self.pending = queue.Queue()
+        self.free_seq_ids = list(range(n_parallel))
+        self.active: Dict[int, _Sequence] = {}
+        self.rng = np.random.default_rng()
+        self._rollback: Dict[int, tuple] = {}
+        self._rollback_prompt_tokens = 0
+        self._admissions = 0
+
+        self.stats = {"decode_calls": 0, "prompt_tokens": 0, "generated_tokens": 0,
+                      "busy_seconds": 0.0, "max_active": 0}
+        self._thread = threading.Thread(target=self._loop, name="llama-batch-engine", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------ public
+
+    def submit(self, prompt: str, max_tokens: int = 512, temperature: float = 0.1,
+               stop: Optional[List[str]] = None,
+               on_token: Optional[Callable[[str], None]] = None) -> concurrent.futures.Future:
+        """
+        생성 요청을 큐에 넣습니다.
+
+        Args:
+            prompt (str): 채팅 템플릿이 적용된 프롬프트
+            max_tokens (int): 최대 생성 토큰 수
+            temperature (float): 샘플링 온도 (0 이하면 greedy)
+            stop (Optional[List[str]]): 생성을 멈출 문자열
+            on_token (Optional[Callable]): 디코딩된 텍스트 조각마다 엔진 스레드에서 호출되는 콜백
+
+        Returns:
+            concurrent.futures.Future: 완성된 텍스트. cancel()하면 시퀀스 슬롯을 즉시 반환
+        """
+        future = concurrent.futures.Future()
+        tokens = self.llama.tokenize(prompt.encode('utf-8'), add_bos=False, special=True)
+        budget = self.n_ctx_per_seq - len(tokens)
+        if budget <= 0:
+            future.set_exception(ValueError(f"Prompt too long: {len(tokens)} tokens"))
+            return future
+
+        self.pending.put(_Sequence(
+            prompt_tokens=tokens,
+            max_tokens=min(max_tokens, budget),
+            temperature=temperature,
+            stop=stop or [],
+            future=future,
+            on_token=on_token
+        ))
+        return future
+
+    def throughput(self) -> Dict[str, float]:
+        """누적 처리량 통계 (tokens/sec 포함)"""
+        stats = dict(self.stats)
+        busy = stats["busy_seconds"] or 1e-9
+        stats["generated_tokens_per_sec"] = stats["generated_tokens"] / busy
+        stats["tokens_per_decode"] = (
+            (stats["prompt_tokens"] + stats["generated_tokens"]) / max(1, stats["decode_calls"])
+        )
+        return stats
+
+    # ----------------------------------------------------------------- engine
+
+    def _admit(self, block: bool):
+        """빈 슬롯만큼 대기 중인 요청을 활성 시퀀스로 올립니다."""
+        while self.free_seq_ids:
+            try:
+                seq = self.pending.get(block=block and not self.active, timeout=None)
+            except queue.Empty:
+                return
+            block = False
+            if seq.future.cancelled():
+                continue
+            seq.seq_id = self.free_seq_ids.pop()
+            seq.admitted = self._admissions
+            self._admissions += 1
+            # KV 캐시 삭제가 실패해도 _fail_all이 찾을 수 있도록 먼저 활성 목록에 등록
+            self.active[seq.seq_id] = seq
+            _kv_seq_rm(self.ctx, seq.seq_id)
+            self.stats["max_active"] = max(self.stats["max_active"], len(self.active))
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None):
+        """시퀀스를 종료하고 KV 캐시와 슬롯을 반환합니다."""
+        self.active.pop(seq.seq_id, None)
+        _kv_seq_rm(self.ctx, seq.seq_id)
+        self.free_seq_ids.append(seq.seq_id)
+        if seq.future.cancelled():
+            return
+        try:
+            if error is not None:
+                seq.future.set_exception(error)
+                return
+            if not seq.stopped:
+                seq.text += seq.decoder.decode(b"", final=True)
+            try:
+                self._send(seq, len(seq.text))
+            except Exception as e:
+                seq.future.set_exception(e)
+                return
+            seq.future.set_result(seq.text)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _send(self, seq: _Sequence, upto: int):
+        """아직 전달하지 않은 텍스트를 upto 위치까지 on_token 콜백으로 전달합니다."""
+        if upto > seq.n_sent:
+            if seq.on_token is not None:
+                seq.on_token(seq.text[seq.n_sent:upto])
+            seq.n_sent = upto
+
+    def _fill_batch(self) -> int:
+        """
+        디코딩 중인 시퀀스의 다음 토큰과 프롬프트 토큰으로 배치를 채웁니다.
+        llama_decode가 실패하면 되돌릴 수 있도록 시퀀스별 진행 위치와 프롬프트 토큰 수를 기록합니다.
+        """
+        n = 0
+        self._rollback = {seq.seq_id: (seq.n_past, seq.n_prompt_done) for seq in self.active.values()}
+        self._rollback_prompt_tokens = self.stats["prompt_tokens"]
+
+        def add(token, pos, seq_id, logits):
+            nonlocal n
+            self.batch.token[n] = token
+            self.batch.pos[n] = pos
+            self.batch.n_seq_id[n] = 1
+            self.batch.seq_id[n][0] = seq_id
+            self.batch.logits[n] = logits
+            n += 1
+
+        # 생성 단계 시퀀스 우선 (토큰당 지연시간 유지)
+        for seq in self.active.values():
+            seq.logit_index = None
+            if seq.prompt_done and seq.last_token is not None and n < self.n_batch:
+                seq.logit_index = n
+                add(seq.last_token, seq.n_past, seq.seq_id, True)
+                seq.n_past += 1
+
+        # 남은 자리에 프롬프트 평가를 청크 단위로 채움
+        for seq in self.active.values():
+            if seq.prompt_done or n >= self.n_batch:
+                continue
+            take = min(self.n_batch - n, len(seq.prompt_tokens) - seq.n_prompt_done)
+            for i in range(take):
+                position = seq.n_prompt_done + i
+                is_last = position == len(seq.prompt_tokens) - 1
+                if is_last:
+                    seq.logit_index = n
+                add(seq.prompt_tokens[position], position, seq.seq_id, is_last)
+            seq.n_prompt_done += take
+            seq.n_past = seq.n_prompt_done
+            self.stats["prompt_tokens"] += take
+
+        self.batch.n_tokens = n
+        return n
+
+    def _sample(self, seq: _Sequence, logits: np.ndarray) -> int:
+        """repeat penalty, top-k, top-p, temperature를 적용해 다음 토큰을 고릅니다."""
+        logits = logits.astype(np.float64, copy=True)
+        recent = (seq.prompt_tokens + seq.generated)[-REPEAT_LAST_N:]
+        if recent and self.repeat_penalty != 1.0:
+            recent = np.unique(recent)
+            values = logits[recent]
+            logits[recent] = np.where(values > 0, values / self.repeat_penalty, values * self.repeat_penalty)
+
+        if seq.temperature <= 0:
+            return int(np.argmax(logits))
+
+        top = np.argpartition(-logits, TOP_K)[:TOP_K]
+        top = top[np.argsort(-logits[top])]
+        scaled = logits[top] / seq.temperature
+        probs = np.exp(scaled - scaled.max())
+        probs /= probs.sum()
+        keep = max(1, int(np.searchsorted(np.cumsum(probs), TOP_P) + 1))
+        probs = probs[:keep] / probs[:keep].sum()
+        return int(top[self.rng.choice(keep, p=probs)])
+
+    def _emit(self, seq: _Sequence, token: int) -> bool:
+        """토큰을 텍스트로 변환해 전달하고, 생성을 계속할지 반환합니다."""
+        if token in self.stop_tokens:
+            return False
+
+        seq.generated.append(token)
+        seq.last_token = token
+        piece = seq.decoder.decode(self.llama.detokenize([token]))
+        if piece:
+            seq.text += piece
+            for stop in seq.stop:
+                index = seq.text.find(stop)
+                if index != -1:
+                    seq.text = seq.text[:index]
+                    seq.stopped = True
+                    return False
+            # stop 문자열의 앞부분일 수 있는 끝부분은 다음 토큰으로 판별될 때까지 보류
+            self._send(seq, len(seq.text) - _held_back(seq.text, seq.stop))
+
+        return len(seq.generated) < seq.max_tokens
+
+    def _rollback_batch(self):
+        """
+        실패한 llama_decode 이전 상태로 모든 활성 시퀀스의 위치를 되돌리고,
+        배치에서 KV 캐시에 일부 기록되었을 수 있는 항목을 지웁니다.
+        """
+        for seq in self.active.values():
+            n_past, n_prompt_done = self._rollback.get(seq.seq_id, (seq.n_past, seq.n_prompt_done))
+            seq.n_past, seq.n_prompt_done = n_past, n_prompt_done
+            seq.logit_index = None
+            _kv_seq_rm(self.ctx, seq.seq_id, n_past)
+        self.stats["prompt_tokens"] = self._rollback_prompt_tokens
+
+    def _victim(self) -> _Sequence:
+        """llama_decode 실패 시 포기할 시퀀스 (가장 나중에 들어온 시퀀스)"""
+        return max(self.active.values(), key=lambda s: s.admitted)
+
+    def _fail_all(self, error: Exception):
+        """
+        예상하지 못한 오류가 나면 활성/대기 중인 모든 요청을 실패 처리하고
+        KV 캐시와 배치를 비워 엔진이 새 요청을 계속 처리할 수 있게 합니다.
+        """
+        sequences = list(self.active.values())
+        self.active.clear()
+        while True:
+            try:
+                sequences.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+
+        self.free_seq_ids = list(range(self.n_parallel))
+        for seq_id in self.free_seq_ids:
+            try:
+                _kv_seq_rm(self.ctx, seq_id)
+            except Exception:
+                pass
+        self.batch.n_tokens = 0
+        self._rollback = {}
+
+        for seq in sequences:
+            try:
+                seq.future.set_exception(error)
+            except concurrent.futures.InvalidStateError:
+                pass
+
+    def _read_logits(self, seq: _Sequence) -> np.ndarray:
+        pointer = llama_cpp.llama_get_logits_ith(self.ctx, seq.logit_index)
+        return np.ctypeslib.as_array(
+            ctypes.cast(pointer, ctypes.POINTER(ctypes.c_float)), shape=(self.n_vocab,)
+        )
+
+    def _step(self):
+        """대기 요청을 받아 한 번의 llama_decode를 실행하고 시퀀스별 다음 토큰을 전달합니다."""
+        self._admit(block=True)
+
+        for seq in [s for s in self.active.values() if s.future.cancelled()]:
+            self._finish(seq)
+        if not self.active:
+            return
+
+        n_tokens = self._fill_batch()
+        if n_tokens == 0:
+            return
+
+        start = time.perf_counter()
+        result = llama_cpp.llama_decode(self.ctx, self.batch)
+        self.stats["decode_calls"] += 1
+
+        if result != 0:
+            # KV 캐시 부족 등: 모든 시퀀스를 배치 이전 위치로 되돌린 뒤
+            # 가장 나중에 들어온 시퀀스만 실패 처리하고 나머지는 다음 배치에서 다시 디코딩
+            self._rollback_batch()
+            self._finish(self._victim(), RuntimeError(f"llama_decode failed with code {result}"))
+            return
+
+        for seq in list(self.active.values()):
+            if seq.logit_index is None:
+                continue
+            # logits 포인터 오류나 샘플링 오류(NaN 확률 등)는 해당 시퀀스만 실패 처리
+            try:
+                token = self._sample(seq, self._read_logits(seq))
+                self.stats["generated_tokens"] += 1
+                keep_going = self._emit(seq, token)
+            except Exception as e:
+                self._finish(seq, e)
+                continue
+            if not keep_going:
+                self._finish(seq)
+
+        self.stats["busy_seconds"] += time.perf_counter() - start
+
+    def _loop(self):
+        # llama.cpp 연산 스레드가 LLM 풀의 코어를 상속하도록 디코딩 스레드를 고정
+        pin_current_thread('llm')
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                # 엔진 스레드가 죽으면 모든 호출자가 future.result()에서 멈추므로 실패를 전달하고 계속 실행
+                logger.exception("Batched llama engine step failed")
+                self._fail_all(e)
+
+
+def format_llama3_prompt(messages: List[BaseMessage]) -> str:
+    """LangChain 메시지에 Llama 3.1 채팅 템플릿을 적용합니다."""
+    parts = ["<|begin_of_text|>"]
+    for message in messages:
+        role = ROLE_NAMES.get(message.type, "user")
+        parts.append(f"<|start_header_id|>{role}<|end_header_id|>\n\n{message.content}<|eot_id|>")
+    parts.append("<|start_header_id|>assistant<|end_header_id|>\n\n")
+    return "".join(parts)
+
+
+class BatchedChatLlama(BaseChatModel):
+    """
+    BatchedLlamaEngine을 사용하는 LangChain 채팅 모델
+    ChatLlamaCpp와 같은 프롬프트/파서 체인에 그대로 연결할 수 있습니다.
+    """
+    engine: Any
+    max_tokens: int = 512
+    temperature: float = 0.1
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched-llama-cpp"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        future = self.engine.submit(
+            format_llama3_prompt(messages), self.max_tokens, self.temperature, stop,
+            on_token=run_manager.on_llm_new_token if run_manager else None
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=future.result()))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = ""
+        async for chunk in self._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            text += chunk.message.content
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        tokens = queue.Queue()
+        future = self.engine.submit(
+            format_llama3_prompt(messages), self.max_tokens, self.temperature, stop, on_token=tokens.put
+        )
+        future.add_done_callback(lambda _: tokens.put(None))
+        while (piece := tokens.get()) is not None:
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        future.result()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+        future = self.engine.submit(
+            format_llama3_prompt(messages), self.max_tokens, self.temperature, stop,
+            on_token=lambda piece: loop.call_soon_threadsafe(tokens.put_nowait, piece)
+        )
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(tokens.put_nowait, None))
+        try:
+            while (piece := await tokens.get()) is not None:
+                if run_manager:
+                    await run_manager.on_llm_new_token(piece)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            future.result()
+        except asyncio.CancelledError:
+            # 호출자가 취소하면(예: 추측 생성 폐기) 엔진 슬롯도 즉시 반환
+            future.cancel()
+            raise
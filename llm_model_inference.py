@@ -1,11 +1,12 @@
 ### llm_model_inference.py
 import os
-import multiprocessing
 from langchain_community.chat_models import ChatLlamaCpp
 from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from utils.llm_prompts_templates import *
+from utils.inference_client import INFERENCE_SERVER_URL, RemoteChain, server_llm_concurrency
+from utils.executor_pools import LLM_THREADS, run_in_pool
 import streamlit as st
 
 # LLM 모델 경로 설정
@@ -15,31 +16,102 @@ model_path = os.path.join('models', 'llm_model', 'Meta-Llama-3.1-8B-Instruct-Q6_
 # 콜백 설정
 callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
 
+# LLM 백엔드: 'llamacpp' (ChatLlamaCpp, 기본값) 또는 'batched' (다중 시퀀스 연속 배칭)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'llamacpp')
+LLM_PARALLEL_SEQUENCES = int(os.getenv('LLM_PARALLEL_SEQUENCES', '4'))
+
+# 한 요청 안에서 동시에 보낼 LLM 호출 수
+# ChatLlamaCpp 컨텍스트는 스레드 안전하지 않으므로 순차 실행, 연속 배칭 백엔드와 추론 서버는 큐로 받으므로 병렬 제출
+if LLM_BACKEND == 'batched':
+    LLM_MAX_CONCURRENCY = LLM_PARALLEL_SEQUENCES
+elif INFERENCE_SERVER_URL:
+    LLM_MAX_CONCURRENCY = 8
+else:
+    LLM_MAX_CONCURRENCY = 1
+
+
+def llm_parallelism() -> int:
+    """
+    LLM이 실제로 동시에 디코딩할 수 있는 요청 수 (추측 생성 사용 여부 판단용)
+    프론트엔드 모드에서는 요청 제출 수(LLM_MAX_CONCURRENCY)가 아니라 추론 서버의 백엔드 기준으로 판단합니다.
+    """
+    if INFERENCE_SERVER_URL:
+        return server_llm_concurrency()
+    return LLM_MAX_CONCURRENCY
+
+class PooledChatLlamaCpp(ChatLlamaCpp):
+    """
+    비동기 호출 시 동기 모델 호출(_generate)만 LLM 풀에서 실행하는 ChatLlamaCpp
+    출력 파서와 콜백 등 나머지 작업은 이벤트 루프의 기본 executor를 그대로 사용하므로
+    긴 디코딩 뒤에 줄을 서지 않고, LLM 풀 사용률에는 모델 호출만 기록됩니다.
+    """
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await run_in_pool(
+            'llm', self._generate, messages, stop, run_manager.get_sync() if run_manager else None, **kwargs
+        )
+
+
 # LLM Model instance
 @st.cache_resource
 def load_llm_model():
-    return ChatLlamaCpp(
+    if LLM_BACKEND == 'batched':
+        from utils.llama_batch_backend import BatchedLlamaEngine, BatchedChatLlama
+
+        engine = BatchedLlamaEngine(
+            model_path=model_path,
+            n_ctx=2048,
+            n_batch=512,
+            n_threads=LLM_THREADS,
+            n_gpu_layers=10,
+            n_parallel=LLM_PARALLEL_SEQUENCES,
+            repeat_penalty=1.1,
+        )
+        return BatchedChatLlama(
+            engine=engine,
+            max_tokens=512,
+            temperature=0.1,
+            callback_manager=callback_manager,
+        )
+
+    return PooledChatLlamaCpp(
         model_path=model_path,
         n_ctx=2048,
         n_gpu_layers=10,
         n_batch=128,
         max_tokens=512,
         callback_manager=callback_manager,
-        n_threads=max(1, multiprocessing.cpu_count() // 2),
+        n_threads=LLM_THREADS,
         repeat_penalty=1.1,
         temperature=0.1,
         verbose=False,
     )
 
-# 모델 인스턴스 가져오기
-llm = load_llm_model()
-
-# 각 프롬프트와 LLM 연결
-chat_vs_docs_grader = chat_vs_docs_prompt | llm | JsonOutputParser()
-chat_type_grader = chat_type_prompt | llm | JsonOutputParser()
-retrieval_grader = retrieval_prompt | llm | StrOutputParser()
-rag_chain = generate_prompt | llm | StrOutputParser()
-chat_generator = chat_generate_prompt | llm | StrOutputParser()
-hallucination_grader = hallucination_prompt | llm | JsonOutputParser()
-answer_grader = answer_prompt | llm | JsonOutputParser()
-question_rewriter = re_write_prompt | llm | StrOutputParser()
+CHAIN_NAMES = [
+    'chat_vs_docs_grader', 'chat_type_grader', 'retrieval_grader', 'rag_chain',
+    'chat_generator', 'hallucination_grader', 'answer_grader', 'question_rewriter'
+]
+
+if INFERENCE_SERVER_URL:
+    # 프론트엔드 워커: 모델은 추론 서버에만 로드하고 체인 호출은 프록시로 전달
+    llm = None
+    chat_vs_docs_grader = RemoteChain('chat_vs_docs_grader')
+    chat_type_grader = RemoteChain('chat_type_grader')
+    retrieval_grader = RemoteChain('retrieval_grader')
+    rag_chain = RemoteChain('rag_chain')
+    chat_generator = RemoteChain('chat_generator')
+    hallucination_grader = RemoteChain('hallucination_grader')
+    answer_grader = RemoteChain('answer_grader')
+    question_rewriter = RemoteChain('question_rewriter')
+else:
+    # 모델 인스턴스 가져오기
+    llm = load_llm_model()
+
+    # 각 프롬프트와 LLM 연결
+    chat_vs_docs_grader = chat_vs_docs_prompt | llm | JsonOutputParser()
+    chat_type_grader = chat_type_prompt | llm | JsonOutputParser()
+    retrieval_grader = retrieval_prompt | llm | StrOutputParser()
+    rag_chain = generate_prompt | llm | StrOutputParser()
+    chat_generator = chat_generate_prompt | llm | StrOutputParser()
+    hallucination_grader = hallucination_prompt | llm | JsonOutputParser()
+    answer_grader = answer_prompt | llm | JsonOutputParser()
+    question_rewriter = re_write_prompt | llm | StrOutputParser()
@@ -1,43 +1,174 @@
 ### logging_config.py
+import atexit
+import contextvars
+import copy
+import functools
+import inspect
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
 from datetime import datetime
 
+# 디버그 로그 샘플링 비율 (0~1, INFO 이상은 항상 기록)
+DEBUG_SAMPLE_RATE = float(os.getenv('DEBUG_SAMPLE_RATE', '0.1'))
+
+# 요청 단위 컨텍스트 (asyncio 태스크별로 분리됨)
+session_id_var = contextvars.ContextVar('session_id', default=None)
+node_var = contextvars.ContextVar('node', default=None)
+
+# 레코드의 extra로 전달되면 JSON에 포함할 필드
+EXTRA_FIELDS = ('elapsed_ms', 'event', 'precheck')
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class ContextFilter(logging.Filter):
+    """세션 ID와 현재 노드 이름을 레코드에 추가"""
+    def filter(self, record):
+        record.session_id = session_id_var.get()
+        record.node = node_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUG 레코드를 sample_rate 비율로만 통과시킴"""
+    def __init__(self, sample_rate: float = DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    """한 줄에 하나의 JSON 객체로 기록하는 포매터"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "session_id": getattr(record, 'session_id', None),
+            "node": getattr(record, 'node', None),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for field in EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    traceback을 메시지에 합치지 않고 exc_text로 넘기는 QueueHandler
+    (기본 prepare()는 traceback을 메시지에 포함시켜 JSON의 exc_info 필드가 비게 됨)
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # 리스너 스레드에서 다시 포맷할 수 있도록 인자와 traceback 객체는 제거
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
 def setup_logging():
-    # 로그 디렉토리 생성
-    log_dir = 'logs'
-    os.makedirs(log_dir, exist_ok=True)
+    """
+    ChatbotLogger를 설정해 반환합니다. 여러 번 호출해도 핸들러는 한 번만 추가됩니다.
 
-    # 로그 파일 이름 (날짜 기반)
-    log_file = os.path.join(log_dir, f'chatbot_{datetime.now().strftime("%Y%m%d")}.log')
+    로거에는 QueueHandler만 붙고, 콘솔/파일 출력은 QueueListener 스레드가 처리하므로
+    이벤트 루프에서의 로그 호출 비용은 큐에 넣는 정도입니다.
+    파일에는 세션 ID, 노드 이름, 소요 시간을 포함한 JSON이 기록됩니다.
+    """
+    global _listener
 
-    # 로거 설정
     logger = logging.getLogger('ChatbotLogger')
-    logger.setLevel(logging.DEBUG)
-
-    # 콘솔 핸들러
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-
-    # 파일 핸들러 (로테이션)
-    file_handler = logging.handlers.RotatingFileHandler(
-        log_file,
-        maxBytes=10*1024*1024,
-        backupCount=5
-    )
-    file_handler.setLevel(logging.DEBUG)
-
-    # 포맷터 설정
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
-
-    # 핸들러 추가
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    return logger
\ No newline at end of file
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+
+        # 로그 디렉토리 생성
+        log_dir = 'logs'
+        os.makedirs(log_dir, exist_ok=True)
+
+        # 로그 파일 이름 (날짜 기반)
+        log_file = os.path.join(log_dir, f'chatbot_{datetime.now().strftime("%Y%m%d")}.log')
+
+        # 로거 설정
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+
+        # 콘솔 핸들러
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+        # 파일 핸들러 (로테이션, JSON)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=10*1024*1024,
+            backupCount=5,
+            encoding='utf-8'
+        )
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(JsonFormatter())
+
+        # 로거에는 큐 핸들러만 추가하고 실제 출력은 리스너 스레드에서 처리
+        log_queue = queue.SimpleQueue()
+        queue_handler = StructuredQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSamplingFilter())
+        queue_handler.addFilter(ContextFilter())
+        logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    return logger
+
+
+def timed_node(name, func):
+    """
+    그래프 노드를 감싸 노드 이름을 컨텍스트에 설정하고 소요 시간을 DEBUG로 기록합니다.
+
+    Args:
+        name (str): 노드 이름
+        func (Callable): 비동기 노드 함수 (config 인자를 받으면 그대로 전달)
+
+    Returns:
+        Callable: 감싼 노드 함수
+    """
+    logger = logging.getLogger('ChatbotLogger')
+    # functools.wraps로 원래 시그니처가 노출되므로 LangGraph는 func가 받을 때만 config를 전달함
+    accepts_config = 'config' in inspect.signature(func).parameters
+
+    @functools.wraps(func)
+    async def wrapper(state, config=None):
+        token = node_var.set(name)
+        started = time.perf_counter()
+        try:
+            if accepts_config:
+                return await func(state, config)
+            return await func(state)
+        finally:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.debug(f"Node {name} finished in {elapsed_ms}ms",
+                         extra={"event": "node", "elapsed_ms": elapsed_ms})
+            node_var.reset(token)
+
+    return wrapper
@@ -0,0 +1,290 @@
+### mmap_index.py
+"""
+멀티 워커 배포를 위한 memory-mapped 인덱스 구성 요소
+
+여러 Gradio/uvicorn 워커가 한 노드에서 실행될 때 인덱스를 프로세스마다 힙에 복사하지 않고
+OS 페이지 캐시를 공유하도록, 스냅샷 파일을 mmap으로 읽는 FAISS 인덱스, docstore, BM25 인덱스를 제공합니다.
+"""
+import json
+import math
+import mmap
+import os
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+
+import faiss
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.schema import BaseRetriever, Document
+
+INDEX_TYPES = ('flat', 'ivf_sq8', 'ivf_pq')
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+
+# rank_bm25.BM25Okapi 기본값
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+
+def build_faiss_index(embeddings: np.ndarray, index_type: str = 'flat', pq_m: int = 16):
+    """
+    임베딩으로 FAISS 인덱스를 생성합니다.
+
+    Args:
+        embeddings (np.ndarray): (n, dim) float32 임베딩
+        index_type (str): 'flat' (정확 검색), 'ivf_sq8' (int8 양자화), 'ivf_pq' (product quantization)
+        pq_m (int): PQ 서브벡터 수 (dim의 약수여야 함)
+
+    Returns:
+        faiss.Index: 학습 및 추가가 끝난 인덱스
+    """
+    n, dim = embeddings.shape
+    if index_type == 'flat' or n == 0:
+        index = faiss.IndexFlatL2(dim)
+        index.add(embeddings)
+        return index
+
+    # 리스트당 학습 샘플이 충분하도록 nlist 결정
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == 'ivf_sq8':
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif index_type == 'ivf_pq':
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def check_recall(index, embeddings: np.ndarray, k: int = 10, sample_size: int = 200, seed: int = 0) -> float:
+    """
+    정확 검색 대비 인덱스의 recall@k를 저장된 임베딩 샘플로 측정합니다.
+
+    Args:
+        index (faiss.Index): 검사할 인덱스
+        embeddings (np.ndarray): 인덱스에 추가된 전체 임베딩
+        k (int): 비교할 이웃 수
+        sample_size (int): 질의로 사용할 샘플 수
+
+    Returns:
+        float: 평균 recall@k (0~1)
+    """
+    n = len(embeddings)
+    if n == 0:
+        return 1.0
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    queries = np.ascontiguousarray(embeddings[rng.choice(n, size=min(sample_size, n), replace=False)])
+
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(np.ascontiguousarray(embeddings))
+    _, truth = exact.search(queries, k)
+
+    if hasattr(index, 'nprobe'):
+        index.nprobe = IVF_NPROBE
+    _, found = index.search(queries, k)
+
+    hits = sum(len(set(t).intersection(f)) for t, f in zip(truth, found))
+    return hits / (len(queries) * k)
+
+
+def read_faiss_index(path: str, index_type: str = 'flat'):
+    """
+    FAISS 인덱스를 가능하면 mmap으로 읽습니다.
+    IVF 인덱스는 inverted list가, flat 인덱스는 벡터(IndexFlatCodes의 codes)가 mmap되어
+    워커 간 페이지 캐시를 공유합니다. mmap을 지원하지 않는 인덱스 형식은 일반 로드로 대체합니다.
+
+    Args:
+        path (str): index.faiss 경로
+        index_type (str): 스냅샷 매니페스트의 인덱스 종류 ('flat', 'ivf_sq8', 'ivf_pq')
+
+    Returns:
+        faiss.Index: 로드된 인덱스
+    """
+    # IO_FLAG_MMAP은 flat 인덱스의 벡터를 힙에 복사하고, IO_FLAG_MMAP_IFC는 IVF 인덱스와 함께 쓸 수 없음
+    mmap_flag = faiss.IO_FLAG_MMAP
+    if index_type == 'flat' and hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+        mmap_flag = faiss.IO_FLAG_MMAP_IFC
+    try:
+        index = faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)
+
+    ivf = faiss.try_extract_index_ivf(index) if hasattr(faiss, 'try_extract_index_ivf') else None
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+        # MMR 재순위화에 필요한 reconstruct() 지원
+        ivf.make_direct_map()
+    return index
+
+
+def write_docstore_offsets(docstore_path: str, offsets_path: str):
+    """
+    docstore.jsonl의 줄 시작 위치를 저장합니다 (마지막 값은 파일 크기).
+
+    Args:
+        docstore_path (str): docstore.jsonl 경로
+        offsets_path (str): 저장할 .npy 경로
+    """
+    offsets = [0]
+    with open(docstore_path, 'rb') as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+    np.save(offsets_path, np.asarray(offsets, dtype='int64'))
+
+
+class MmapDocstore(Docstore, Sequence):
+    """
+    docstore.jsonl을 mmap으로 읽는 docstore
+    FAISS 인덱스 위치를 id로 사용하며, 요청된 문서만 그때그때 Document로 만듭니다.
+    """
+    def __init__(self, docstore_path: str, offsets_path: str):
+        self._file = open(docstore_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = np.load(offsets_path, mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def record(self, position: int) -> Dict:
+        """인덱스 위치의 원본 레코드를 반환합니다."""
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._mmap[start:end])
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        record = self.record(int(position))
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+    def search(self, search: Any):
+        """FAISS 인덱스 위치로 문서를 찾습니다."""
+        try:
+            return self[int(search)]
+        except (IndexError, ValueError):
+            return f"ID {search} not found."
+
+    def close(self):
+        """mmap과 파일 핸들을 닫습니다 (핫스왑으로 교체된 스냅샷 정리용)."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+
+class PositionalIds:
+    """인덱스 위치를 그대로 docstore id로 쓰는 index_to_docstore_id 대체 매핑"""
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self._size:
+            raise KeyError(position)
+        return int(position)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def values(self):
+        return range(self._size)
+
+    def get(self, position, default=None):
+        return int(position) if 0 <= position < self._size else default
+
+
+def write_bm25_index(token_lists: List[List[str]], output_dir: str):
+    """
+    BM25 문서별 가중치를 CSC 희소 행렬로 미리 계산해 .npy 파일로 저장합니다.
+    점수는 rank_bm25.BM25Okapi와 같은 식(k1, b, epsilon)을 사용합니다.
+
+    Args:
+        token_lists (List[List[str]]): 인덱스 순서의 문서 토큰
+        output_dir (str): 저장 디렉토리
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_docs = len(token_lists)
+    doc_lens = np.asarray([len(tokens) for tokens in token_lists], dtype='float32')
+    avgdl = float(doc_lens.mean()) if n_docs else 0.0
+
+    postings: Dict[str, List] = {}
+    for doc_id, tokens in enumerate(token_lists):
+        for term, freq in Counter(tokens).items():
+            postings.setdefault(term, []).append((doc_id, freq))
+
+    idf = {term: math.log(n_docs - len(p) + 0.5) - math.log(len(p) + 0.5) for term, p in postings.items()}
+    average_idf = sum(idf.values()) / len(idf) if idf else 0.0
+    floor = BM25_EPSILON * average_idf
+
+    vocab = {}
+    indptr, indices, data = [0], [], []
+    for term_id, (term, plist) in enumerate(sorted(postings.items())):
+        vocab[term] = term_id
+        term_idf = idf[term] if idf[term] >= 0 else floor
+        for doc_id, freq in plist:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lens[doc_id] / avgdl)
+            indices.append(doc_id)
+            data.append(term_idf * freq * (BM25_K1 + 1) / (freq + norm))
+        indptr.append(len(indices))
+
+    np.save(os.path.join(output_dir, 'indptr.npy'), np.asarray(indptr, dtype='int64'))
+    np.save(os.path.join(output_dir, 'indices.npy'), np.asarray(indices, dtype='int32'))
+    np.save(os.path.join(output_dir, 'data.npy'), np.asarray(data, dtype='float32'))
+    with open(os.path.join(output_dir, 'vocab.json'), 'w', encoding='utf-8') as f:
+        json.dump({'n_docs': n_docs, 'vocab': vocab}, f, ensure_ascii=False)
+
+
+class SharedBM25Index:
+    """write_bm25_index로 저장된 BM25 가중치를 mmap으로 읽어 점수를 계산합니다."""
+    def __init__(self, index_dir: str):
+        self.indptr = np.load(os.path.join(index_dir, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(index_dir, 'indices.npy'), mmap_mode='r')
+        self.data = np.load(os.path.join(index_dir, 'data.npy'), mmap_mode='r')
+        with open(os.path.join(index_dir, 'vocab.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.n_docs = meta['n_docs']
+        self.vocab = meta['vocab']
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """
+        질의 토큰에 대한 문서별 BM25 점수를 계산합니다.
+
+        Args:
+            tokens (List[str]): 질의 토큰
+
+        Returns:
+            np.ndarray: (n_docs,) 점수
+        """
+        scores = np.zeros(self.n_docs, dtype='float32')
+        for token in tokens:
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # 한 용어의 posting 안에서 문서 id는 중복되지 않음
+            scores[self.indices[start:end]] += self.data[start:end]
+        return scores
+
+
+class SharedBM25Retriever(BaseRetriever):
+    """SharedBM25Index와 MmapDocstore를 사용하는 BM25 리트리버"""
+    index: Any
+    docstore: Any
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        scores = self.index.get_scores(query.split())
+        k = min(self.k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self.docstore[int(i)] for i in top]
@@ -0,0 +1,271 @@
+### product_groups.py
+"""
+상품별 문서 그룹 기반 계층 검색
+
+모든 청크를 하나의 인덱스에서 검색하면 형제 트래블로그 상품의 거의 같은 조항이 함께 올라옵니다.
+상품명별 청크 그룹의 중심(centroid) 임베딩으로 먼저 상위 그룹을 고르고(coarse),
+선택된 그룹 안의 청크만 정밀 검색(fine)합니다. 선택적으로 검색된 청크 앞뒤의
+청크를 합쳐 조항 블록 단위로 반환합니다(parent expansion).
+
+스냅샷 파일 (corpus_ingestion.py가 생성, 없으면 로드 시 계산):
+    product_groups.json    그룹 이름(상품명)과 그룹별 청크 위치
+    product_centroids.npy  그룹별 정규화된 중심 임베딩
+    parent_links.npy       청크별 같은 문서 안의 이전/다음 청크 위치 (없으면 -1)
+"""
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+GROUP_KEY = '상품명'
+GROUPS_FILE = 'product_groups.json'
+CENTROIDS_FILE = 'product_centroids.npy'
+PARENT_LINKS_FILE = 'parent_links.npy'
+
+# coarse 단계에서 선택할 상품 그룹 수
+HIERARCHICAL_TOP_GROUPS = int(os.getenv('HIERARCHICAL_TOP_GROUPS', '2'))
+# 검색된 청크 앞뒤로 합칠 청크 수 (0이면 확장하지 않음)
+PARENT_EXPANSION_WINDOW = int(os.getenv('PARENT_EXPANSION_WINDOW', '0'))
+# 인접 청크를 합칠 때 제거할 최대 중복 길이 (청크 overlap 이상)
+MAX_MERGE_OVERLAP = 200
+
+
+def build_product_groups(metadatas: Sequence[Dict]) -> Tuple[List[str], List[List[int]], np.ndarray]:
+    """
+    청크 메타데이터에서 상품명별 그룹과 문서 내 이전/다음 청크 연결을 만듭니다.
+
+    Args:
+        metadatas (Sequence[Dict]): 인덱스 순서의 청크 메타데이터
+
+    Returns:
+        Tuple[List[str], List[List[int]], np.ndarray]: 그룹 이름, 그룹별 청크 위치, (n, 2) 이전/다음 위치
+    """
+    groups: Dict[str, List[int]] = {}
+    sources: Dict[str, List[Tuple[int, int]]] = {}
+    for position, metadata in enumerate(metadatas):
+        groups.setdefault(metadata.get(GROUP_KEY, ''), []).append(position)
+        # 문서 id와 문서 내 순번이 없는 기존 청크는 상품명과 인덱스 순서로 대신함
+        source = metadata.get('source_id') or metadata.get(GROUP_KEY, '')
+        order = metadata.get('chunk_position', position)
+        sources.setdefault(source, []).append((order, position))
+
+    links = np.full((len(metadatas), 2), -1, dtype='int32')
+    for chunks in sources.values():
+        ordered = [position for _, position in sorted(chunks)]
+        for previous, current in zip(ordered, ordered[1:]):
+            links[current, 0] = previous
+            links[previous, 1] = current
+
+    names = sorted(groups)
+    return names, [groups[name] for name in names], links
+
+
+def compute_centroids(embeddings: np.ndarray, positions: List[List[int]]) -> np.ndarray:
+    """그룹별 평균 임베딩을 L2 정규화해 반환합니다."""
+    centroids = np.stack([
+        np.asarray(embeddings[np.asarray(group)], dtype='float32').mean(axis=0) for group in positions
+    ])
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    return centroids / np.maximum(norms, 1e-12)
+
+
+def write_product_groups(output_dir: str, metadatas: Sequence[Dict], embeddings: np.ndarray):
+    """
+    상품 그룹, 중심 임베딩, 이전/다음 청크 연결을 스냅샷 디렉토리에 저장합니다.
+
+    Args:
+        output_dir (str): 스냅샷 디렉토리
+        metadatas (Sequence[Dict]): 인덱스 순서의 청크 메타데이터
+        embeddings (np.ndarray): 인덱스 순서의 임베딩
+    """
+    names, positions, links = build_product_groups(metadatas)
+    with open(os.path.join(output_dir, GROUPS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'names': names, 'positions': positions}, f, ensure_ascii=False)
+    np.save(os.path.join(output_dir, CENTROIDS_FILE), compute_centroids(embeddings, positions))
+    np.save(os.path.join(output_dir, PARENT_LINKS_FILE), links)
+
+
+def merge_overlapping(first: str, second: str, max_overlap: int = MAX_MERGE_OVERLAP) -> str:
+    """청크 overlap으로 중복된 부분을 한 번만 남기고 두 텍스트를 잇습니다."""
+    for size in range(min(max_overlap, len(first), len(second)), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def top_k_in_groups(scores: np.ndarray, docs: Sequence[Document], names: set, k: int) -> List[Document]:
+    """
+    점수 순으로 선택된 그룹에 속한 문서만 k개 반환합니다.
+    k개를 채우거나 점수가 0 이하인 문서(질의 용어가 하나도 없는 문서)에 닿으면 탐색을 멈춥니다.
+
+    Args:
+        scores (np.ndarray): 인덱스 순서의 문서 점수
+        docs (Sequence[Document]): 인덱스 순서의 청크 문서
+        names (set): 선택된 그룹의 상품명
+        k (int): 반환할 문서 수
+
+    Returns:
+        List[Document]: 점수 순의 문서
+    """
+    results = []
+    for position in np.argsort(-np.asarray(scores), kind='stable'):
+        if scores[position] <= 0 or len(results) == k:
+            break
+        doc = docs[int(position)]
+        if doc.metadata.get(GROUP_KEY, '') in names:
+            results.append(doc)
+    return results
+
+
+class ProductGroupIndex:
+    """
+    상품 그룹 중심 임베딩과 청크 임베딩으로 coarse-to-fine 검색을 수행합니다.
+
+    Attributes:
+        names (List[str]): 그룹 이름 (상품명)
+        positions (List[np.ndarray]): 그룹별 청크 위치
+        centroids (np.ndarray): (그룹 수, dim) 정규화된 중심 임베딩
+        embeddings (np.ndarray): (청크 수, dim) 청크 임베딩 (mmap 가능)
+        links (np.ndarray): (청크 수, 2) 이전/다음 청크 위치
+        docs (Sequence[Document]): 인덱스 순서의 청크 문서
+    """
+    def __init__(self, names: List[str], positions: List[List[int]], centroids: np.ndarray,
+                 embeddings: np.ndarray, links: np.ndarray, docs: Sequence[Document]):
+        self.names = names
+        self.positions = [np.asarray(group, dtype='int64') for group in positions]
+        self.centroids = np.asarray(centroids, dtype='float32')
+        self.embeddings = embeddings
+        self.links = links
+        self.docs = docs
+        self.group_ids = {name: i for i, name in enumerate(names)}
+        self._position_by_id = None
+
+    @classmethod
+    def from_embeddings(cls, docs: Sequence[Document], embeddings: np.ndarray) -> 'ProductGroupIndex':
+        """문서 메타데이터와 임베딩에서 그룹을 계산해 생성합니다."""
+        names, positions, links = build_product_groups([doc.metadata for doc in docs])
+        return cls(names, positions, compute_centroids(embeddings, positions), embeddings, links, docs)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir: str, docs: Sequence[Document]) -> 'ProductGroupIndex':
+        """스냅샷의 미리 계산된 그룹 파일을 읽고, 없으면 임베딩에서 계산합니다."""
+        embeddings = np.load(os.path.join(snapshot_dir, 'embeddings.npy'), mmap_mode='r')
+        groups_path = os.path.join(snapshot_dir, GROUPS_FILE)
+        if not os.path.exists(groups_path):
+            return cls.from_embeddings(docs, embeddings)
+
+        with open(groups_path, 'r', encoding='utf-8') as f:
+            groups = json.load(f)
+        return cls(
+            groups['names'],
+            groups['positions'],
+            np.load(os.path.join(snapshot_dir, CENTROIDS_FILE)),
+            embeddings,
+            np.load(os.path.join(snapshot_dir, PARENT_LINKS_FILE), mmap_mode='r'),
+            docs
+        )
+
+    def top_groups(self, embedding: List[float], n: int = HIERARCHICAL_TOP_GROUPS,
+                   forced: Optional[str] = None) -> List[int]:
+        """
+        질문 임베딩과 중심 임베딩의 유사도로 상위 그룹을 고릅니다.
+
+        Args:
+            embedding (List[float]): 정규화된 질문 임베딩
+            n (int): 선택할 그룹 수
+            forced (Optional[str]): 질문에서 추출된 상품명 (있으면 항상 포함)
+
+        Returns:
+            List[int]: 선택된 그룹 번호
+        """
+        scores = self.centroids @ np.asarray(embedding, dtype='float32')
+        ranked = [int(i) for i in np.argsort(-scores)]
+        if forced in self.group_ids:
+            forced_id = self.group_ids[forced]
+            ranked = [forced_id] + [i for i in ranked if i != forced_id]
+        return ranked[:max(1, n)]
+
+    def candidates(self, groups: List[int]) -> np.ndarray:
+        """선택된 그룹에 속한 청크 위치"""
+        return np.concatenate([self.positions[g] for g in groups])
+
+    def dense_search(self, embedding: List[float], candidates: np.ndarray, search_type: str,
+                     k: int, fetch_k: int) -> List[Document]:
+        """
+        후보 청크 안에서 정확한 내적 검색(및 MMR)을 수행합니다.
+
+        Args:
+            embedding (List[float]): 정규화된 질문 임베딩
+            candidates (np.ndarray): 후보 청크 위치
+            search_type (str): "mmr" 또는 "similarity"
+            k (int): 반환할 문서 수
+            fetch_k (int): MMR 전에 가져올 후보 수
+
+        Returns:
+            List[Document]: 검색된 문서
+        """
+        query = np.asarray(embedding, dtype='float32')
+        candidates = np.sort(candidates)
+        vectors = np.asarray(self.embeddings[candidates], dtype='float32')
+        scores = vectors @ query
+
+        limit = min(fetch_k if search_type == "mmr" else k, len(candidates))
+        top = np.argsort(-scores)[:limit]
+        if search_type == "mmr":
+            selected = maximal_marginal_relevance(query, list(vectors[top]), k=min(k, len(top)))
+            top = top[selected]
+        return [self.docs[int(candidates[i])] for i in top]
+
+    def expand(self, documents: List[Document], window: int = PARENT_EXPANSION_WINDOW) -> List[Document]:
+        """
+        검색된 청크마다 같은 문서 안의 앞뒤 window개 청크를 합친 조항 블록을 반환합니다.
+        블록이 겹치는 청크는 한 번만 반환합니다.
+
+        Args:
+            documents (List[Document]): 검색된 청크
+            window (int): 앞뒤로 합칠 청크 수
+
+        Returns:
+            List[Document]: 확장된 문서 (metadata의 id는 원래 청크, parent_ids에 포함된 청크 id)
+        """
+        if window <= 0:
+            return documents
+
+        # 청크 id → 위치 (버전마다 처음 확장할 때 한 번만 계산)
+        if self._position_by_id is None:
+            self._position_by_id = {doc.metadata.get('id'): i for i, doc in enumerate(self.docs)}
+        position_of = self._position_by_id
+
+        expanded, covered = [], set()
+        for doc in documents:
+            center = position_of.get(doc.metadata.get('id'))
+            if center is None:
+                expanded.append(doc)
+                continue
+            if center in covered:
+                continue
+
+            block = [center]
+            for direction in (0, 1):
+                position = center
+                for _ in range(window):
+                    position = int(self.links[position, direction])
+                    if position < 0:
+                        break
+                    if direction == 0:
+                        block.insert(0, position)
+                    else:
+                        block.append(position)
+
+            text = self.docs[block[0]].page_content
+            for position in block[1:]:
+                text = merge_overlapping(text, self.docs[position].page_content)
+            covered.update(block)
+            expanded.append(Document(
+                page_content=text,
+                metadata=dict(doc.metadata, parent_ids=[self.docs[p].metadata.get('id') for p in block])
+            ))
+        return expanded
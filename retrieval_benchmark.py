@@ -0,0 +1,319 @@
+# retrieval_benchmark.py
+"""
+검색 품질 대비 지연시간 벤치마크
+
+라벨링된 질문→청크 세트를 faiss_retriever, bm25_retriever, ensemble_retriever 조합에
+대해 실행하고 recall, MRR, 질의별 지연시간, grade_documents가 평가해야 할 청크 수를 측정합니다.
+
+입력 파일 (JSONL):
+    {"question": "트래블로그 PRESTIGE 신용카드의 연회비가 얼마인가요?", "relevant_ids": ["doc-12", "doc-13"]}
+
+실행 예시:
+    python retrieval_benchmark.py data/eval/retrieval_labels.jsonl --faiss-k 2 3 4 --bm25-k 1 2 3
+"""
+import argparse
+import itertools
+import json
+import statistics
+import time
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Optional
+
+from utils.vector_db_retrievers import (
+    vectorstore, new_docs, hf_embeddings,
+    build_faiss_retriever, build_bm25_retriever, build_ensemble_retriever,
+    FAISS_SEARCH_TYPE, FAISS_K, FAISS_FETCH_K, BM25_K, ENSEMBLE_WEIGHTS, ENSEMBLE_C
+)
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    하나의 검색 설정에 대한 벤치마크 결과
+
+    Attributes:
+        name (str): 리트리버 종류 ('faiss', 'bm25', 'ensemble')
+        params (dict): 검색 파라미터
+        recall (float): 평균 recall (반환된 청크 기준)
+        mrr (float): 평균 Mean Reciprocal Rank
+        latency_p50_ms (float): 질의 지연시간 중앙값
+        latency_p95_ms (float): 질의 지연시간 95 퍼센타일
+        avg_chunks (float): grade_documents가 평가해야 할 평균 청크 수
+    """
+    name: str
+    params: Dict
+    recall: float = 0.0
+    mrr: float = 0.0
+    latency_p50_ms: float = 0.0
+    latency_p95_ms: float = 0.0
+    avg_chunks: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+
+
+def load_labels(path: str) -> List[Dict]:
+    """
+    라벨링된 질문 세트를 읽습니다.
+
+    Args:
+        path (str): JSONL 파일 경로
+
+    Returns:
+        List[Dict]: question, relevant_ids 키를 가진 항목 목록
+    """
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            labels.append({
+                "question": item["question"],
+                "relevant_ids": set(item["relevant_ids"])
+            })
+    return labels
+
+
+def percentile(values: List[float], q: float) -> float:
+    """정렬된 값의 q 분위수 (0~1)를 반환합니다."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def evaluate(retriever, labels: List[Dict], name: str, params: Dict) -> BenchmarkResult:
+    """
+    하나의 리트리버 설정을 라벨 세트로 평가합니다.
+
+    Args:
+        retriever: invoke(question)를 지원하는 리트리버
+        labels (List[Dict]): 라벨링된 질문 세트
+        name (str): 리트리버 종류
+        params (dict): 검색 파라미터
+
+    Returns:
+        BenchmarkResult: 평가 결과
+    """
+    result = BenchmarkResult(name=name, params=params)
+    recalls, reciprocal_ranks, chunk_counts = [], [], []
+
+    for item in labels:
+        start = time.perf_counter()
+        documents = retriever.invoke(item["question"])
+        result.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+        retrieved_ids = [doc.metadata.get("id") for doc in documents]
+        relevant = item["relevant_ids"]
+
+        hits = len(relevant.intersection(retrieved_ids))
+        recalls.append(hits / len(relevant) if relevant else 0.0)
+
+        rank = next((i + 1 for i, doc_id in enumerate(retrieved_ids) if doc_id in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        chunk_counts.append(len(documents))
+
+    result.recall = statistics.mean(recalls) if recalls else 0.0
+    result.mrr = statistics.mean(reciprocal_ranks) if reciprocal_ranks else 0.0
+    result.avg_chunks = statistics.mean(chunk_counts) if chunk_counts else 0.0
+    result.latency_p50_ms = percentile(result.latencies_ms, 0.5)
+    result.latency_p95_ms = percentile(result.latencies_ms, 0.95)
+    return result
+
+
+def run_sweep(labels: List[Dict], args) -> List[BenchmarkResult]:
+    """
+    FAISS / BM25 / 앙상블 파라미터 조합을 모두 평가합니다.
+
+    Args:
+        labels (List[Dict]): 라벨링된 질문 세트
+        args (argparse.Namespace): 스윕할 파라미터 목록
+
+    Returns:
+        List[BenchmarkResult]: 조합별 평가 결과
+    """
+    results = []
+
+    # BM25 인덱스는 한 번만 만들고 k만 바꿔가며 평가
+    bm25_retriever = build_bm25_retriever(new_docs)
+
+    # 첫 질의의 콜드 비용(임베딩 모델 로딩, 페이지 폴트)이 결과에 섞이지 않도록 예열
+    if labels:
+        vectorstore.similarity_search(labels[0]["question"], k=1)
+
+    faiss_grid = [
+        (search_type, k, fetch_k)
+        for search_type, k, fetch_k in itertools.product(args.search_type, args.faiss_k, args.fetch_k)
+        if search_type != "mmr" or fetch_k >= k
+    ]
+    # similarity 검색은 fetch_k를 사용하지 않으므로 중복 조합 제거
+    faiss_grid = list(dict.fromkeys(
+        (search_type, k, fetch_k if search_type == "mmr" else None)
+        for search_type, k, fetch_k in faiss_grid
+    ))
+
+    for search_type, k, fetch_k in faiss_grid:
+        params = {"search_type": search_type, "k": k, "fetch_k": fetch_k}
+        print(f"---FAISS {params}---")
+        retriever = build_faiss_retriever(vectorstore, search_type, k, fetch_k or FAISS_FETCH_K)
+        results.append(evaluate(retriever, labels, "faiss", params))
+
+    for k in args.bm25_k:
+        params = {"k": k}
+        print(f"---BM25 {params}---")
+        bm25_retriever.k = k
+        results.append(evaluate(bm25_retriever, labels, "bm25", params))
+
+    for (search_type, k, fetch_k), bm25_k, faiss_weight, c in itertools.product(
+            faiss_grid, args.bm25_k, args.faiss_weight, args.c):
+        params = {
+            "search_type": search_type, "k": k, "fetch_k": fetch_k,
+            "bm25_k": bm25_k, "weights": [faiss_weight, round(1 - faiss_weight, 4)], "c": c
+        }
+        print(f"---ENSEMBLE {params}---")
+        bm25_retriever.k = bm25_k
+        retriever = build_ensemble_retriever(
+            build_faiss_retriever(vectorstore, search_type, k, fetch_k or FAISS_FETCH_K),
+            bm25_retriever,
+            weights=params["weights"],
+            c=c
+        )
+        results.append(evaluate(retriever, labels, "ensemble", params))
+
+    return results
+
+
+def calibrate_reranker(labels: List[Dict], retriever) -> None:
+    """
+    앙상블 검색 후보에 대해 재순위화 점수를 계산하고 F1이 최대가 되는 기준 점수를 출력합니다.
+
+    Args:
+        labels (List[Dict]): 라벨링된 질문 세트
+        retriever: 후보 문서를 가져올 리트리버
+    """
+    from utils.document_rerankers import load_reranker, calibrate_threshold
+
+    reranker = load_reranker()
+    if reranker is None:
+        return
+
+    scores, relevance = [], []
+    for item in labels:
+        documents = retriever.invoke(item["question"])
+        scores.extend(reranker.score(item["question"], [d.page_content for d in documents]))
+        relevance.extend(d.metadata.get("id") in item["relevant_ids"] for d in documents)
+
+    threshold, f1 = calibrate_threshold(scores, relevance)
+    print(f"---RERANK_THRESHOLD={threshold:.4f} (F1={f1:.3f}, {len(scores)} candidates)---")
+
+
+def calibrate_reuse(labels: List[Dict], retriever) -> None:
+    """
+    세션 캐시 재사용 기준을 보정합니다. 앙상블 검색 후보를 캐시된 청크로 보고
+    질문 임베딩과의 코사인 유사도로 관련 청크를 가를 때 F1이 최대가 되는 REUSE_SIMILARITY를 출력합니다.
+
+    Args:
+        labels (List[Dict]): 라벨링된 질문 세트
+        retriever: 후보 문서를 가져올 리트리버
+    """
+    import numpy as np
+    from utils.document_rerankers import calibrate_threshold
+
+    similarities, relevance = [], []
+    for item in labels:
+        documents = retriever.invoke(item["question"])
+        if not documents:
+            continue
+        query = np.array(hf_embeddings.embed_query(item["question"]), dtype="float32")
+        chunks = np.array(hf_embeddings.embed_documents([d.page_content for d in documents]), dtype="float32")
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        chunks /= np.maximum(np.linalg.norm(chunks, axis=1, keepdims=True), 1e-12)
+        similarities.extend(float(s) for s in chunks @ query)
+        relevance.extend(d.metadata.get("id") in item["relevant_ids"] for d in documents)
+
+    threshold, f1 = calibrate_threshold(similarities, relevance)
+    print(f"---REUSE_SIMILARITY={threshold:.4f} (F1={f1:.3f}, {len(similarities)} candidates)---")
+
+
+def choose_cheapest(results: List[BenchmarkResult], min_recall: float) -> Optional[BenchmarkResult]:
+    """
+    recall 기준을 만족하는 설정 중 평가 청크 수와 지연시간이 가장 작은 설정을 고릅니다.
+
+    Args:
+        results (List[BenchmarkResult]): 평가 결과 목록
+        min_recall (float): 허용 가능한 최소 recall
+
+    Returns:
+        Optional[BenchmarkResult]: 가장 저렴한 설정. 기준을 만족하는 설정이 없으면 None
+    """
+    candidates = [r for r in results if r.recall >= min_recall]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda r: (r.avg_chunks, r.latency_p95_ms, -r.recall))
+
+
+def print_report(results: List[BenchmarkResult], best: Optional[BenchmarkResult], min_recall: float):
+    """결과 표와 추천 설정을 출력합니다."""
+    header = f"{'retriever':<9} {'recall':>7} {'mrr':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'chunks':>7}  params"
+    print(header)
+    print("-" * len(header))
+    for r in sorted(results, key=lambda r: (-r.recall, r.avg_chunks)):
+        print(f"{r.name:<9} {r.recall:>7.3f} {r.mrr:>6.3f} {r.latency_p50_ms:>9.1f} "
+              f"{r.latency_p95_ms:>9.1f} {r.avg_chunks:>7.2f}  {json.dumps(r.params)}")
+
+    print()
+    if best is None:
+        print(f"---NO CONFIGURATION REACHES RECALL {min_recall:.3f}---")
+    else:
+        print(f"---CHEAPEST CONFIGURATION WITH RECALL >= {min_recall:.3f}---")
+        print(f"{best.name} {json.dumps(best.params)} "
+              f"(recall={best.recall:.3f}, mrr={best.mrr:.3f}, chunks={best.avg_chunks:.2f}, "
+              f"p95={best.latency_p95_ms:.1f}ms)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Retrieval quality-vs-latency benchmark")
+    parser.add_argument("labels", help="JSONL file with question and relevant_ids")
+    parser.add_argument("--search-type", nargs="+", default=[FAISS_SEARCH_TYPE], choices=["mmr", "similarity"])
+    parser.add_argument("--faiss-k", nargs="+", type=int, default=[FAISS_K])
+    parser.add_argument("--fetch-k", nargs="+", type=int, default=[FAISS_FETCH_K])
+    parser.add_argument("--bm25-k", nargs="+", type=int, default=[BM25_K])
+    parser.add_argument("--faiss-weight", nargs="+", type=float, default=[ENSEMBLE_WEIGHTS[0]])
+    parser.add_argument("--c", nargs="+", type=int, default=[ENSEMBLE_C])
+    parser.add_argument("--min-recall", type=float, default=None,
+                        help="Minimum recall to keep (default: recall of the current production setting)")
+    parser.add_argument("--output", help="Write all results as JSON to this path")
+    parser.add_argument("--calibrate-reranker", action="store_true",
+                        help="Also calibrate RERANK_THRESHOLD on the production ensemble candidates")
+    parser.add_argument("--calibrate-reuse", action="store_true",
+                        help="Also calibrate REUSE_SIMILARITY for the session retrieval cache")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    labels = load_labels(args.labels)
+    results = run_sweep(labels, args)
+
+    min_recall = args.min_recall
+    if min_recall is None:
+        # 기준값: 현재 운영 중인 앙상블 설정의 recall
+        baseline = evaluate(
+            build_ensemble_retriever(build_faiss_retriever(vectorstore), build_bm25_retriever(new_docs)),
+            labels, "ensemble", {"baseline": True}
+        )
+        min_recall = baseline.recall
+
+    best = choose_cheapest(results, min_recall)
+    print_report(results, best, min_recall)
+
+    production = build_ensemble_retriever(build_faiss_retriever(vectorstore), build_bm25_retriever(new_docs))
+    if args.calibrate_reranker:
+        calibrate_reranker(labels, production)
+    if args.calibrate_reuse:
+        calibrate_reuse(labels, production)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, ensure_ascii=False, indent=4)
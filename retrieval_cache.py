@@ -0,0 +1,146 @@
+### retrieval_cache.py
+"""
+세션별 검색 결과 캐시
+
+직전 턴들에서 평가를 통과해 답변에 사용된 청크와 그 임베딩을 세션에 보관합니다.
+후속 질문(chat_and_docs)이 들어오면 질문 임베딩과 캐시된 청크의 유사도를 한 번의 행렬 곱으로 계산해,
+충분히 관련된 청크가 있으면 검색과 문서별 평가 없이 바로 답변 생성에 사용합니다.
+청크 임베딩은 다시 계산하지 않고 인덱스 스냅샷에서 청크 id로 찾습니다.
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+SESSION_RETRIEVAL_CACHE = os.getenv('SESSION_RETRIEVAL_CACHE', '1') == '1'
+# 캐시에 보관할 최근 턴 수
+RETRIEVAL_CACHE_TURNS = int(os.getenv('RETRIEVAL_CACHE_TURNS', '2'))
+# 질문과 캐시된 청크의 최소 코사인 유사도
+REUSE_SIMILARITY = float(os.getenv('REUSE_SIMILARITY', '0.6'))
+# 재사용에 필요한 최소 청크 수
+REUSE_MIN_DOCS = int(os.getenv('REUSE_MIN_DOCS', '1'))
+# 후속 질문이 직전 턴의 캐시 저장을 기다리는 최대 시간(밀리초)
+REMEMBER_WAIT_MS = float(os.getenv('REMEMBER_WAIT_MS', '200'))
+
+PRODUCT_KEY = '상품명'
+
+
+@dataclass
+class CachedChunk:
+    """
+    캐시된 청크
+
+    Attributes:
+        document (Document): 청크 문서
+        embedding (np.ndarray): 정규화된 청크 임베딩
+        turn (int): 마지막으로 답변에 사용된 턴 번호
+    """
+    document: Document
+    embedding: np.ndarray
+    turn: int
+
+
+class RetrievalCache:
+    """
+    한 세션의 최근 턴 청크 캐시
+
+    Attributes:
+        version (Optional[str]): 캐시된 청크의 코퍼스 버전 (바뀌면 캐시를 비움)
+        turn (int): 저장된 턴 수
+        chunks (Dict[str, CachedChunk]): 청크 id별 캐시 항목
+        pending: 진행 중인 저장 작업 (후속 질문이 wait_pending으로 기다림)
+    """
+    def __init__(self, max_turns: int = RETRIEVAL_CACHE_TURNS):
+        self.max_turns = max_turns
+        self.version = None
+        self.turn = 0
+        self.chunks: Dict[str, CachedChunk] = {}
+        self.pending = None
+
+    async def wait_pending(self, timeout: float = REMEMBER_WAIT_MS / 1000):
+        """
+        진행 중인 저장 작업을 최대 timeout초 동안 기다립니다.
+        시간이 지나도 저장 작업은 취소하지 않으며, 그 사이의 질문은 이전 캐시로 판단합니다.
+        """
+        pending = self.pending
+        if pending is None or pending.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(pending), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def remember(self, documents: List[Document], version: str,
+                       lookup: Callable[[List[str]], Awaitable[List[Optional[List[float]]]]],
+                       embed: Callable[[List[str]], Awaitable[List[List[float]]]]):
+        """
+        답변에 사용된 청크를 저장합니다. 이미 캐시된 청크는 건너뛰고, 새 청크의 임베딩은
+        인덱스에서 청크 id로 찾으며 인덱스에 없는 청크만 임베딩합니다.
+
+        Args:
+            documents (List[Document]): 답변에 사용된 청크
+            version (str): 코퍼스 버전
+            lookup (Callable): 청크 id 목록의 인덱스 임베딩을 찾는 코루틴 함수 (없는 id는 None)
+            embed (Callable): 텍스트 목록을 임베딩하는 코루틴 함수
+        """
+        if version != self.version:
+            self.version, self.chunks = version, {}
+
+        missing = [doc for doc in documents if doc.metadata.get('id') not in self.chunks]
+        embeddings = await lookup([doc.metadata.get('id') for doc in missing]) if missing else []
+        unknown = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if unknown:
+            for i, embedding in zip(unknown, await embed([missing[i].page_content for i in unknown])):
+                embeddings[i] = embedding
+
+        self.turn += 1
+        for doc in documents:
+            cached = self.chunks.get(doc.metadata.get('id'))
+            if cached is not None:
+                cached.turn = self.turn
+        for doc, embedding in zip(missing, embeddings):
+            vector = np.array(embedding, dtype='float32')
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+            self.chunks[doc.metadata.get('id')] = CachedChunk(doc, vector, self.turn)
+
+        # 최근 max_turns 턴에 사용되지 않은 청크 제거
+        self.chunks = {
+            doc_id: chunk for doc_id, chunk in self.chunks.items()
+            if chunk.turn > self.turn - self.max_turns
+        }
+
+    def match(self, embedding: List[float], version: str, product_name: Optional[str] = None,
+              threshold: float = REUSE_SIMILARITY, min_docs: int = REUSE_MIN_DOCS) -> Optional[List[Document]]:
+        """
+        질문 임베딩과 유사한 캐시 청크를 유사도 순으로 반환합니다.
+
+        Args:
+            embedding (List[float]): 질문 임베딩
+            version (str): 현재 코퍼스 버전
+            product_name (Optional[str]): 질문에서 추출된 상품명 (있으면 해당 상품의 청크만 사용)
+            threshold (float): 최소 코사인 유사도
+            min_docs (int): 재사용에 필요한 최소 청크 수
+
+        Returns:
+            Optional[List[Document]]: 재사용할 청크. 충분하지 않으면 None
+        """
+        if version != self.version or not self.chunks:
+            return None
+
+        candidates = [
+            chunk for chunk in self.chunks.values()
+            if product_name is None or chunk.document.metadata.get(PRODUCT_KEY) == product_name
+        ]
+        if len(candidates) < min_docs:
+            return None
+
+        query = np.array(embedding, dtype='float32')
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        similarities = np.stack([chunk.embedding for chunk in candidates]) @ query
+
+        order = np.argsort(-similarities)
+        selected = [candidates[i].document for i in order if similarities[i] >= threshold]
+        return selected if len(selected) >= min_docs else None
@@ -0,0 +1,85 @@
+# serve.py
+"""
+멀티 프로세스 서빙 모드 실행기
+
+추론 서버 1개(LLM, 임베딩 모델, 인덱스 보유)와 가벼운 Gradio 프론트엔드 워커 N개를 띄웁니다.
+프론트엔드 워커는 INFERENCE_SERVER_URL로 추론 서버에 요청하므로 8B 모델은 한 번만 로드됩니다.
+워커는 GRADIO_SERVER_PORT부터 연속된 포트를 사용하며, 세션 고정(sticky) 로드밸런서 뒤에 둡니다.
+
+실행 예시:
+    python serve.py --workers 4 --base-port 7860 --inference-port 8000
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def wait_for_server(url: str, timeout: float) -> bool:
+    """추론 서버의 /health가 응답할 때까지 기다립니다 (모델 로딩 시간 포함)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=5).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(2)
+    return False
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the inference server and multiple Gradio front ends")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    parser.add_argument("--base-port", type=int, default=7860)
+    parser.add_argument("--inference-host", default="127.0.0.1")
+    parser.add_argument("--inference-port", type=int, default=8000)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    inference_url = f"http://{args.inference_host}:{args.inference_port}"
+
+    server_env = dict(os.environ)
+    server_env.pop("INFERENCE_SERVER_URL", None)
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "inference_server:app",
+         "--host", args.inference_host, "--port", str(args.inference_port)],
+        env=server_env
+    )]
+
+    try:
+        if not wait_for_server(inference_url, args.startup_timeout):
+            raise SystemExit("Inference server did not become ready")
+        print(f"---INFERENCE SERVER READY AT {inference_url}---")
+
+        for i in range(args.workers):
+            worker_env = dict(
+                os.environ,
+                INFERENCE_SERVER_URL=inference_url,
+                GRADIO_SERVER_PORT=str(args.base_port + i),
+                GRADIO_SHARE="0",
+                GRADIO_DEBUG="0",
+                # FAQ 예열은 첫 워커만 실행하고, 나머지 워커는 갱신된 테이블 파일을 다시 읽음
+                FAQ_WARM_UP="1" if i == 0 else "0"
+            )
+            processes.append(subprocess.Popen([sys.executable, "app.py"], env=worker_env))
+            print(f"---FRONT END {i} ON PORT {args.base_port + i}---")
+
+        # 하나라도 종료되면 전체 종료
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+        for p in processes:
+            p.wait()
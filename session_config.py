@@ -2,6 +2,7 @@
 from dataclasses import dataclass, field
 from typing import List, Dict, Union, Optional
 from langgraph.checkpoint.memory import MemorySaver
+from utils.retrieval_cache import RetrievalCache, SESSION_RETRIEVAL_CACHE
 import uuid
 
 @dataclass
@@ -27,6 +28,10 @@ class SessionConfig:
         messages (List[ChatMessage]): 세션 메시지 목록
         stop_flag (bool): 세션 중단 플래그
         recursion_limit (int): 그래프 재귀 제한
+        last_path (List[str]): 마지막 메시지를 처리하며 실행된 노드 경로
+        last_intent (Optional[str]): 마지막 메시지에 대해 classify_intent가 판단한 intent (FAQ 응답은 None)
+        retrieval_cache (RetrievalCache): 최근 턴에서 답변에 사용된 청크 캐시
+        last_topics (List[str]): 직전에 검색한 질문의 주제 (상품만 바꾼 후속 질문의 템플릿 재작성용)
     """
     session_id: str
     memory_saver: MemorySaver
@@ -35,6 +40,10 @@ class SessionConfig:
     ])
     stop_flag: bool = False
     recursion_limit: int = 10
+    last_path: List[str] = field(default_factory=list)
+    last_intent: Optional[str] = None
+    retrieval_cache: RetrievalCache = field(default_factory=RetrievalCache)
+    last_topics: List[str] = field(default_factory=list)
 
     @classmethod
     def create_new(cls, session_id: str) -> 'SessionConfig':
@@ -62,8 +71,11 @@ class SessionConfig:
         Returns:
             dict: LangGraph 설정 딕셔너리
         """
+        configurable = {"thread_id": self.session_id, "last_topics": self.last_topics}
+        if SESSION_RETRIEVAL_CACHE:
+            configurable["retrieval_cache"] = self.retrieval_cache
         return {
-            "configurable": {"thread_id": self.session_id},
+            "configurable": configurable,
             "recursion_limit": self.recursion_limit
         }
 
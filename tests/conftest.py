@@ -0,0 +1,14 @@
+"""
+모듈들은 서로를 utils.X로 import하므로, 저장소 루트를 utils 패키지로 등록해
+저장소에서 바로 pytest를 실행할 수 있게 합니다.
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if getattr(sys.modules.get("utils"), "__path__", None) != [ROOT]:
+    package = types.ModuleType("utils")
+    package.__path__ = [ROOT]
+    sys.modules["utils"] = package
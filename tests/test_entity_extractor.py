@@ -0,0 +1,94 @@
+import random
+
+from utils.entity_extractor import AhoCorasick, EntityExtractor, normalize_with_offsets, template_rewrite
+
+CATALOG = [
+    ("신용", "트래블로그 신용카드"),
+    ("체크", "트래블로그 체크카드"),
+    ("신용", "트래블로그 PRESTIGE 신용카드"),
+    ("신용", "트래블로그 SKYPASS 신용카드"),
+]
+
+
+def naive_find(patterns, text):
+    return sorted(
+        (start, start + len(pattern), value)
+        for pattern, value in patterns
+        for start in range(len(text) - len(pattern) + 1)
+        if text.startswith(pattern, start)
+    )
+
+
+def test_aho_corasick_finds_overlapping_matches():
+    patterns = [("he", 1), ("she", 2), ("his", 3), ("hers", 4)]
+    assert sorted(AhoCorasick(patterns).find("ushers")) == naive_find(patterns, "ushers")
+
+
+def test_aho_corasick_matches_naive_search_on_random_text():
+    rng = random.Random(0)
+    patterns = [("".join(rng.choice("abc") for _ in range(rng.randint(1, 4))), i) for i in range(20)]
+    automaton = AhoCorasick(patterns)
+    for _ in range(50):
+        text = "".join(rng.choice("abc") for _ in range(30))
+        assert sorted(automaton.find(text)) == naive_find(patterns, text)
+
+
+def test_normalize_with_offsets_maps_back_to_original():
+    text, offsets = normalize_with_offsets("트래블로그 PRESTIGE 카드")
+    assert text == "트래블로그prestige카드"
+    assert [("트래블로그 PRESTIGE 카드")[i] for i in offsets] == list("트래블로그PRESTIGE카드")
+
+
+def test_alias_resolves_to_canonical_product_with_span():
+    extractor = EntityExtractor(CATALOG)
+    question = "프레스티지 연회비 알려줘"
+    entities = extractor.extract(question)
+    assert entities.product_name == "트래블로그 PRESTIGE 신용카드"
+    assert entities.card_type == "신용"
+    assert entities.card_type_span is None
+    start, end = entities.product_span
+    assert question[start:end] == "프레스티지"
+    assert entities.topics == ["연회비"]
+
+
+def test_longest_product_match_wins_and_span_covers_spaces():
+    extractor = EntityExtractor(CATALOG)
+    question = "트래블로그 PRESTIGE 신용카드 해외결제 수수료는?"
+    entities = extractor.extract(question)
+    assert entities.product_name == "트래블로그 PRESTIGE 신용카드"
+    start, end = entities.product_span
+    assert question[start:end] == "트래블로그 PRESTIGE 신용카드"
+    assert set(entities.topics) == {"해외결제", "수수료"}
+
+
+def test_nested_topics_keep_the_longest():
+    entities = EntityExtractor(CATALOG).extract("트래블로그 체크카드 ATM 인출한도")
+    assert entities.product_name == "트래블로그 체크카드"
+    assert "인출한도" in entities.topics and "한도" not in entities.topics
+
+
+def test_no_product_mentioned():
+    entities = EntityExtractor(CATALOG).extract("환율은 어떻게 적용되나요?")
+    assert entities.product_name is None
+    assert entities.product_span is None
+    assert entities.topics == ["환율"]
+
+
+def test_template_rewrite_replaces_alias_with_canonical_name():
+    question = "프레스티지 연회비 알려줘"
+    entities = EntityExtractor(CATALOG).extract(question)
+    assert template_rewrite(question, entities) == "트래블로그 PRESTIGE 신용카드 연회비 알려줘"
+
+
+def test_template_rewrite_inherits_previous_topics_for_product_only_follow_up():
+    question = "그럼 skypass는?"
+    entities = EntityExtractor(CATALOG).extract(question)
+    assert entities.product_name == "트래블로그 SKYPASS 신용카드" and entities.topics == []
+    assert template_rewrite(question, entities) is None
+    assert template_rewrite(question, entities, ["해외결제", "수수료"]) == "트래블로그 SKYPASS 신용카드 해외결제 수수료"
+
+
+def test_template_rewrite_needs_a_product():
+    question = "환율은 어떻게 적용되나요?"
+    entities = EntityExtractor(CATALOG).extract(question)
+    assert template_rewrite(question, entities, ["연회비"]) is None
@@ -0,0 +1,47 @@
+from utils.faq_warmup import PrecomputedAnswers
+
+VETTED = [{"question": "연회비가 얼마인가요?", "answer": "15,000원입니다."}]
+
+
+def test_corrupt_table_is_treated_as_empty(tmp_path):
+    (tmp_path / "precomputed_answers_v1.json").write_text("{not json", encoding="utf-8")
+    table = PrecomputedAnswers(str(tmp_path), vetted=[])
+    table.use_version("v1")
+    assert table.answers == {}
+
+
+def test_vetted_answers_are_seeded_on_every_version(tmp_path):
+    table = PrecomputedAnswers(str(tmp_path), vetted=VETTED)
+    table.use_version("v1")
+    assert table.get("연회비가 얼마인가요") == "15,000원입니다."
+    table.use_version("v2")
+    assert table.get("연회비가 얼마인가요?") == "15,000원입니다."
+
+
+def test_put_merges_answers_written_by_other_workers(tmp_path):
+    first = PrecomputedAnswers(str(tmp_path), vetted=[])
+    second = PrecomputedAnswers(str(tmp_path), vetted=[])
+    first.use_version("v1")
+    second.use_version("v1")
+
+    first.put("질문 하나", "답변 하나", source="workflow")
+    second.put("질문 둘", "답변 둘", source="workflow")
+
+    reader = PrecomputedAnswers(str(tmp_path), vetted=[])
+    reader.use_version("v1")
+    assert reader.get("질문 하나") == "답변 하나"
+    assert reader.get("질문 둘") == "답변 둘"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_reader_reloads_when_the_table_file_changes(tmp_path):
+    reader = PrecomputedAnswers(str(tmp_path), vetted=[])
+    reader.use_version("v1")
+    assert reader.get("질문") is None
+
+    writer = PrecomputedAnswers(str(tmp_path), vetted=[])
+    writer.use_version("v1")
+    writer.put("질문", "답변", source="workflow")
+
+    reader.use_version("v1")
+    assert reader.get("질문") == "답변"
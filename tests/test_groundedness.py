@@ -0,0 +1,62 @@
+from utils.groundedness import (
+    calibrate_thresholds, check_groundedness, extract_amounts, load_precheck_records
+)
+
+
+def test_scaled_and_comma_amounts_match():
+    assert extract_amounts("연회비 150,000원") == extract_amounts("연회비 15만 원") == {("KRW", 150000.0)}
+
+
+def test_currency_prefix_and_suffix_match():
+    assert extract_amounts("USD 1,000") == extract_amounts("1,000달러") == {("USD", 1000.0)}
+
+
+def test_compound_korean_amounts():
+    assert extract_amounts("1만5천원") == {("KRW", 15000.0)}
+    assert extract_amounts("1만 5천 원") == {("KRW", 15000.0)}
+    assert extract_amounts("2억 3000만원") == {("KRW", 230000000.0)}
+
+
+def test_numbers_without_unit_are_ignored():
+    assert extract_amounts("12개월 할부") == set()
+
+
+def test_compound_amount_is_supported_by_document():
+    documents = ["트래블로그 신용카드의 연회비는 15,000원입니다."]
+    result = check_groundedness("트래블로그 신용카드의 연회비는 1만5천원입니다.", documents)
+    assert result.unsupported_amounts == []
+    assert result.verdict != "ungrounded"
+
+
+def test_amount_missing_from_document_is_never_grounded():
+    documents = ["트래블로그 신용카드의 연회비는 15,000원입니다."]
+    result = check_groundedness("트래블로그 신용카드의 연회비는 3만원입니다.", documents)
+    assert result.unsupported_amounts == ["30000KRW"]
+    assert result.verdict != "grounded"
+
+
+def test_calibrate_thresholds_from_grader_verdicts():
+    records = [
+        {"coverage": 0.9, "unsupported_amounts": [], "grader": "yes"},
+        {"coverage": 0.8, "unsupported_amounts": [], "grader": "yes"},
+        {"coverage": 0.6, "unsupported_amounts": [], "grader": "no"},
+        {"coverage": 0.5, "unsupported_amounts": [], "grader": "yes"},
+        {"coverage": 0.2, "unsupported_amounts": [], "grader": "no"},
+        {"coverage": 0.1, "unsupported_amounts": [], "grader": "no"},
+        {"coverage": 0.95, "unsupported_amounts": ["30000KRW"], "grader": "no"},
+    ]
+    high, low, skipped = calibrate_thresholds(records, precision=1.0)
+    assert high == 0.8
+    assert low == 0.35
+    assert skipped == {"grounded": 2, "ungrounded": 2, "records": 7}
+
+
+def test_load_precheck_records_keeps_graded_events(tmp_path):
+    log = tmp_path / "chatbot.log"
+    log.write_text("\n".join([
+        '{"event": "groundedness_precheck", "precheck": {"coverage": 0.5, "grader": "yes"}}',
+        '{"event": "groundedness_precheck", "precheck": {"coverage": 0.9, "grader": null}}',
+        '{"event": "response", "elapsed_ms": 10}',
+        "not json",
+    ]), encoding="utf-8")
+    assert load_precheck_records([str(log)]) == [{"coverage": 0.5, "grader": "yes"}]
@@ -0,0 +1,180 @@
+import concurrent.futures
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("llama_cpp")
+pytest.importorskip("langchain_core")
+
+from utils import llama_batch_backend as backend
+from utils.llama_batch_backend import BatchedLlamaEngine, _Sequence, _held_back
+
+EOS = 0
+
+
+class FakeLlama:
+    """토큰 id를 미리 정한 텍스트 조각으로 바꾸는 토크나이저 대역"""
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def detokenize(self, tokens):
+        return "".join(self.pieces[t] for t in tokens).encode("utf-8")
+
+
+def make_batch(size):
+    return SimpleNamespace(
+        token=[0] * size, pos=[0] * size, n_seq_id=[0] * size,
+        seq_id=[[0] for _ in range(size)], logits=[False] * size, n_tokens=0
+    )
+
+
+@pytest.fixture
+def removed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(backend, "_kv_seq_rm", lambda ctx, seq_id, p0=-1: calls.append((seq_id, p0)))
+    return calls
+
+
+def make_engine(pieces=None, n_parallel=4, n_batch=8):
+    # 모델과 컨텍스트 없이 엔진 상태만 구성 (스레드를 띄우지 않음)
+    engine = BatchedLlamaEngine.__new__(BatchedLlamaEngine)
+    engine.n_parallel = n_parallel
+    engine.n_batch = n_batch
+    engine.ctx = object()
+    engine.llama = FakeLlama(pieces or {})
+    engine.stop_tokens = {EOS}
+    engine.batch = make_batch(n_batch)
+    engine.pending = queue.Queue()
+    engine.free_seq_ids = list(range(n_parallel))
+    engine.active = {}
+    engine._rollback = {}
+    engine._rollback_prompt_tokens = 0
+    engine._admissions = 0
+    engine.stats = {"decode_calls": 0, "prompt_tokens": 0, "generated_tokens": 0,
+                    "busy_seconds": 0.0, "max_active": 0}
+    return engine
+
+
+def make_sequence(prompt_tokens=(1, 2, 3), stop=(), on_token=None, max_tokens=16):
+    return _Sequence(
+        prompt_tokens=list(prompt_tokens), max_tokens=max_tokens, temperature=0.0,
+        stop=list(stop), future=concurrent.futures.Future(), on_token=on_token
+    )
+
+
+def test_held_back_is_the_longest_stop_prefix():
+    assert _held_back("Answer: Obs", ["Observation"]) == 3
+    assert _held_back("Answer.", ["Observation"]) == 0
+    assert _held_back("ab", ["abc", "bx"]) == 2
+
+
+def test_emit_holds_back_stop_prefix_until_ruled_out(removed):
+    pieces = {1: "연회비는", 2: " Obs", 3: "cure", 4: " Obs", 5: "ervation"}
+    engine = make_engine(pieces)
+    sent = []
+    seq = make_sequence(stop=["Observation"], on_token=sent.append)
+    engine.active[0] = seq
+    seq.seq_id = 0
+
+    assert engine._emit(seq, 1)
+    assert engine._emit(seq, 2)
+    assert "".join(sent) == "연회비는 "  # "Obs"는 stop 문자열의 앞부분일 수 있어 보류
+    assert engine._emit(seq, 3)
+    assert "".join(sent) == "연회비는 Obscure"
+    assert engine._emit(seq, 4)
+    assert not engine._emit(seq, 5)
+
+    engine._finish(seq)
+    assert seq.future.result() == "연회비는 Obscure "
+    assert "".join(sent) == seq.future.result()  # stop 문자열은 스트림으로도 나가지 않음
+
+
+def test_emit_stops_on_eos_and_max_tokens(removed):
+    engine = make_engine({1: "a"})
+    seq = make_sequence(max_tokens=2)
+    assert not engine._emit(seq, EOS)
+    assert engine._emit(seq, 1)
+    assert not engine._emit(seq, 1)
+
+
+def test_rollback_batch_restores_every_sequence(removed):
+    engine = make_engine(n_batch=4)
+    decoding = make_sequence(prompt_tokens=[1, 2])
+    decoding.seq_id, decoding.n_prompt_done, decoding.n_past, decoding.last_token = 0, 2, 5, 7
+    prefilling = make_sequence(prompt_tokens=[1, 2, 3, 4, 5, 6])
+    prefilling.seq_id = 1
+    engine.active = {0: decoding, 1: prefilling}
+
+    assert engine._fill_batch() == 4
+    assert (decoding.n_past, prefilling.n_prompt_done, prefilling.n_past) == (6, 3, 3)
+    assert engine.stats["prompt_tokens"] == 3
+
+    removed.clear()
+    engine._rollback_batch()
+    assert (decoding.n_past, decoding.n_prompt_done) == (5, 2)
+    assert (prefilling.n_past, prefilling.n_prompt_done) == (0, 0)
+    assert decoding.logit_index is None and prefilling.logit_index is None
+    assert engine.stats["prompt_tokens"] == 0
+    # 배치에서 KV 캐시에 기록되었을 수 있는 위치부터 삭제
+    assert sorted(removed) == [(0, 5), (1, 0)]
+
+
+def test_victim_is_the_most_recently_admitted_sequence(removed):
+    engine = make_engine()
+    first, second = make_sequence(), make_sequence()
+    engine.pending.put(first)
+    engine.pending.put(second)
+    engine._admit(block=False)
+
+    # 슬롯은 free_seq_ids 끝에서 꺼내므로 나중에 들어온 시퀀스의 seq_id가 더 작음
+    assert second.seq_id < first.seq_id
+    assert engine._victim() is second
+
+
+def test_fail_all_fails_active_and_pending_and_keeps_serving(removed):
+    engine = make_engine()
+    active, waiting = make_sequence(), make_sequence()
+    engine.pending.put(active)
+    engine._admit(block=False)
+    engine.pending.put(waiting)
+
+    engine._fail_all(ValueError("NULL logits"))
+
+    for seq in (active, waiting):
+        with pytest.raises(ValueError):
+            seq.future.result(timeout=0)
+    assert engine.active == {}
+    assert sorted(engine.free_seq_ids) == [0, 1, 2, 3]
+    assert engine.batch.n_tokens == 0
+
+    later = make_sequence()
+    engine.pending.put(later)
+    engine._admit(block=False)
+    assert later.seq_id in engine.active
+
+
+def test_sampling_error_fails_only_that_sequence(removed, monkeypatch):
+    engine = make_engine({1: "a"})
+    broken, healthy = make_sequence(), make_sequence()
+    for seq_id, seq in enumerate((broken, healthy)):
+        seq.seq_id, seq.logit_index = seq_id, seq_id
+        engine.active[seq_id] = seq
+
+    def read_logits(seq):
+        if seq is broken:
+            raise ValueError("NULL pointer access")
+        return [0.0]
+
+    monkeypatch.setattr(engine, "_admit", lambda block: None)
+    monkeypatch.setattr(engine, "_fill_batch", lambda: 2)
+    monkeypatch.setattr(engine, "_read_logits", read_logits)
+    monkeypatch.setattr(engine, "_sample", lambda seq, logits: 1)
+    monkeypatch.setattr(backend.llama_cpp, "llama_decode", lambda ctx, batch: 0)
+    engine._step()
+
+    with pytest.raises(ValueError):
+        broken.future.result(timeout=0)
+    assert list(engine.active.values()) == [healthy]
+    assert healthy.text == "a"
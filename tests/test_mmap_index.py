@@ -0,0 +1,81 @@
+import pytest
+
+import os
+
+np = pytest.importorskip("numpy")
+rank_bm25 = pytest.importorskip("rank_bm25")
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("langchain")
+
+from utils.mmap_index import SharedBM25Index, build_faiss_index, read_faiss_index, write_bm25_index
+
+CORPUS = [
+    "트래블로그 신용카드 연회비 안내",
+    "트래블로그 체크카드 해외 ATM 인출 한도",
+    "트래블로그 PRESTIGE 신용카드 연회비 라운지",
+    "트래블로그 체크카드 환전 수수료 무료",
+    "트래블로그 신용카드 해외결제 수수료",
+]
+
+
+@pytest.fixture
+def bm25(tmp_path):
+    token_lists = [text.split() for text in CORPUS]
+    write_bm25_index(token_lists, str(tmp_path))
+    return SharedBM25Index(str(tmp_path)), rank_bm25.BM25Okapi(token_lists)
+
+
+@pytest.mark.parametrize("query", [
+    "연회비",
+    "체크카드 수수료",
+    # 모든 문서에 있는 용어는 idf가 음수라 epsilon 하한이 적용됨
+    "트래블로그 신용카드 연회비",
+    "수수료 수수료",
+    "없는 용어",
+])
+def test_csc_scores_match_rank_bm25(bm25, query):
+    index, reference = bm25
+    tokens = query.split()
+    assert np.allclose(index.get_scores(tokens), reference.get_scores(tokens), rtol=1e-5, atol=1e-6)
+
+
+def test_unknown_tokens_score_zero(bm25):
+    index, _ = bm25
+    scores = index.get_scores(["없는"])
+    assert scores.shape == (len(CORPUS),)
+    assert not scores.any()
+
+
+def anonymous_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    pytest.skip("RssAnon is not reported on this platform")
+
+
+@pytest.mark.skipif(not hasattr(faiss, "IO_FLAG_MMAP_IFC"), reason="faiss without IO_FLAG_MMAP_IFC")
+def test_flat_index_vectors_are_mapped_not_copied(tmp_path):
+    embeddings = np.random.default_rng(0).random((20000, 512), dtype="float32")  # 40 MB
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(build_faiss_index(embeddings, "flat"), path)
+    del embeddings
+
+    before = anonymous_rss_mb()
+    index = read_faiss_index(path, "flat")
+    _, found = index.search(np.ones((1, 512), dtype="float32"), 3)
+
+    assert index.ntotal == 20000 and found.shape == (1, 3)
+    # 벡터가 힙에 복사되면 익명 메모리가 인덱스 크기(40 MB)만큼 늘어남
+    assert anonymous_rss_mb() - before < 10
+
+
+def test_ivf_index_reads_with_mmap(tmp_path):
+    embeddings = np.random.default_rng(0).random((2000, 32), dtype="float32")
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(build_faiss_index(embeddings, "ivf_sq8"), path)
+
+    index = read_faiss_index(path, "ivf_sq8")
+    _, found = index.search(embeddings[:5], 1)
+    assert found[:, 0].tolist() == list(range(5))
+    assert np.allclose(index.reconstruct(3), embeddings[3], atol=0.05)
@@ -0,0 +1,107 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+
+from langchain.schema import Document
+
+from utils.product_groups import (
+    ProductGroupIndex, build_product_groups, merge_overlapping, top_k_in_groups
+)
+
+
+def make_docs():
+    # 상품 A: 문서 a1 (3청크), 상품 B: 문서 b1 (2청크), 인덱스 순서는 섞여 있음
+    rows = [
+        ("A", "a1", 0, "제1조 연회비는 "),
+        ("B", "b1", 0, "제1조 한도는 "),
+        ("A", "a1", 1, "연회비는 만오천원이며 "),
+        ("A", "a1", 2, "이며 매년 청구됩니다."),
+        ("B", "b1", 1, "한도는 백만원입니다."),
+    ]
+    return [
+        Document(page_content=text,
+                 metadata={"id": f"doc-{i}", "상품명": product, "source_id": source, "chunk_position": order})
+        for i, (product, source, order, text) in enumerate(rows)
+    ]
+
+
+def make_index(docs):
+    # faiss index.reconstruct_n(0, ntotal)과 같은 (n, dim) float32 배열
+    embeddings = np.array([[1, 0], [0, 1], [1, 0.2], [1, -0.2], [0.1, 1]], dtype="float32")
+    return ProductGroupIndex.from_embeddings(docs, embeddings)
+
+
+def test_build_product_groups_links_chunks_within_each_source():
+    names, positions, links = build_product_groups([doc.metadata for doc in make_docs()])
+    assert names == ["A", "B"]
+    assert positions == [[0, 2, 3], [1, 4]]
+    assert links.tolist() == [[-1, 2], [-1, 4], [0, 3], [2, -1], [1, -1]]
+
+
+def test_legacy_chunks_fall_back_to_product_and_index_order():
+    metadatas = [{"상품명": "A"}, {"상품명": "B"}, {"상품명": "A"}]
+    _, positions, links = build_product_groups(metadatas)
+    assert positions == [[0, 2], [1]]
+    assert links.tolist() == [[-1, 2], [-1, -1], [0, -1]]
+
+
+def test_centroids_are_normalized_and_rank_groups():
+    index = make_index(make_docs())
+    assert np.allclose(np.linalg.norm(index.centroids, axis=1), 1.0)
+    assert index.top_groups([1.0, 0.0], n=1) == [0]
+    assert index.top_groups([0.0, 1.0], n=2) == [1, 0]
+    assert index.top_groups([1.0, 0.0], n=1, forced="B") == [1]
+    assert sorted(index.candidates([0]).tolist()) == [0, 2, 3]
+
+
+class RecordingDocs(list):
+    def __init__(self, docs):
+        super().__init__(docs)
+        self.accessed = []
+
+    def __getitem__(self, position):
+        self.accessed.append(position)
+        return super().__getitem__(position)
+
+
+def test_top_k_in_groups_filters_and_stops_early():
+    docs = RecordingDocs(make_docs())
+    scores = np.array([0.9, 0.8, 0.7, 0.6, 0.5])
+    result = top_k_in_groups(scores, docs, {"A"}, k=2)
+    assert [d.metadata["id"] for d in result] == ["doc-0", "doc-2"]
+    # k개를 채운 뒤의 문서는 읽지 않음
+    assert docs.accessed == [0, 1, 2]
+
+
+def test_top_k_in_groups_skips_documents_without_query_terms():
+    docs = RecordingDocs(make_docs())
+    scores = np.array([0.0, 0.0, 1.5, 0.0, 0.0])
+    result = top_k_in_groups(scores, docs, {"A", "B"}, k=3)
+    assert [d.metadata["id"] for d in result] == ["doc-2"]
+    assert docs.accessed == [2]
+
+
+def test_merge_overlapping_removes_chunk_overlap():
+    assert merge_overlapping("연회비는 만오천원이며 ", "이며 매년 청구") == "연회비는 만오천원이며 매년 청구"
+    assert merge_overlapping("가나", "다라") == "가나\n다라"
+
+
+def test_expand_merges_neighbours_and_overlapping_blocks_once():
+    docs = make_docs()
+    index = make_index(docs)
+    expanded = index.expand([docs[2], docs[3], docs[4]], window=1)
+
+    assert len(expanded) == 2
+    first, second = expanded
+    # doc-3은 doc-2 블록에 이미 포함되어 다시 반환되지 않음
+    assert first.metadata["parent_ids"] == ["doc-0", "doc-2", "doc-3"]
+    assert first.page_content == "제1조 연회비는 만오천원이며 매년 청구됩니다."
+    assert first.metadata["id"] == "doc-2"
+    assert second.metadata["parent_ids"] == ["doc-1", "doc-4"]
+    assert second.page_content == "제1조 한도는 백만원입니다."
+
+
+def test_expand_without_window_returns_documents_unchanged():
+    docs = make_docs()
+    assert make_index(docs).expand(docs[:2], window=0) == docs[:2]
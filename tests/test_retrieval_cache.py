@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+
+from langchain.schema import Document
+
+from utils.retrieval_cache import RetrievalCache
+
+# 청크 id별 인덱스 임베딩 (index.reconstruct와 같은 정규화 전 벡터)
+VECTORS = {"a1": [2.0, 0.0], "a2": [1.0, 1.0], "b1": [0.0, 3.0]}
+
+
+def make_doc(chunk_id, product):
+    return Document(page_content=f"{chunk_id} 본문", metadata={"id": chunk_id, "상품명": product})
+
+
+def remember(cache, documents, version="v1", vectors=VECTORS):
+    calls = {"lookup": [], "embed": []}
+
+    async def lookup(ids):
+        calls["lookup"].append(ids)
+        return [vectors.get(chunk_id) for chunk_id in ids]
+
+    async def embed(texts):
+        calls["embed"].append(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+    asyncio.run(cache.remember(documents, version, lookup, embed))
+    return calls
+
+
+def test_match_orders_by_cosine_similarity_and_applies_threshold():
+    cache = RetrievalCache()
+    remember(cache, [make_doc("a1", "A"), make_doc("a2", "A"), make_doc("b1", "B")])
+    matched = cache.match([1.0, 0.1], "v1", threshold=0.6)
+    assert [doc.metadata["id"] for doc in matched] == ["a1", "a2"]
+    assert cache.match([-1.0, 0.0], "v1") is None
+
+
+def test_match_keeps_only_the_questions_product():
+    cache = RetrievalCache()
+    remember(cache, [make_doc("a1", "A"), make_doc("b1", "B")])
+    matched = cache.match([1.0, 1.0], "v1", product_name="B", threshold=0.5)
+    assert [doc.metadata["id"] for doc in matched] == ["b1"]
+    assert cache.match([1.0, 1.0], "v1", product_name="C", threshold=0.5) is None
+
+
+def test_version_change_invalidates_the_cache():
+    cache = RetrievalCache()
+    remember(cache, [make_doc("a1", "A")])
+    assert cache.match([1.0, 0.0], "v2") is None
+    remember(cache, [make_doc("b1", "B")], version="v2")
+    assert list(cache.chunks) == ["b1"]
+
+
+def test_remember_looks_up_index_vectors_and_embeds_only_unknown_chunks():
+    cache = RetrievalCache()
+    calls = remember(cache, [make_doc("a1", "A"), make_doc("x1", "A")])
+    assert calls["lookup"] == [["a1", "x1"]]
+    assert calls["embed"] == [["x1 본문"]]
+    assert np.allclose(cache.chunks["a1"].embedding, [1.0, 0.0])
+
+    calls = remember(cache, [make_doc("a1", "A"), make_doc("a2", "A")])
+    assert calls["lookup"] == [["a2"]] and calls["embed"] == []
+
+
+def test_chunks_expire_after_max_turns():
+    cache = RetrievalCache(max_turns=2)
+    remember(cache, [make_doc("a1", "A")])
+    remember(cache, [make_doc("a2", "A")])
+    remember(cache, [make_doc("b1", "B")])
+    assert set(cache.chunks) == {"a2", "b1"}
+
+
+def test_wait_pending_waits_briefly_without_cancelling_the_save():
+    async def scenario():
+        cache = RetrievalCache()
+        cache.pending = asyncio.ensure_future(asyncio.sleep(0.01))
+        await cache.wait_pending(timeout=1)
+        assert cache.pending.done()
+
+        cache.pending = asyncio.ensure_future(asyncio.sleep(0.2))
+        await cache.wait_pending(timeout=0.01)
+        assert not cache.pending.cancelled()
+        await cache.pending
+
+    asyncio.run(scenario())
@@ -0,0 +1,382 @@
+# traffic_replay.py
+"""
+저장된 대화 기록 기반 트래픽 재현 부하 테스트
+
+history/{session}_chat_history_{date}.json 파일에서 멀티턴 세션을 복원하고,
+기록된 세션 시작 간격과 사용자 응답 대기 시간(think time)을 배속으로 줄여 재현합니다.
+세션 안의 다음 질문은 이전 답변을 받은 뒤에만 보냅니다.
+
+대상:
+    --target inprocess (기본값)    ChatbotApp.process_message를 같은 프로세스에서 직접 호출
+    --target http://host:7860      실행 중인 create_chatbot 서버에 Gradio API로 요청
+
+배속 목록(--speeds)별로 처리량과 지연시간 분포를 측정해 포화 지점을 찾고,
+in-process 모드에서는 실행된 노드 경로(intent path)별 지연시간도 보고합니다.
+timestamp가 없는 이전 기록은 --default-arrival, --default-think 간격으로 재현합니다.
+
+실행 예시:
+    python traffic_replay.py --speeds 1 2 4 8 16 --max-sessions 200
+"""
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class ReplaySession:
+    """
+    재현할 세션
+
+    Attributes:
+        session_id (str): 원본 세션 ID
+        start_offset (float): 전체 재현 시작 기준 세션 시작 시각(초)
+        questions (List[str]): 사용자 질문 목록
+        think_times (List[float]): 각 질문 전 대기 시간(초, 첫 질문은 0)
+    """
+    session_id: str
+    start_offset: float
+    questions: List[str] = field(default_factory=list)
+    think_times: List[float] = field(default_factory=list)
+
+
+@dataclass
+class TurnResult:
+    """한 턴의 재현 결과"""
+    session_id: str
+    turn: int
+    path: str
+    latency_ms: float
+    ok: bool
+
+
+@dataclass
+class SpeedReport:
+    """
+    하나의 배속에 대한 재현 결과
+
+    Attributes:
+        speed (float): 재현 배속
+        turns (int): 처리한 턴 수
+        errors (int): 실패한 턴 수
+        duration_s (float): 전체 재현 시간
+        throughput (float): 초당 처리 턴 수
+        p50_ms / p95_ms / p99_ms (float): 전체 지연시간 분위수
+        by_path (Dict[str, Dict[str, float]]): intent path별 건수와 지연시간 분위수
+    """
+    speed: float
+    turns: int
+    errors: int
+    duration_s: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    by_path: Dict[str, Dict[str, float]]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """정렬된 값의 q 분위수 (0~1)를 반환합니다."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def load_sessions(paths: List[str], default_arrival: float, default_think: float) -> List[ReplaySession]:
+    """
+    대화 기록 파일에서 세션을 복원합니다. 같은 세션의 여러 날짜 파일은 순서대로 이어 붙입니다.
+
+    Args:
+        paths (List[str]): 기록 파일 경로 목록
+        default_arrival (float): timestamp가 없는 세션의 시작 간격(초)
+        default_think (float): timestamp가 없는 턴의 대기 시간(초)
+
+    Returns:
+        List[ReplaySession]: 시작 시각 순으로 정렬된 세션 목록
+    """
+    messages_by_session: Dict[str, List[Dict]] = {}
+    for path in sorted(paths):
+        session_id = os.path.basename(path).split('_chat_history_')[0]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                messages_by_session.setdefault(session_id, []).extend(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"---SKIP {path}: {e}---")
+
+    sessions, untimed = [], []
+    for session_id, messages in messages_by_session.items():
+        session = ReplaySession(session_id=session_id, start_offset=0.0)
+        first_ts, last_answer_ts = None, None
+        for message in messages:
+            ts = parse_timestamp(message.get("timestamp"))
+            if message.get("role") == "user":
+                if not session.questions:
+                    first_ts = ts
+                    think = 0.0
+                elif ts is not None and last_answer_ts is not None:
+                    think = max(0.0, ts - last_answer_ts)
+                else:
+                    think = default_think
+                session.questions.append(message["content"])
+                session.think_times.append(think)
+            elif message.get("role") == "assistant":
+                last_answer_ts = ts
+
+        if not session.questions:
+            continue
+        if first_ts is None:
+            untimed.append(session)
+        else:
+            session.start_offset = first_ts
+            sessions.append(session)
+
+    # 기록된 시작 시각을 0 기준 오프셋으로 변환, timestamp 없는 세션은 뒤에 일정 간격으로 배치
+    origin = min((s.start_offset for s in sessions), default=0.0)
+    for session in sessions:
+        session.start_offset -= origin
+    sessions.sort(key=lambda s: s.start_offset)
+    tail = sessions[-1].start_offset if sessions else 0.0
+    for i, session in enumerate(untimed, start=1):
+        session.start_offset = tail + i * default_arrival
+    return sessions + untimed
+
+
+def classify_path(path: List[str], intent: Optional[str] = None) -> str:
+    """
+    실행된 노드 목록과 classify_intent의 판단을 보고서용 intent path 이름으로 요약합니다.
+    검색 경로는 intent별로 나눠(예: "chat_and_docs/rag", "docs_only/rag+rewrite"),
+    후속 질문 재작성과 평가 실패 후 재작성이 섞이지 않게 합니다.
+
+    Args:
+        path (List[str]): 실행된 노드 목록
+        intent (Optional[str]): classify_intent가 판단한 intent
+
+    Returns:
+        str: intent path 이름
+    """
+    if not path:
+        return "unknown"
+    if path == ["faq"]:
+        return "faq"
+    if "recursion_limit" in path:
+        return "fallback"
+    if "generate_from_history" in path:
+        return "history"
+    name = "rag+rewrite" if "transform_query" in path else "rag"
+    return f"{intent}/{name}" if intent else name
+
+
+class InProcessTarget:
+    """ChatbotApp.process_message를 직접 호출하는 대상 (기록 파일은 쓰지 않음)"""
+    def __init__(self):
+        from app import ChatbotApp
+
+        class ReplayChatbotApp(ChatbotApp):
+            async def save_chat_history(self, session_id, messages, is_append=False):
+                return None
+
+        self.app = ReplayChatbotApp()
+
+    async def ask(self, session_id: str, question: str, history: List) -> Tuple[str, str]:
+        response = await self.app.process_message(question, history, session_id)
+        session_config = self.app.session_manager.get_or_create_config(session_id)
+        return response, classify_path(session_config.last_path, session_config.last_intent)
+
+    def close_session(self, session_id: str):
+        self.app.session_manager.sessions.pop(session_id, None)
+
+
+class HttpTarget:
+    """실행 중인 Gradio 서버에 요청하는 대상 (세션마다 별도 클라이언트로 대화 상태 유지)"""
+    def __init__(self, url: str, max_workers: int = 256):
+        from gradio_client import Client
+
+        self.url = url
+        self.client_class = Client
+        self.clients = {}
+        # 기본 executor의 워커 수가 동시 세션 수를 제한해 포화 지점이 왜곡되지 않도록 별도 풀 사용
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay-http")
+
+    async def ask(self, session_id: str, question: str, history: List) -> Tuple[str, str]:
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(session_id)
+        if client is None:
+            client = await loop.run_in_executor(
+                self.executor, functools.partial(self.client_class, self.url, verbose=False)
+            )
+            self.clients[session_id] = client
+        response = await loop.run_in_executor(
+            self.executor, functools.partial(client.predict, question, api_name="/chat")
+        )
+        # 서버에서 실행된 노드 경로는 응답에 포함되지 않으므로 하나로 집계
+        return response, "http"
+
+    def close_session(self, session_id: str):
+        self.clients.pop(session_id, None)
+
+
+async def replay_session(target, session: ReplaySession, speed: float, started: float,
+                         results: List[TurnResult]):
+    """세션 시작 시각까지 기다린 뒤 질문을 순서대로 보내고 턴별 결과를 기록합니다."""
+    delay = started + session.start_offset / speed - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    session_id = f"replay-{session.session_id}-{uuid.uuid4().hex[:8]}"
+    history = []
+    for turn, (question, think) in enumerate(zip(session.questions, session.think_times)):
+        if think > 0:
+            await asyncio.sleep(think / speed)
+        turn_started = time.perf_counter()
+        try:
+            response, path = await target.ask(session_id, question, history)
+            ok = bool(response)
+        except Exception as e:
+            print(f"---TURN FAILED ({session_id} #{turn}): {e}---")
+            response, path, ok = None, "error", False
+        results.append(TurnResult(
+            session_id=session_id, turn=turn, path=path,
+            latency_ms=(time.perf_counter() - turn_started) * 1000, ok=ok
+        ))
+        history.append([question, response])
+    target.close_session(session_id)
+
+
+async def run_speed(target, sessions: List[ReplaySession], speed: float) -> SpeedReport:
+    """모든 세션을 주어진 배속으로 재현하고 결과를 집계합니다."""
+    print(f"---REPLAY {len(sessions)} SESSIONS AT {speed}x---")
+    results: List[TurnResult] = []
+    started = time.monotonic()
+    await asyncio.gather(*[replay_session(target, s, speed, started, results) for s in sessions])
+    duration = time.monotonic() - started
+
+    latencies = [r.latency_ms for r in results if r.ok]
+    by_path = {}
+    for path in sorted({r.path for r in results}):
+        path_latencies = [r.latency_ms for r in results if r.path == path and r.ok]
+        by_path[path] = {
+            "turns": sum(1 for r in results if r.path == path),
+            "p50_ms": percentile(path_latencies, 0.5),
+            "p95_ms": percentile(path_latencies, 0.95),
+            "mean_ms": statistics.mean(path_latencies) if path_latencies else 0.0,
+        }
+
+    return SpeedReport(
+        speed=speed,
+        turns=len(results),
+        errors=sum(1 for r in results if not r.ok),
+        duration_s=duration,
+        throughput=len(results) / duration if duration > 0 else 0.0,
+        p50_ms=percentile(latencies, 0.5),
+        p95_ms=percentile(latencies, 0.95),
+        p99_ms=percentile(latencies, 0.99),
+        by_path=by_path,
+    )
+
+
+def find_saturation(reports: List[SpeedReport], latency_factor: float, min_gain: float) -> Optional[SpeedReport]:
+    """
+    포화 지점을 찾습니다. 처리량 증가가 min_gain 미만이거나
+    p95 지연시간이 최저 배속의 latency_factor배를 넘는 첫 배속을 반환합니다.
+
+    Args:
+        reports (List[SpeedReport]): 배속 오름차순 결과
+        latency_factor (float): 기준 대비 허용 p95 배수
+        min_gain (float): 이전 배속 대비 최소 처리량 증가율
+
+    Returns:
+        Optional[SpeedReport]: 포화된 첫 배속 결과. 포화되지 않았으면 None
+    """
+    if not reports:
+        return None
+    baseline = reports[0]
+    for previous, report in zip(reports, reports[1:]):
+        throughput_gain = (report.throughput - previous.throughput) / max(previous.throughput, 1e-9)
+        if throughput_gain < min_gain or report.p95_ms > baseline.p95_ms * latency_factor:
+            return report
+    return None
+
+
+def print_report(reports: List[SpeedReport], saturated: Optional[SpeedReport]):
+    """배속별 처리량/지연시간 표와 intent path별 지연시간, 포화 지점을 출력합니다."""
+    header = f"{'speed':>6} {'turns':>6} {'errors':>6} {'turns/s':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        print(f"{r.speed:>6.1f} {r.turns:>6} {r.errors:>6} {r.throughput:>8.2f} "
+              f"{r.p50_ms:>9.1f} {r.p95_ms:>9.1f} {r.p99_ms:>9.1f}")
+
+    for r in reports:
+        print()
+        print(f"---INTENT PATHS AT {r.speed}x---")
+        for path, stats in r.by_path.items():
+            print(f"{path:<12} {stats['turns']:>6} turns  p50 {stats['p50_ms']:>9.1f}ms  "
+                  f"p95 {stats['p95_ms']:>9.1f}ms  mean {stats['mean_ms']:>9.1f}ms")
+
+    print()
+    if saturated is None:
+        print("---NO SATURATION WITHIN THE TESTED SPEEDS---")
+    else:
+        print(f"---SATURATION AT {saturated.speed}x "
+              f"({saturated.throughput:.2f} turns/s, p95={saturated.p95_ms:.1f}ms)---")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay saved chat histories as load")
+    parser.add_argument("paths", nargs="*", help="History files (default: history/*.json)")
+    parser.add_argument("--target", default="inprocess",
+                        help="'inprocess' or the URL of a running chatbot server")
+    parser.add_argument("--speeds", nargs="+", type=float, default=[1.0],
+                        help="Replay speed factors, run in ascending order")
+    parser.add_argument("--max-sessions", type=int, default=None)
+    parser.add_argument("--default-arrival", type=float, default=10.0,
+                        help="Seconds between sessions without timestamps")
+    parser.add_argument("--default-think", type=float, default=15.0,
+                        help="Seconds between turns without timestamps")
+    parser.add_argument("--latency-factor", type=float, default=2.0,
+                        help="p95 multiple of the slowest speed that counts as saturated")
+    parser.add_argument("--min-gain", type=float, default=0.1,
+                        help="Minimum throughput gain between speeds before counting as saturated")
+    parser.add_argument("--output", help="Write all reports as JSON to this path")
+    return parser.parse_args()
+
+
+async def main(args):
+    paths = args.paths or glob.glob(os.path.join('history', '*.json'))
+    sessions = load_sessions(paths, args.default_arrival, args.default_think)
+    if args.max_sessions:
+        sessions = sessions[:args.max_sessions]
+    print(f"---{len(sessions)} SESSIONS, {sum(len(s.questions) for s in sessions)} TURNS---")
+
+    target = InProcessTarget() if args.target == "inprocess" else HttpTarget(args.target)
+    reports = [await run_speed(target, sessions, speed) for speed in sorted(args.speeds)]
+    saturated = find_saturation(reports, args.latency_factor, args.min_gain)
+    print_report(reports, saturated)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in reports], f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
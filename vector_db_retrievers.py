@@ -1,45 +1,552 @@
 ### vector_db_retrievers.py
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
 from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
 from langchain.retrievers import BM25Retriever, EnsembleRetriever
 from langchain.vectorstores import FAISS
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+from utils.inference_client import INFERENCE_SERVER_URL, RemoteRetriever
+from utils.executor_pools import run_in_pool
+from utils.product_groups import ProductGroupIndex, HIERARCHICAL_TOP_GROUPS, top_k_in_groups
+from utils.entity_extractor import get_entity_extractor
+from utils.mmap_index import (
+    MmapDocstore, PositionalIds, SharedBM25Index, SharedBM25Retriever, read_faiss_index
+)
+import faiss
+import numpy as np
+import json
 import pickle
+import threading
+import time
 import os
 
+# 검색 파라미터 기본값 (retrieval_benchmark.py로 조합별 성능 측정 가능)
+FAISS_SEARCH_TYPE = "mmr"
+FAISS_K = 3
+FAISS_FETCH_K = 9
+BM25_K = 2
+ENSEMBLE_WEIGHTS = [0.6, 0.4]
+ENSEMBLE_C = 60
 
-pickle_path = os.path.join('data', 'docs', 'new_docs.pkl')
-with open(pickle_path, 'rb') as file:
-    new_docs = pickle.load(file)
+# 'flat': 전체 청크 대상 검색, 'hierarchical': 상품 그룹 선택 후 그룹 안에서 검색 (product_groups.py)
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'flat')
 
-model_path = os.path.join('models', 'embedding_model', 'bge-m3')
-#model_path = os.getenv('EMBEDDING_MODEL_PATH')
+# 버전별 인덱스 스냅샷 (corpus_ingestion.py로 생성)
+snapshot_root = os.path.join('data', 'index_snapshots')
+current_pointer_path = os.path.join(snapshot_root, 'CURRENT')
+SNAPSHOT_POLL_SECONDS = 30
+# 핫스왑 후 교체된 버전의 mmap을 닫기까지 기다리는 시간(초, 진행 중인 검색이 끝날 때까지)
+SNAPSHOT_RETIRE_SECONDS = float(os.getenv('SNAPSHOT_RETIRE_SECONDS', '60'))
 
-hf_embeddings = HuggingFaceEmbeddings(
-    model_name=model_path,
-    model_kwargs={'device': 'cuda'},
-    encode_kwargs={'normalize_embeddings': True}
-    
-)
+LEGACY_VERSION = 'legacy'
 
-faiss_index_path = os.path.join('data', 'faiss_index')
-vectorstore = FAISS.load_local(
-    faiss_index_path,
-    hf_embeddings,
-    allow_dangerous_deserialization=True
-)
 
+def build_faiss_retriever(vectorstore, search_type=FAISS_SEARCH_TYPE, k=FAISS_K, fetch_k=FAISS_FETCH_K):
+    """
+    Build a FAISS retriever with the given search parameters.
 
-faiss_retriever = vectorstore.as_retriever(
-    search_type="mmr",
-    search_kwargs={"k": 3, "fetch_k": 9}
-)
+    Args:
+        vectorstore (FAISS): Loaded FAISS vector store
+        search_type (str): "mmr" or "similarity"
+        k (int): Number of documents to return
+        fetch_k (int): Number of candidates fetched before MMR re-ranking
 
-bm25_retriever = BM25Retriever.from_documents(new_docs)
-bm25_retriever.k = 2
+    Returns:
+        VectorStoreRetriever: Configured FAISS retriever
+    """
+    search_kwargs = {"k": k}
+    if search_type == "mmr":
+        search_kwargs["fetch_k"] = fetch_k
 
+    return vectorstore.as_retriever(
+        search_type=search_type,
+        search_kwargs=search_kwargs
+    )
 
-ensemble_retriever = EnsembleRetriever(
-    retrievers=[faiss_retriever, bm25_retriever],
-    weights=[0.6, 0.4],
-    c=60,
-    id_key="id"
-)
+
+def build_bm25_retriever(docs, k=BM25_K, tokens=None):
+    """
+    Build a BM25 retriever over the given documents.
+
+    Args:
+        docs (list): List of chunked documents
+        k (int): Number of documents to return
+        tokens (list): Pre-tokenized corpus aligned with docs. Tokenized on the fly if None
+
+    Returns:
+        BM25Retriever: Configured BM25 retriever
+    """
+    if tokens is None:
+        retriever = BM25Retriever.from_documents(docs)
+    else:
+        from rank_bm25 import BM25Okapi
+        retriever = BM25Retriever(vectorizer=BM25Okapi(tokens), docs=docs)
+    retriever.k = k
+    return retriever
+
+
+def build_ensemble_retriever(faiss_retriever, bm25_retriever, weights=None, c=ENSEMBLE_C):
+    """
+    Combine FAISS and BM25 retrievers with weighted reciprocal rank fusion.
+
+    Args:
+        faiss_retriever: Dense retriever
+        bm25_retriever: Sparse retriever
+        weights (list): Ensemble weights [FAISS, BM25]
+        c (int): Rank constant for reciprocal rank fusion
+
+    Returns:
+        EnsembleRetriever: Configured ensemble retriever
+    """
+    return EnsembleRetriever(
+        retrievers=[faiss_retriever, bm25_retriever],
+        weights=weights or ENSEMBLE_WEIGHTS,
+        c=c,
+        id_key="id"
+    )
+
+
+@dataclass
+class RetrieverSet:
+    """
+    하나의 코퍼스 버전에 대한 문서와 리트리버 묶음
+    핫스왑 시 이 객체 전체를 한 번에 교체합니다.
+
+    Attributes:
+        version (str): 코퍼스 버전 (스냅샷 디렉토리 이름, 기존 인덱스는 'legacy')
+        docs (Sequence[Document]): 청크 문서 목록 (FAISS 인덱스 순서, mmap 스냅샷은 MmapDocstore)
+        vectorstore (FAISS): FAISS 벡터 저장소
+        faiss_retriever: FAISS 리트리버
+        bm25_retriever (BM25Retriever): BM25 리트리버
+        ensemble_retriever (EnsembleRetriever): 앙상블 리트리버
+        product_groups (Optional[ProductGroupIndex]): 계층 검색용 상품 그룹 (RETRIEVAL_MODE=hierarchical)
+    """
+    version: str
+    docs: Sequence[Document]
+    vectorstore: FAISS
+    faiss_retriever: object
+    bm25_retriever: BM25Retriever
+    ensemble_retriever: EnsembleRetriever
+    product_groups: Optional[ProductGroupIndex] = None
+    _positions: Optional[Dict[str, int]] = field(default=None, repr=False)
+
+    def chunk_vectors(self, ids: List[str]) -> List[Optional[List[float]]]:
+        """
+        청크 id로 FAISS 인덱스에 저장된 임베딩을 찾습니다 (다시 임베딩하지 않음).
+        id → 인덱스 위치 매핑은 처음 호출될 때 한 번 만듭니다.
+
+        Args:
+            ids (List[str]): 청크 id 목록
+
+        Returns:
+            List[Optional[List[float]]]: id 순서의 임베딩 (인덱스에 없는 id는 None)
+        """
+        if self._positions is None:
+            store = self.vectorstore
+            positions = {}
+            for position in range(store.index.ntotal):
+                docstore_id = store.index_to_docstore_id[position]
+                doc = store.docstore.search(docstore_id)
+                positions[doc.metadata.get('id', docstore_id)] = position
+            self._positions = positions
+
+        index = self.vectorstore.index
+        return [
+            index.reconstruct(self._positions[chunk_id]).tolist() if chunk_id in self._positions else None
+            for chunk_id in ids
+        ]
+
+    def close(self):
+        """mmap docstore의 파일 핸들을 닫습니다 (교체된 버전을 유예 시간 후 정리할 때 사용)."""
+        close = getattr(self.docs, 'close', None)
+        if close is not None:
+            close()
+
+
+def read_current_version() -> Optional[str]:
+    """
+    CURRENT 포인터 파일에서 활성 스냅샷 버전을 읽습니다.
+
+    Returns:
+        Optional[str]: 스냅샷 버전. 스냅샷이 없으면 None
+    """
+    try:
+        with open(current_pointer_path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_snapshot_docs(snapshot_dir: str):
+    """
+    스냅샷의 docstore.jsonl에서 문서와 BM25 토큰을 읽습니다.
+
+    Args:
+        snapshot_dir (str): 스냅샷 디렉토리
+
+    Returns:
+        Tuple[List[Document], List[List[str]]]: 인덱스 순서의 문서와 토큰 목록
+    """
+    docs, tokens = [], []
+    with open(os.path.join(snapshot_dir, 'docstore.jsonl'), 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            docs.append(Document(page_content=record['page_content'], metadata=record['metadata']))
+            tokens.append(record['tokens'])
+    return docs, tokens
+
+
+def load_snapshot(version: str) -> RetrieverSet:
+    """
+    버전별 스냅샷(pickle 미사용)에서 리트리버 묶음을 생성합니다.
+    mmap 형식 파일이 있으면 FAISS 인덱스, docstore, BM25 가중치를 모두 mmap으로 읽어
+    같은 노드의 워커들이 OS 페이지 캐시를 공유하도록 합니다.
+
+    Args:
+        version (str): 스냅샷 버전
+
+    Returns:
+        RetrieverSet: 로드된 리트리버 묶음
+    """
+    snapshot_dir = os.path.join(snapshot_root, version)
+    offsets_path = os.path.join(snapshot_dir, 'docstore.offsets.npy')
+
+    if os.path.exists(offsets_path):
+        docs = MmapDocstore(os.path.join(snapshot_dir, 'docstore.jsonl'), offsets_path)
+        with open(os.path.join(snapshot_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            index_type = json.load(f).get('index_type', 'flat')
+        index = read_faiss_index(os.path.join(snapshot_dir, 'index.faiss'), index_type)
+        store = FAISS(hf_embeddings, index, docs, PositionalIds(len(docs)))
+        sparse = SharedBM25Retriever(
+            index=SharedBM25Index(os.path.join(snapshot_dir, 'bm25')), docstore=docs, k=BM25_K
+        )
+    else:
+        docs, tokens = read_snapshot_docs(snapshot_dir)
+        index = faiss.read_index(os.path.join(snapshot_dir, 'index.faiss'))
+        store = FAISS(
+            hf_embeddings,
+            index,
+            InMemoryDocstore({doc.metadata['id']: doc for doc in docs}),
+            {i: doc.metadata['id'] for i, doc in enumerate(docs)}
+        )
+        sparse = build_bm25_retriever(docs, tokens=tokens)
+
+    dense = build_faiss_retriever(store)
+    groups = ProductGroupIndex.from_snapshot(snapshot_dir, docs) if RETRIEVAL_MODE == 'hierarchical' else None
+    return RetrieverSet(version, docs, store, dense, sparse, build_ensemble_retriever(dense, sparse), groups)
+
+
+def load_legacy() -> RetrieverSet:
+    """
+    기존 new_docs.pkl과 faiss_index에서 리트리버 묶음을 생성합니다.
+
+    Returns:
+        RetrieverSet: 로드된 리트리버 묶음
+    """
+    pickle_path = os.path.join('data', 'docs', 'new_docs.pkl')
+    with open(pickle_path, 'rb') as file:
+        docs = pickle.load(file)
+
+    faiss_index_path = os.path.join('data', 'faiss_index')
+    store = FAISS.load_local(
+        faiss_index_path,
+        hf_embeddings,
+        allow_dangerous_deserialization=True
+    )
+
+    dense = build_faiss_retriever(store)
+    sparse = build_bm25_retriever(docs)
+
+    groups = None
+    if RETRIEVAL_MODE == 'hierarchical':
+        # 기존 인덱스는 그룹 파일이 없으므로 FAISS 인덱스 순서의 문서와 임베딩으로 계산
+        index_docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+        groups = ProductGroupIndex.from_embeddings(index_docs, store.index.reconstruct_n(0, store.index.ntotal))
+    return RetrieverSet(
+        LEGACY_VERSION, docs, store, dense, sparse, build_ensemble_retriever(dense, sparse), groups
+    )
+
+
+def load_active() -> RetrieverSet:
+    """CURRENT가 가리키는 스냅샷을, 없으면 기존 인덱스를 로드합니다."""
+    version = read_current_version()
+    return load_snapshot(version) if version else load_legacy()
+
+
+def get_active() -> RetrieverSet:
+    """현재 서비스 중인 리트리버 묶음을 반환합니다."""
+    return _active
+
+
+def current_corpus_version() -> str:
+    """
+    현재 서비스 중인 코퍼스 버전을 반환합니다.
+    프론트엔드 모드에서는 추론 서버에 묻고 SNAPSHOT_POLL_SECONDS 동안 캐시합니다.
+
+    Returns:
+        str: 코퍼스 버전
+    """
+    if remote_retriever is None:
+        return _active.version
+
+    now = time.monotonic()
+    if _remote_version["checked_at"] is None or now - _remote_version["checked_at"] > SNAPSHOT_POLL_SECONDS:
+        _remote_version["version"] = remote_retriever.corpus_version()
+        _remote_version["checked_at"] = now
+    return _remote_version["version"]
+
+
+async def acurrent_corpus_version() -> str:
+    """current_corpus_version()의 비동기 버전 (프론트엔드 모드에서 이벤트 루프를 막지 않음)"""
+    if remote_retriever is None:
+        return _active.version
+
+    now = time.monotonic()
+    if _remote_version["checked_at"] is None or now - _remote_version["checked_at"] > SNAPSHOT_POLL_SECONDS:
+        _remote_version["version"] = await remote_retriever.acorpus_version()
+        _remote_version["checked_at"] = now
+    return _remote_version["version"]
+
+
+def product_catalog(retriever_set: Optional[RetrieverSet] = None) -> List[List[str]]:
+    """
+    현재 코퍼스의 (카드구분, 상품명) 조합 목록을 반환합니다.
+
+    Args:
+        retriever_set (RetrieverSet, optional): 사용할 스냅샷 (기본값: 현재 서비스 중인 스냅샷)
+
+    Returns:
+        List[List[str]]: [카드구분, 상품명] 목록
+    """
+    if remote_retriever is not None:
+        return remote_retriever.catalog()
+
+    pairs = {
+        (doc.metadata.get('카드구분', ''), doc.metadata.get('상품명', ''))
+        for doc in (retriever_set or get_active()).docs
+    }
+    return [list(pair) for pair in sorted(pairs)]
+
+
+async def aproduct_catalog() -> List[List[str]]:
+    """product_catalog()의 비동기 버전 (프론트엔드 모드의 /catalog 요청이 이벤트 루프를 막지 않음)"""
+    if remote_retriever is not None:
+        return await remote_retriever.acatalog()
+    return await run_in_pool('search', product_catalog)
+
+
+def get_ensemble_retriever() -> EnsembleRetriever:
+    """현재 서비스 중인 앙상블 리트리버를 반환합니다 (프론트엔드 모드에서는 추론 서버 프록시)."""
+    if remote_retriever is not None:
+        return remote_retriever
+    return _active.ensemble_retriever
+
+
+def retrieve_with_embedding(question: str, embedding: List[float], retriever_set: Optional[RetrieverSet] = None):
+    """
+    미리 계산한 질문 임베딩으로 앙상블 검색을 수행합니다.
+    여러 질문의 임베딩을 한 번에 계산한 뒤 검색만 따로 실행할 때 사용하며,
+    결과는 ensemble_retriever.invoke(question)과 같습니다.
+
+    Args:
+        question (str): 질문 (BM25 검색용)
+        embedding (List[float]): 질문 임베딩 (FAISS 검색용)
+        retriever_set (Optional[RetrieverSet]): 사용할 리트리버 묶음. None이면 현재 활성 묶음
+
+    Returns:
+        List[Document]: 가중 reciprocal rank fusion으로 합친 문서 목록
+    """
+    active = retriever_set or _active
+    if active.product_groups is not None:
+        return hierarchical_retrieve(question, embedding, active)
+
+    dense_retriever = active.faiss_retriever
+    search_kwargs = dense_retriever.search_kwargs
+
+    if dense_retriever.search_type == "mmr":
+        dense = active.vectorstore.max_marginal_relevance_search_by_vector(embedding, **search_kwargs)
+    else:
+        dense = active.vectorstore.similarity_search_by_vector(embedding, **search_kwargs)
+    sparse = active.bm25_retriever.invoke(question)
+
+    return active.ensemble_retriever.weighted_reciprocal_rank([dense, sparse])
+
+
+async def aembed_query(question: str) -> List[float]:
+    """임베딩 풀에서 질문 임베딩을 계산합니다 (프론트엔드 모드에서는 추론 서버에 요청)."""
+    if remote_retriever is not None:
+        return (await remote_retriever.aembed([question]))[0]
+    return await run_in_pool('embedding', hf_embeddings.embed_query, question)
+
+
+async def aembed_documents(texts: List[str]) -> List[List[float]]:
+    """임베딩 풀에서 문서 임베딩을 한 번의 배치로 계산합니다 (프론트엔드 모드에서는 추론 서버에 요청)."""
+    if remote_retriever is not None:
+        return await remote_retriever.aembed(texts)
+    return await run_in_pool('embedding', hf_embeddings.embed_documents, texts)
+
+
+async def achunk_vectors(ids: List[str]) -> List[Optional[List[float]]]:
+    """검색 풀에서 청크 id별 인덱스 임베딩을 찾습니다 (프론트엔드 모드에서는 추론 서버에 요청)."""
+    if remote_retriever is not None:
+        return await remote_retriever.avectors(ids)
+    return await run_in_pool('search', get_active().chunk_vectors, ids)
+
+
+async def aretrieve(question: str, embedding: Optional[List[float]] = None) -> List[Document]:
+    """
+    질문 임베딩은 임베딩 풀에서, FAISS/BM25 검색은 검색 풀에서 실행하는 앙상블 검색
+    (프론트엔드 모드에서는 추론 서버에 요청)
+
+    Args:
+        question (str): 질문
+        embedding (Optional[List[float]]): 이미 계산한 질문 임베딩 (없으면 계산, 프론트엔드 모드에서는 서버로 전달)
+
+    Returns:
+        List[Document]: ensemble_retriever.ainvoke(question)과 같은 문서 목록
+    """
+    if remote_retriever is not None:
+        return await remote_retriever.ainvoke(question, embedding=embedding)
+
+    active = get_active()
+    if embedding is None:
+        embedding = await aembed_query(question)
+    return await run_in_pool('search', retrieve_with_embedding, question, embedding, active)
+
+
+def hierarchical_retrieve(question: str, embedding: List[float], active: RetrieverSet) -> List[Document]:
+    """
+    상품 그룹 중심 임베딩으로 상위 그룹을 고른 뒤 그룹 안의 청크만 FAISS/BM25로 검색합니다.
+    질문에서 상품명이 추출되면 해당 그룹은 항상 포함합니다.
+
+    Args:
+        question (str): 질문
+        embedding (List[float]): 질문 임베딩
+        active (RetrieverSet): 사용할 리트리버 묶음
+
+    Returns:
+        List[Document]: 가중 reciprocal rank fusion으로 합친 문서 목록 (PARENT_EXPANSION_WINDOW > 0이면 조항 블록)
+    """
+    groups = active.product_groups
+    product = get_entity_extractor(active.version, product_catalog).extract(question).product_name
+    selected = groups.top_groups(embedding, HIERARCHICAL_TOP_GROUPS, forced=product)
+
+    search_kwargs = active.faiss_retriever.search_kwargs
+    dense = groups.dense_search(
+        embedding,
+        groups.candidates(selected),
+        active.faiss_retriever.search_type,
+        search_kwargs.get("k", FAISS_K),
+        search_kwargs.get("fetch_k", FAISS_FETCH_K)
+    )
+    sparse = sparse_search_in_groups(active, question, {groups.names[g] for g in selected})
+
+    fused = active.ensemble_retriever.weighted_reciprocal_rank([dense, sparse])
+    return groups.expand(fused)
+
+
+def sparse_search_in_groups(active: RetrieverSet, question: str, names: set) -> List[Document]:
+    """
+    BM25 점수 순으로 선택된 상품 그룹에 속한 문서만 k개 반환합니다.
+
+    Args:
+        active (RetrieverSet): 사용할 리트리버 묶음
+        question (str): 질문
+        names (set): 선택된 그룹의 상품명
+
+    Returns:
+        List[Document]: BM25 검색 결과
+    """
+    sparse = active.bm25_retriever
+    if isinstance(sparse, SharedBM25Retriever):
+        scores, docs = sparse.index.get_scores(question.split()), sparse.docstore
+    else:
+        scores, docs = np.asarray(sparse.vectorizer.get_scores(sparse.preprocess_func(question))), sparse.docs
+    return top_k_in_groups(scores, docs, names, sparse.k)
+
+
+def reload_if_updated() -> bool:
+    """
+    CURRENT 포인터가 바뀌었으면 새 스냅샷을 로드한 뒤 활성 묶음을 원자적으로 교체합니다.
+    로드가 끝날 때까지 기존 묶음으로 계속 서비스합니다.
+
+    Returns:
+        bool: 교체가 일어났는지 여부
+    """
+    global _active
+
+    version = read_current_version()
+    if _active is None or not version or version == _active.version:
+        return False
+
+    with _reload_lock:
+        if version == _active.version:
+            return False
+        new_set = load_snapshot(version)
+        old_set, _active = _active, new_set  # 단일 참조 대입이므로 진행 중인 요청은 기존 묶음을 끝까지 사용
+    print(f"---RETRIEVERS HOT-SWAPPED TO {version}---")
+
+    # 진행 중인 요청이 끝날 시간을 준 뒤 기존 버전의 mmap/파일 핸들 정리
+    retire = threading.Timer(SNAPSHOT_RETIRE_SECONDS, old_set.close)
+    retire.daemon = True
+    retire.start()
+    return True
+
+
+def start_snapshot_watcher(interval: float = SNAPSHOT_POLL_SECONDS) -> threading.Thread:
+    """
+    CURRENT 포인터를 주기적으로 확인하는 백그라운드 스레드를 시작합니다.
+    프로세스당 하나만 실행되며, 이미 실행 중이면 기존 스레드를 반환합니다.
+
+    Args:
+        interval (float): 확인 주기(초)
+
+    Returns:
+        threading.Thread: 감시 스레드
+    """
+    global _watcher_thread
+
+    def watch():
+        while not _watcher_stop.wait(interval):
+            try:
+                reload_if_updated()
+            except Exception as e:
+                print(f"---SNAPSHOT RELOAD FAILED: {e}---")
+
+    with _reload_lock:
+        if _watcher_thread is None or not _watcher_thread.is_alive():
+            _watcher_thread = threading.Thread(target=watch, name='snapshot-watcher', daemon=True)
+            _watcher_thread.start()
+        return _watcher_thread
+
+
+model_path = os.path.join('models', 'embedding_model', 'bge-m3')
+#model_path = os.getenv('EMBEDDING_MODEL_PATH')
+
+_reload_lock = threading.Lock()
+_watcher_stop = threading.Event()
+_watcher_thread = None
+_remote_version = {"version": None, "checked_at": None}
+
+if INFERENCE_SERVER_URL:
+    # 프론트엔드 워커: 임베딩 모델과 인덱스는 추론 서버에만 로드
+    remote_retriever = RemoteRetriever()
+    hf_embeddings = None
+    _active = None
+else:
+    remote_retriever = None
+    hf_embeddings = HuggingFaceEmbeddings(
+        model_name=model_path,
+        model_kwargs={'device': 'cuda'},
+        encode_kwargs={'normalize_embeddings': True}
+
+    )
+    _active = load_active()
+
+    # 시작 시점 버전 (핫스왑 이후에는 get_active()를 사용)
+    new_docs = _active.docs
+    vectorstore = _active.vectorstore
+    faiss_retriever = _active.faiss_retriever
+    bm25_retriever = _active.bm25_retriever
+    ensemble_retriever = _active.ensemble_retriever